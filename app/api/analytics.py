@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any
+from app.services.analytics_service import DIMENSIONS, heavy_hitters
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.get("/top", response_model=Dict[str, Any])
+async def top_talkers(
+    dimension: str = Query("host", description=f"Измерение: {', '.join(DIMENSIONS)}"),
+    minutes: float = Query(15, gt=0, description="Окно, минуты (не больше ANALYTICS_WINDOW_MINUTES)"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Самые частые значения измерения по числу сообщений за последние минуты.
+    Считается в памяти по скетчам: count - оценка сверху, lower_bound - гарантированный минимум.
+    """
+    if minutes > heavy_hitters.window_minutes:
+        raise HTTPException(status_code=400, detail=f"minutes must not exceed {heavy_hitters.window_minutes:g}")
+    try:
+        return heavy_hitters.top(dimension, minutes, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
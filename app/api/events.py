@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, Dict, Any
+from datetime import datetime
 from app.services.event_service import EventRepository
+from app.services.export_service import EVENT_EXPORT_COLUMNS, export_response, to_naive_utc
+from app.services.serialization import FastJSONResponse
+from app.config import settings
 
 event_repo = EventRepository()
 
@@ -17,20 +21,54 @@ async def list_events(
     page: int = Query(1, ge=1),
     per_page: int = Query(10, le=100),
     status: Optional[bool] = None,
-    service: Optional[str] = None
+    service: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа (вместо page)"),
+    with_total: bool = Query(True, description="Считать total (false - не считать, total будет null)"),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например fields=id,ip,name"),
 ):
-    total = await event_repo.get_count(status=status, service_filter=service)
-    events = await event_repo.get_list(
-        skip=(page - 1) * per_page,
-        limit=per_page,
-        status=status,
-        service_filter=service,  # Передаем параметр фильтрации
-    )
+    # Быстрый путь: документы без моделей, сериализация сразу в JSON
+    fast = settings.FAST_READ_PATH or bool(fields)
+    total = None
+    if with_total:
+        total = await event_repo.get_count(status=status, service_filter=service)
+    try:
+        events = await event_repo.get_list(
+            skip=(page - 1) * per_page,
+            limit=per_page,
+            status=status,
+            service_filter=service,  # Передаем параметр фильтрации
+            after=cursor,
+            projection=event_repo.projection(fields),
+            raw=fast,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
+    response = {
         "items": events,
         "total": total,
         "page": page,
         "per_page": per_page,
-        "total_pages": (total + per_page - 1) // per_page
-    }
\ No newline at end of file
+        "total_pages": (total + per_page - 1) // per_page if total is not None else None,
+        "next_cursor": event_repo.next_cursor(events, per_page)
+    }
+    return FastJSONResponse(response) if fast else response
+
+@router.get("/export")
+async def export_events(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    status: Optional[bool] = None,
+    service: Optional[str] = None,
+    start_time: Optional[datetime] = Query(None, description="Start of the updated_at range"),
+    end_time: Optional[datetime] = Query(None, description="End of the updated_at range")
+):
+    """Stream all events matching the filters, oldest updated first."""
+    query = await event_repo.build_query(service_filter=service, filters={"status": status})
+    documents = event_repo.iter_documents(
+        query,
+        "updated_at",
+        to_naive_utc(start_time),
+        to_naive_utc(end_time),
+        batch_size=settings.EXPORT_BATCH_SIZE
+    )
+    return export_response(documents, format, EVENT_EXPORT_COLUMNS, "events")
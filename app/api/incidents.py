@@ -1,7 +1,15 @@
 from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, Dict, Any, List
-from app.services.incident_service import upsert_incident, get_incidents, get_total_incidents_count
+from app.services.incident_service import (
+    upsert_incident,
+    get_incidents,
+    get_incidents_sort,
+    get_total_incidents_count
+)
+from app.services.pagination import next_cursor
+from app.services.serialization import FastJSONResponse, model_fields, parse_fields, rename_id
 from app.models.incident import Incident
+from app.config import settings
 
 
 router = APIRouter(prefix="/incidents", tags=["incidents"])
@@ -22,28 +30,50 @@ async def list_incidents(
     second_sort_order: Optional[str] = Query(None),
     host_search: Optional[str] = Query(None),
     name_search: Optional[str] = Query(None),
-    incident_search: Optional[str] = Query(None)
+    incident_search: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа (вместо page)"),
+    with_total: bool = Query(True, description="Считать total (false - не считать, total будет null)"),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например fields=id,host,message,count"),
 ):
-    incidents = get_incidents(
-        page=page,
-        per_page=per_page,
-        latest=latest,
-        first_sort_key=first_sort_key,
-        first_sort_order=first_sort_order,
-        second_sort_key=second_sort_key,
-        second_sort_order=second_sort_order,
-        host_filter=host_search,
-        name_filter=name_search,
-        incident_filter=incident_search
+    # Быстрый путь: документы без моделей, сериализация сразу в JSON
+    fast = settings.FAST_READ_PATH or bool(fields)
+    sort_spec = get_incidents_sort(
+        latest, first_sort_key, first_sort_order, second_sort_key, second_sort_order, incident_search
     )
+    try:
+        incidents = await get_incidents(
+            page=page,
+            per_page=per_page,
+            latest=latest,
+            first_sort_key=first_sort_key,
+            first_sort_order=first_sort_order,
+            second_sort_key=second_sort_key,
+            second_sort_order=second_sort_order,
+            host_filter=host_search,
+            name_filter=name_search,
+            incident_filter=incident_search,
+            after=cursor,
+            projection=parse_fields(fields, model_fields(Incident), sort_spec),
+            raw=fast
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    total = get_total_incidents_count(
-        host_filter=host_search,
-        name_filter=name_search,
-        incident_filter=incident_search
-    )
+    total = None
+    if with_total:
+        total = await get_total_incidents_count(
+            host_filter=host_search,
+            name_filter=name_search,
+            incident_filter=incident_search
+        )
     
-    return {
+    response = {
         "items": incidents,
-        "total": total
-    }
\ No newline at end of file
+        "total": total,
+        "next_cursor": next_cursor(incidents, per_page, sort_spec)
+    }
+    if fast:
+        # Модель инцидента отдает id вместо _id
+        rename_id(incidents)
+        return FastJSONResponse(response)
+    return response
\ No newline at end of file
@@ -1,8 +1,15 @@
 from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+from bson.errors import InvalidId
 from typing import Optional, List, Any
 from app.services.message_service import MessageRepository
+from app.services.archive_service import message_archive
+from app.services.export_service import MESSAGE_EXPORT_COLUMNS, export_response, to_naive_utc
+from app.services.serialization import FastJSONResponse
+from app.config import settings
 from datetime import datetime
-from app.models.messages import MessageCountResponse
+from app.models.messages import Message, MessageCountResponse
 
 message_repo = MessageRepository()
 
@@ -13,21 +20,36 @@ async def list_messages(
     page: int = Query(1, ge=1),
     per_page: int = Query(10, le=100),
     status: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа (вместо page)"),
+    with_total: bool = Query(True, description="Считать total (false - не считать, total будет null)"),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например fields=id,text,created_at"),
 ):
-    total = await message_repo.get_count(status=status)
-    events = await message_repo.get_list(
-        skip=(page - 1) * per_page,
-        limit=per_page,
-        status=status,
-    )
+    # Быстрый путь: документы без моделей, сериализация сразу в JSON
+    fast = settings.FAST_READ_PATH or bool(fields)
+    total = None
+    if with_total:
+        total = await message_repo.get_count(status=status)
+    try:
+        events = await message_repo.get_list(
+            skip=(page - 1) * per_page,
+            limit=per_page,
+            status=status,
+            after=cursor,
+            projection=message_repo.projection(fields),
+            raw=fast,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {
+    response = {
         "items": events,
         "total": total,
         "page": page,
         "per_page": per_page,
-        "total_pages": (total + per_page - 1) // per_page
+        "total_pages": (total + per_page - 1) // per_page if total is not None else None,
+        "next_cursor": message_repo.next_cursor(events, per_page)
     }
+    return FastJSONResponse(response) if fast else response
 
 @router.get("/count-by-time/", response_model=List[MessageCountResponse])
 async def get_messages_count_by_time(
@@ -58,4 +80,52 @@ async def get_messages_count_by_time(
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(e)
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/export")
+async def export_messages(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    start_time: Optional[datetime] = Query(None, description="Start of the created_at range"),
+    end_time: Optional[datetime] = Query(None, description="End of the created_at range"),
+    service: Optional[str] = Query(None, description="Service filter"),
+    event_id: Optional[str] = Query(None, description="Messages of one event")
+):
+    """Stream all messages matching the filters, oldest first (archived messages: /messages/archive/)."""
+    query = {}
+    if service:
+        query["services"] = service
+    if event_id:
+        try:
+            query["event_id"] = ObjectId(event_id)
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid event_id")
+
+    documents = message_repo.iter_documents(
+        query,
+        "created_at",
+        to_naive_utc(start_time),
+        to_naive_utc(end_time),
+        batch_size=settings.EXPORT_BATCH_SIZE
+    )
+    return export_response(documents, format, MESSAGE_EXPORT_COLUMNS, "messages")
+
+@router.get("/archive/")
+async def get_archived_messages(
+    start_time: Optional[datetime] = Query(None, description="Start of the range"),
+    end_time: Optional[datetime] = Query(None, description="End of the range"),
+    service: Optional[str] = Query(None, description="Service filter")
+):
+    """
+    Stream archived messages (NDJSON, one message per line) from the on-disk segments.
+    Only segment blocks overlapping the range are decompressed.
+    """
+    # В архиве даты хранятся как naive UTC, как их возвращает MongoDB
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+
+    match = (lambda doc: service in doc.get("services", [])) if service else None
+
+    async def stream():
+        async for doc in message_archive.read(start_time, end_time, match):
+            yield Message(**doc).model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,51 @@
+from fastapi import APIRouter
+from typing import Dict, Any
+from app.services.host_cache import host_cache
+from app.services.netbox_service import inventory
+from app.services.netbox_client import netbox_client
+from app.services.response_cache import response_cache
+from app.services.rollup_service import rollup_gaps
+from app.services.anomaly_service import anomaly_detector
+from app.services.event_service import active_events
+from app.websocket.manager import manager
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("/netbox", response_model=Dict[str, Any])
+async def netbox_metrics():
+    """Состояние инвентаря, задержки запросов и счетчики кэша данных Netbox."""
+    return {
+        "inventory": inventory.stats(),
+        "client": netbox_client.stats(),
+        "cache": host_cache.stats()
+    }
+
+
+@router.get("/response-cache", response_model=Dict[str, Any])
+async def response_cache_metrics():
+    """Размер и счетчики попаданий кэша ответов."""
+    return response_cache.stats()
+
+
+@router.get("/websocket", response_model=Dict[str, Any])
+async def websocket_metrics():
+    """Клиенты WebSocket, сообщения в очередях и вытесненные из-за медленных клиентов."""
+    return manager.stats()
+
+
+@router.get("/rollups", response_model=Dict[str, Any])
+async def rollup_metrics():
+    """Неудачные записи поминутных счетчиков и минуты, ожидающие пересчета из сообщений."""
+    return rollup_gaps.stats()
+
+
+@router.get("/anomalies", response_model=Dict[str, Any])
+async def anomaly_metrics():
+    """Число отслеживаемых событий и сервисов, ключи с отметками storm и flapping."""
+    return anomaly_detector.stats()
+
+
+@router.get("/active-events", response_model=Dict[str, Any])
+async def active_events_metrics():
+    """Таблица активных событий: размер, не записанные сообщения и число пакетных записей."""
+    return active_events.stats()
@@ -8,6 +8,17 @@ class Settings(BaseSettings):
     RABBITMQ_PORT: int = Field(5672, env="RABBITMQ_PORT")
     RABBITMQ_USER: str = Field("guest", env="RABBITMQ_USER")
     RABBITMQ_PASSWORD: str = Field("guest", env="RABBITMQ_PASSWORD")
+    # Сколько неподтвержденных сообщений брокер отдает потребителю
+    RABBITMQ_PREFETCH_COUNT: int = Field(200, env="RABBITMQ_PREFETCH_COUNT")
+    # Количество параллельных обработчиков (сообщения одного хоста всегда в одном обработчике)
+    CONSUMER_WORKERS: int = Field(16, env="CONSUMER_WORKERS")
+
+    # Режим приема: "single" - по одному сообщению, "batch" - пачками с bulk-записью в MongoDB
+    INGEST_MODE: str = Field("single", env="INGEST_MODE")
+    # Максимальный размер пачки (должен быть не больше RABBITMQ_PREFETCH_COUNT)
+    INGEST_BATCH_SIZE: int = Field(200, env="INGEST_BATCH_SIZE")
+    # Максимальное время накопления пачки, мс
+    INGEST_BATCH_TIMEOUT_MS: int = Field(50, env="INGEST_BATCH_TIMEOUT_MS")
     
     # MongoDB параметры
     MONGODB_URL: str = Field("mongodb://localhost:27017", env="MONGODB_URL")
@@ -15,10 +26,120 @@ class Settings(BaseSettings):
     MONGODB_USER: str = Field("admin", env="MONGODB_USER")
     MONGODB_PASSWORD: str = Field("password", env="MONGODB_PASSWORD")
     MONGODB_AUTH_SOURCE: str = "admin"
+    # Пул соединений и таймауты драйвера (мс)
+    MONGODB_MAX_POOL_SIZE: int = Field(100, env="MONGODB_MAX_POOL_SIZE")
+    MONGODB_MIN_POOL_SIZE: int = Field(0, env="MONGODB_MIN_POOL_SIZE")
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = Field(5000, env="MONGODB_SERVER_SELECTION_TIMEOUT_MS")
+    MONGODB_CONNECT_TIMEOUT_MS: int = Field(5000, env="MONGODB_CONNECT_TIMEOUT_MS")
+    MONGODB_SOCKET_TIMEOUT_MS: int = Field(30000, env="MONGODB_SOCKET_TIMEOUT_MS")
+
+    # Поминутные счетчики сообщений для графика count-by-time
+    MESSAGE_ROLLUPS_ENABLED: bool = Field(True, env="MESSAGE_ROLLUPS_ENABLED")
+    # Хранение сообщений: plain (одна коллекция), timeseries (time-series коллекция)
+    # или monthly (коллекции messages_YYYYMM по месяцу created_at)
+    MESSAGES_STORAGE: str = Field("plain", env="MESSAGES_STORAGE")
+    # Срок хранения сообщений в днях (0 - без ограничения)
+    MESSAGES_RETENTION_DAYS: int = Field(0, env="MESSAGES_RETENTION_DAYS")
+    # Архивирование в сжатые сегменты на диске (см. app/services/archive_service.py):
+    # возраст сообщений и закрытых событий в днях (0 - не архивировать),
+    # интервал запуска (секунды) и размер пачки
+    ARCHIVE_ENABLED: bool = Field(False, env="ARCHIVE_ENABLED")
+    ARCHIVE_DIR: str = Field("archive", env="ARCHIVE_DIR")
+    ARCHIVE_MESSAGES_AFTER_DAYS: int = Field(30, env="ARCHIVE_MESSAGES_AFTER_DAYS")
+    ARCHIVE_EVENTS_AFTER_DAYS: int = Field(30, env="ARCHIVE_EVENTS_AFTER_DAYS")
+    ARCHIVE_INTERVAL: int = Field(3600, env="ARCHIVE_INTERVAL")
+    ARCHIVE_BATCH_SIZE: int = Field(5000, env="ARCHIVE_BATCH_SIZE")
+
+    # Кэш total для списков: TTL (секунды) и число разных фильтров
+    COUNT_CACHE_TTL: int = Field(10, env="COUNT_CACHE_TTL")
+    COUNT_CACHE_SIZE: int = Field(1000, env="COUNT_CACHE_SIZE")
+
+    # Выгрузка /events/export и /messages/export: документов в пачке курсора и в блоке ответа
+    EXPORT_BATCH_SIZE: int = Field(2000, env="EXPORT_BATCH_SIZE")
+    # Списки отдаются из документов MongoDB без pydantic-моделей (см. app/services/serialization.py)
+    FAST_READ_PATH: bool = Field(True, env="FAST_READ_PATH")
+    # Кэш ответов частых GET-запросов с ETag: TTL (секунды) и число разных URL
+    RESPONSE_CACHE_ENABLED: bool = Field(True, env="RESPONSE_CACHE_ENABLED")
+    RESPONSE_CACHE_TTL: float = Field(5.0, env="RESPONSE_CACHE_TTL")
+    RESPONSE_CACHE_SIZE: int = Field(500, env="RESPONSE_CACHE_SIZE")
+
+    # WebSocket: размер очереди исходящих сообщений клиента, таймаут отправки (секунды)
+    # и политика при переполнении очереди: drop_oldest или disconnect
+    WS_QUEUE_SIZE: int = Field(100, env="WS_QUEUE_SIZE")
+    WS_SEND_TIMEOUT: float = Field(5.0, env="WS_SEND_TIMEOUT")
+    WS_SLOW_CLIENT_POLICY: str = Field("drop_oldest", env="WS_SLOW_CLIENT_POLICY")
+    # Подписки: период склейки обновлений в дельты (секунды) и сколько последних
+    # отправленных состояний событий/инцидентов помнить для вычисления дельт
+    WS_COALESCE_INTERVAL: float = Field(0.25, env="WS_COALESCE_INTERVAL")
+    WS_DELTA_SNAPSHOT_SIZE: int = Field(10000, env="WS_DELTA_SNAPSHOT_SIZE")
+
+    # Шаблоны событий (app/services/template_miner.py): глубина дерева, порог похожести
+    # сообщения на шаблон, число веток в узле, размер кэша текстов и период сохранения (секунды)
+    EVENT_TEMPLATES_DEPTH: int = Field(4, env="EVENT_TEMPLATES_DEPTH")
+    EVENT_TEMPLATES_SIMILARITY: float = Field(0.7, env="EVENT_TEMPLATES_SIMILARITY")
+    EVENT_TEMPLATES_MAX_CHILDREN: int = Field(100, env="EVENT_TEMPLATES_MAX_CHILDREN")
+    EVENT_TEMPLATES_CACHE_SIZE: int = Field(50000, env="EVENT_TEMPLATES_CACHE_SIZE")
+    EVENT_TEMPLATES_FLUSH_INTERVAL: float = Field(10.0, env="EVENT_TEMPLATES_FLUSH_INTERVAL")
+
+    # Правила разбора текста сообщений (статус, важность, теги) и период проверки изменения файла (секунды)
+    MESSAGE_RULES_FILE: str = Field("message_rules.yaml", env="MESSAGE_RULES_FILE")
+    MESSAGE_RULES_RELOAD_INTERVAL: float = Field(5.0, env="MESSAGE_RULES_RELOAD_INTERVAL")
+
+    # Самые частые хосты/сервисы/площадки/шаблоны в памяти (/analytics/top): длина окна
+    # (минуты), размер корзины (секунды), число кандидатов Space-Saving и размер Count-Min
+    ANALYTICS_ENABLED: bool = Field(True, env="ANALYTICS_ENABLED")
+    ANALYTICS_WINDOW_MINUTES: int = Field(60, env="ANALYTICS_WINDOW_MINUTES")
+    ANALYTICS_BUCKET_SECONDS: int = Field(60, env="ANALYTICS_BUCKET_SECONDS")
+    ANALYTICS_TOP_K: int = Field(200, env="ANALYTICS_TOP_K")
+    ANALYTICS_SKETCH_WIDTH: int = Field(1024, env="ANALYTICS_SKETCH_WIDTH")
+    ANALYTICS_SKETCH_DEPTH: int = Field(4, env="ANALYTICS_SKETCH_DEPTH")
+
+    # Всплески потока (storm) и мигание статуса (flapping) событий: окна сглаживания
+    # скорости (секунды), во сколько раз короткая скорость выше базовой и минимальная
+    # скорость (сообщений в минуту) для события и сервиса, число смен статуса за окно,
+    # время жизни простаивающего ключа, предел числа ключей и период перепроверки отметок
+    ANOMALY_ENABLED: bool = Field(True, env="ANOMALY_ENABLED")
+    ANOMALY_SHORT_WINDOW: float = Field(60.0, env="ANOMALY_SHORT_WINDOW")
+    ANOMALY_LONG_WINDOW: float = Field(3600.0, env="ANOMALY_LONG_WINDOW")
+    ANOMALY_STORM_FACTOR: float = Field(5.0, env="ANOMALY_STORM_FACTOR")
+    ANOMALY_STORM_MIN_RATE: float = Field(30.0, env="ANOMALY_STORM_MIN_RATE")
+    ANOMALY_SERVICE_STORM_MIN_RATE: float = Field(300.0, env="ANOMALY_SERVICE_STORM_MIN_RATE")
+    ANOMALY_FLAP_TRANSITIONS: int = Field(4, env="ANOMALY_FLAP_TRANSITIONS")
+    ANOMALY_FLAP_WINDOW: float = Field(600.0, env="ANOMALY_FLAP_WINDOW")
+    ANOMALY_IDLE_TTL: float = Field(3600.0, env="ANOMALY_IDLE_TTL")
+    ANOMALY_MAX_KEYS: int = Field(200000, env="ANOMALY_MAX_KEYS")
+    ANOMALY_CHECK_INTERVAL: float = Field(10.0, env="ANOMALY_CHECK_INTERVAL")
+
+    # Отложенная запись активных событий: сообщения события копятся в памяти и пишутся
+    # одной операцией раз в EVENT_FLUSH_INTERVAL_MS или после EVENT_FLUSH_MAX_MESSAGES сообщений.
+    # Размер таблицы и время (секунды), после которого событие без сообщений из нее удаляется
+    EVENT_WRITE_BEHIND_ENABLED: bool = Field(True, env="EVENT_WRITE_BEHIND_ENABLED")
+    EVENT_FLUSH_INTERVAL_MS: int = Field(250, env="EVENT_FLUSH_INTERVAL_MS")
+    EVENT_FLUSH_MAX_MESSAGES: int = Field(100, env="EVENT_FLUSH_MAX_MESSAGES")
+    EVENT_ACTIVE_TABLE_SIZE: int = Field(10000, env="EVENT_ACTIVE_TABLE_SIZE")
+    EVENT_ACTIVE_IDLE_TTL: float = Field(60.0, env="EVENT_ACTIVE_IDLE_TTL")
 
     # Netbox параметры
     NETBOX_URL: str = Field("http://localhost:8000", env="NETBOX_URL")
     NETBOX_TOKEN: str = Field("token", env="NETBOX_TOKEN")
+    # Таймауты запросов к Netbox: одиночный запрос и страница при полной загрузке (секунды)
+    NETBOX_TIMEOUT: float = Field(2.0, env="NETBOX_TIMEOUT")
+    NETBOX_BULK_TIMEOUT: float = Field(60.0, env="NETBOX_BULK_TIMEOUT")
+    # Максимум одновременных keep-alive соединений с Netbox
+    NETBOX_POOL_SIZE: int = Field(20, env="NETBOX_POOL_SIZE")
+    # Предохранитель: число ошибок подряд до размыкания и время размыкания (секунды)
+    NETBOX_BREAKER_THRESHOLD: int = Field(5, env="NETBOX_BREAKER_THRESHOLD")
+    NETBOX_BREAKER_RESET_TIMEOUT: float = Field(30.0, env="NETBOX_BREAKER_RESET_TIMEOUT")
+    # Кэш данных хостов: размер, TTL найденных и ненайденных IP (секунды)
+    NETBOX_CACHE_SIZE: int = Field(10000, env="NETBOX_CACHE_SIZE")
+    NETBOX_CACHE_TTL: int = Field(300, env="NETBOX_CACHE_TTL")
+    NETBOX_CACHE_NEGATIVE_TTL: int = Field(60, env="NETBOX_CACHE_NEGATIVE_TTL")
+    # Предзагрузка всего инвентаря Netbox в память вместо запросов по каждому IP
+    NETBOX_PRELOAD: bool = Field(True, env="NETBOX_PRELOAD")
+    NETBOX_PAGE_SIZE: int = Field(1000, env="NETBOX_PAGE_SIZE")
+    # Интервал инкрементального обновления и полной перезагрузки инвентаря (секунды)
+    NETBOX_REFRESH_INTERVAL: int = Field(60, env="NETBOX_REFRESH_INTERVAL")
+    NETBOX_FULL_RELOAD_INTERVAL: int = Field(3600, env="NETBOX_FULL_RELOAD_INTERVAL")
 
     
     class Config:
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает входящие элементы в пачки, ограниченные по размеру и по времени.
+
+    Пачка отправляется в flush, как только набрано max_size элементов
+    или прошло max_delay секунд с момента получения первого элемента.
+    Пачки обрабатываются строго последовательно, поэтому порядок сохраняется.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[None]],
+        max_size: int,
+        max_delay: float
+    ):
+        self.flush = flush
+        self.max_size = max(1, max_size)
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="ingest-batcher")
+
+    async def submit(self, item: Any):
+        await self._queue.put(item)
+
+    async def _collect(self) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_delay
+
+        while len(batch) < self.max_size:
+            # Сначала забираем все, что уже лежит в очереди
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self.flush(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке пачки из {len(batch)} элементов: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -2,20 +2,33 @@ import json
 import aio_pika
 from aio_pika.abc import AbstractIncomingMessage
 from app.config import settings
+from app.database.mongodb import connect_to_mongo, close_mongo_connection
 from app.services.journal_service import JournalService
 from app.models.messages import RawMessage
+from app.consumers.worker_pool import KeyedWorkerPool
+from app.consumers.batcher import MicroBatcher
+from functools import partial
+from pymongo.errors import ConnectionFailure
+from typing import Awaitable, Callable, List, Optional, Tuple
 
 import asyncio
 
 journal = JournalService()
 
-async def process_message(message: AbstractIncomingMessage):
+def decode_message(message: AbstractIncomingMessage) -> Optional[RawMessage]:
+    """Разбирает тело сообщения RabbitMQ. Возвращает None, если нет обязательных полей."""
+    data = json.loads(message.body.decode())
+    #check requirements fields
+    if data.get('host') and data.get('message'):
+        return RawMessage(ip=data['host'],text=data['message'])
+    return None
+
+async def process_message(message: AbstractIncomingMessage, raw_message: Optional[RawMessage] = None):
     async with message.process():
         try:
-            data = json.loads(message.body.decode())
-            #check requirements fields
-            if data.get('host') and data.get('message'):
-                raw_message = RawMessage(ip=data['host'],text=data['message'])
+            if raw_message is None:
+                raw_message = decode_message(message)
+            if raw_message:
                 await journal.handle(raw_message)
 
         except json.JSONDecodeError as e:
@@ -26,6 +39,74 @@ async def process_message(message: AbstractIncomingMessage):
             print(f"Неизвестная ошибка: {e}")
 
 
+def is_transient(error: Exception) -> bool:
+    """Временная ошибка (нет связи с MongoDB): сообщение стоит вернуть в очередь."""
+    return isinstance(error, (ConnectionFailure, asyncio.TimeoutError))
+
+
+async def process_batch(items: List[Tuple[AbstractIncomingMessage, RawMessage]]):
+    """
+    Обрабатывает пачку сообщений одной bulk-записью.
+    Подтверждение в RabbitMQ отправляется только после успешной записи пачки.
+    При временной ошибке (нет связи с базой) пачка возвращается в очередь,
+    при любой другой сообщения обрабатываются по одному, чтобы одно битое
+    сообщение не возвращалось в очередь бесконечно вместе с остальными.
+    """
+    try:
+        await journal.handle_batch([raw_message for _, raw_message in items])
+    except Exception as e:
+        print(f"Ошибка обработки пачки: {e}")
+        if is_transient(e):
+            for message, _ in items:
+                await message.nack(requeue=True)
+        else:
+            await process_one_by_one(items)
+        return
+
+    for message, _ in items:
+        await message.ack()
+
+
+async def process_one_by_one(items: List[Tuple[AbstractIncomingMessage, RawMessage]]):
+    """
+    Обработка пачки по одному сообщению. Сообщение с постоянной ошибкой
+    отклоняется без возврата в очередь; после временной ошибки оставшиеся
+    сообщения возвращаются в очередь.
+    """
+    for position, (message, raw_message) in enumerate(items):
+        try:
+            await journal.handle_batch([raw_message])
+        except Exception as e:
+            if is_transient(e):
+                print(f"Временная ошибка, сообщения возвращены в очередь: {e}")
+                for rest, _ in items[position:]:
+                    await rest.nack(requeue=True)
+                return
+            print(f"Сообщение отклонено: {e}")
+            await message.reject(requeue=False)
+        else:
+            await message.ack()
+
+
+async def dispatch_message(
+    submit: Callable[[AbstractIncomingMessage, RawMessage], Awaitable[None]],
+    message: AbstractIncomingMessage
+):
+    """Разбирает сообщение и передает его обработчикам (пулу или пачкам)."""
+    try:
+        raw_message = decode_message(message)
+    except Exception:
+        # Битое сообщение: логируем и подтверждаем сразу, не занимая обработчик
+        await process_message(message)
+        return
+
+    if raw_message is None:
+        async with message.process():
+            return
+
+    await submit(message, raw_message)
+
+
 async def start_incident_consumer():
     """Запускает асинхронного потребителя RabbitMQ для обработки"""
     # Подключение к RabbitMQ
@@ -35,28 +116,57 @@ async def start_incident_consumer():
         login=settings.RABBITMQ_USER,
         password=settings.RABBITMQ_PASSWORD
     )
-    
-    async with connection:
-        channel = await connection.channel()
-        queue = await channel.declare_queue(
-            'alerts',
-            durable=False
+
+    if settings.INGEST_MODE == "batch":
+        # Одна пачка за раз: порядок сообщений сохраняется
+        handler = MicroBatcher(
+            process_batch,
+            max_size=settings.INGEST_BATCH_SIZE,
+            max_delay=settings.INGEST_BATCH_TIMEOUT_MS / 1000
         )
-        print("Consumer подключен к", f"{settings.RABBITMQ_HOST}:{settings.RABBITMQ_PORT}")
-        await queue.consume(process_message)
-        
-        # Бесконечный цикл ожидания сообщений
-        await asyncio.Future()
+
+        async def submit(message: AbstractIncomingMessage, raw_message: RawMessage):
+            await handler.submit((message, raw_message))
+    else:
+        # Сообщения одного хоста всегда попадают в один обработчик
+        handler = KeyedWorkerPool(process_message, settings.CONSUMER_WORKERS)
+
+        async def submit(message: AbstractIncomingMessage, raw_message: RawMessage):
+            await handler.submit(raw_message.ip, message, raw_message)
+
+    await journal.start()
+    handler.start()
+
+    try:
+        async with connection:
+            channel = await connection.channel()
+            # Ограничиваем число сообщений "в полете": брокер не отдаст больше,
+            # пока обработчики не подтвердят уже полученные
+            await channel.set_qos(prefetch_count=settings.RABBITMQ_PREFETCH_COUNT)
+            queue = await channel.declare_queue(
+                'alerts',
+                durable=False
+            )
+            print("Consumer подключен к", f"{settings.RABBITMQ_HOST}:{settings.RABBITMQ_PORT}")
+            await queue.consume(partial(dispatch_message, submit))
+
+            # Бесконечный цикл ожидания сообщений
+            await asyncio.Future()
+    finally:
+        await handler.stop()
+        await journal.stop()
 
 async def run_consumer():
     """Запускает потребитель в asyncio event loop."""
     await start_incident_consumer()
 
-def start_consumer_thread():
-    """Запускает потребитель в отдельном потоке."""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(run_consumer())
+async def run_standalone_consumer():
+    """Запускает потребитель отдельно от API (со своим подключением к MongoDB)."""
+    await connect_to_mongo()
+    try:
+        await run_consumer()
+    finally:
+        await close_mongo_connection()
 
 if __name__ == "__main__":
-    asyncio.run(run_consumer())
\ No newline at end of file
+    asyncio.run(run_standalone_consumer())
\ No newline at end of file
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+    """
+    Ограниченный пул асинхронных обработчиков.
+
+    Задачи с одинаковым ключом (например, IP хоста) всегда попадают
+    в один и тот же обработчик, поэтому выполняются строго по порядку,
+    а задачи с разными ключами обрабатываются параллельно.
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], workers: int):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"consumer-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+
+    def _shard(self, key: Optional[str]) -> asyncio.Queue:
+        index = zlib.crc32((key or "").encode()) % self.workers
+        return self._queues[index]
+
+    async def submit(self, key: Optional[str], *args):
+        await self._shard(key).put(args)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            args = await queue.get()
+            try:
+                await self.handler(*args)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике: {e}")
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        """Дожидается обработки всех поставленных задач."""
+        for queue in self._queues:
+            await queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
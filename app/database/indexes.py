@@ -0,0 +1,197 @@
+"""
+Декларативное управление индексами MongoDB.
+
+Каждый репозиторий объявляет рядом с собой список индексов (IndexModel)
+и частые запросы (hot queries). При старте приложения индексы сверяются
+с базой: недостающие создаются, лишние и неиспользуемые попадают в отчет.
+
+Проверка планов запросов (завершается с ошибкой при COLLSCAN):
+    python -m app.database.indexes --check
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Callable, Dict, List, NamedTuple
+
+from pymongo import IndexModel
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import OperationFailure
+
+from app.config import settings
+from app.database.mongodb import (
+    STORAGE_MONTHLY,
+    connect_to_mongo,
+    close_mongo_connection,
+    get_events_collection,
+    get_incidents_collection,
+    get_messages_collection,
+    get_message_rollups_collection,
+    get_message_partition
+)
+from app.services.event_service import EventRepository
+from app.services.message_service import MessageRepository, message_partitions
+from app.services.rollup_service import MessageRollupRepository
+from app.services.incident_service import INCIDENT_INDEXES, INCIDENT_HOT_QUERIES
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    get_collection: Callable[[], AsyncCollection]
+    indexes: List[IndexModel]
+    hot_queries: List[dict]
+
+
+def get_index_registry() -> List[IndexSpec]:
+    return [
+        IndexSpec(get_events_collection, EventRepository.indexes, EventRepository.hot_queries),
+        IndexSpec(get_messages_collection, MessageRepository.indexes, MessageRepository.hot_queries),
+        IndexSpec(get_incidents_collection, INCIDENT_INDEXES, INCIDENT_HOT_QUERIES),
+        IndexSpec(get_message_rollups_collection, MessageRollupRepository.indexes, MessageRollupRepository.hot_queries),
+    ]
+
+
+async def get_partition_index_specs() -> List[IndexSpec]:
+    """Помесячные партиции сообщений сверяются так же, как коллекция messages."""
+    if settings.MESSAGES_STORAGE != STORAGE_MONTHLY:
+        return []
+    await message_partitions.refresh()
+    return [
+        IndexSpec(
+            lambda name=name: get_message_partition(name),
+            MessageRepository.indexes,
+            MessageRepository.hot_queries
+        )
+        for name in await message_partitions.names()
+    ]
+
+
+class IndexCheckError(Exception):
+    """Частый запрос выполняется полным сканированием коллекции."""
+
+
+async def _index_usage(collection: AsyncCollection) -> Dict[str, int]:
+    """Число обращений к каждому индексу с момента старта mongod ($indexStats)."""
+    try:
+        cursor = await collection.aggregate([{"$indexStats": {}}])
+        return {stat["name"]: stat["accesses"]["ops"] async for stat in cursor}
+    except OperationFailure:
+        # Нет прав на $indexStats - статистику использования не показываем
+        return {}
+
+
+async def reconcile_indexes(spec: IndexSpec) -> dict:
+    """Создает недостающие индексы коллекции и возвращает отчет о расхождениях."""
+    collection = spec.get_collection()
+    existing = await collection.index_information()
+    declared = {index.document["name"]: index for index in spec.indexes}
+
+    missing = [name for name in declared if name not in existing]
+    extra = [name for name in existing if name not in declared and name != "_id_"]
+
+    created = []
+    for name in missing:
+        try:
+            await collection.create_indexes([declared[name]])
+            created.append(name)
+        except OperationFailure as e:
+            # Например, уникальный индекс при дубликатах в данных
+            logger.error(f"Не удалось создать индекс {collection.name}.{name}: {e}")
+
+    usage = await _index_usage(collection)
+    unused = [
+        name for name, ops in usage.items()
+        if ops == 0 and name != "_id_" and name not in created
+    ]
+
+    return {
+        "collection": collection.name,
+        "created": created,
+        "missing": [name for name in missing if name not in created],
+        "extra": extra,
+        "unused": unused,
+    }
+
+
+async def reconcile_all_indexes() -> List[dict]:
+    reports = []
+    for spec in get_index_registry() + await get_partition_index_specs():
+        report = await reconcile_indexes(spec)
+        reports.append(report)
+
+        if report["created"]:
+            logger.info(f"{report['collection']}: созданы индексы {report['created']}")
+        if report["missing"]:
+            logger.warning(f"{report['collection']}: не созданы индексы {report['missing']}")
+        if report["extra"]:
+            logger.warning(f"{report['collection']}: индексы не объявлены в коде {report['extra']}")
+        if report["unused"]:
+            logger.info(f"{report['collection']}: неиспользуемые индексы {report['unused']}")
+    return reports
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Собирает все стадии дерева плана запроса."""
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(spec: IndexSpec) -> List[dict]:
+    collection = spec.get_collection()
+    results = []
+    for query in spec.hot_queries:
+        cursor = collection.find(query.get("filter", {}))
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explain = await cursor.limit(query.get("limit", 10)).explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        results.append({
+            "collection": collection.name,
+            "query": query["name"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
+
+
+async def check_hot_queries() -> List[dict]:
+    """Выполняет explain() для частых запросов и падает, если какой-то из них делает COLLSCAN."""
+    results = []
+    for spec in get_index_registry() + await get_partition_index_specs():
+        results.extend(await explain_hot_queries(spec))
+
+    for result in results:
+        logger.info(f"{result['collection']}.{result['query']}: {' <- '.join(result['stages'])}")
+
+    collscans = [f"{r['collection']}.{r['query']}" for r in results if r["collscan"]]
+    if collscans:
+        raise IndexCheckError(f"COLLSCAN in hot queries: {', '.join(collscans)}")
+    return results
+
+
+async def main(check: bool):
+    await connect_to_mongo()
+    try:
+        await reconcile_all_indexes()
+        if check:
+            await check_hot_queries()
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Сверка индексов MongoDB")
+    parser.add_argument("--check", action="store_true", help="проверить планы частых запросов")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.check))
+    except IndexCheckError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
@@ -1,22 +1,100 @@
-from pymongo import MongoClient
+import logging
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo.errors import CollectionInvalid
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from app.config import settings
 
-def get_mongo_client():
-    return MongoClient(
+logger = logging.getLogger(__name__)
+
+# Режимы хранения сообщений (settings.MESSAGES_STORAGE)
+STORAGE_PLAIN = "plain"
+STORAGE_TIMESERIES = "timeseries"
+STORAGE_MONTHLY = "monthly"
+
+client: Optional[AsyncMongoClient] = None
+
+def get_mongo_client() -> AsyncMongoClient:
+    return AsyncMongoClient(
         settings.MONGODB_URL,
         username=settings.MONGODB_USER,
         password=settings.MONGODB_PASSWORD,
-        authSource=settings.MONGODB_AUTH_SOURCE
+        authSource=settings.MONGODB_AUTH_SOURCE,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGODB_SOCKET_TIMEOUT_MS
     )
-   
-client = get_mongo_client()
-db = client[settings.MONGODB_DB]
 
-def get_incidents_collection():
-    return db["incidents"]
+async def connect_to_mongo():
+    """Открывает пул соединений с MongoDB (вызывается при старте приложения)."""
+    global client
+    if client is None:
+        client = get_mongo_client()
+        await client.aconnect()
+        await ensure_messages_storage()
+
+async def close_mongo_connection():
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+
+def get_database() -> AsyncDatabase:
+    if client is None:
+        raise RuntimeError("MongoDB client is not connected, call connect_to_mongo() first")
+    return client[settings.MONGODB_DB]
+
+def get_incidents_collection() -> AsyncCollection:
+    return get_database()["incidents"]
+
+def get_events_collection() -> AsyncCollection:
+    return get_database()["events"]
+
+def get_messages_collection() -> AsyncCollection:
+    return get_database()["messages"]
+
+def get_message_partition(name: str) -> AsyncCollection:
+    """Помесячная коллекция сообщений (режим monthly, см. app/database/partitions.py)."""
+    return get_database()[name]
+
+async def ensure_messages_storage():
+    """
+    В режиме timeseries создает коллекцию messages как time-series
+    (поле времени created_at). Существующую обычную коллекцию
+    преобразовать нельзя - она остается как есть.
+    """
+    if settings.MESSAGES_STORAGE != STORAGE_TIMESERIES:
+        return
+
+    database = get_database()
+    if "messages" in await database.list_collection_names(filter={"name": "messages"}):
+        options = await database["messages"].options()
+        if "timeseries" not in options:
+            logger.warning("Коллекция messages уже существует и не является time-series, режим timeseries не применен")
+        return
+
+    options = {}
+    if settings.MESSAGES_RETENTION_DAYS:
+        options["expireAfterSeconds"] = settings.MESSAGES_RETENTION_DAYS * 24 * 3600
+    try:
+        await database.create_collection(
+            "messages",
+            timeseries={"timeField": "created_at", "granularity": "seconds"},
+            **options
+        )
+        logger.info("Создана time-series коллекция messages")
+    except CollectionInvalid:
+        # Коллекцию успел создать другой процесс (например, отдельный потребитель)
+        pass
+
+def get_message_rollups_collection() -> AsyncCollection:
+    return get_database()["message_rollups"]
 
-def get_events_collection():
-    return db["events"]
+def get_migrations_collection() -> AsyncCollection:
+    return get_database()["migrations"]
 
-def get_messages_collection():
-    return db["messages"]
\ No newline at end of file
+def get_event_templates_collection() -> AsyncCollection:
+    return get_database()["event_templates"]
@@ -0,0 +1,179 @@
+"""
+Помесячные партиции сообщений (MESSAGES_STORAGE=monthly).
+
+Сообщение записывается в коллекцию messages_YYYYMM по месяцу created_at.
+Запросы по времени обращаются только к партициям, пересекающимся с окном,
+а старые сообщения удаляются целой партицией (drop коллекции).
+
+Сообщения, записанные до включения режима, остаются в коллекции messages
+и читаются как самая старая партиция.
+
+Список партиций и удаление старых:
+    python -m app.database.partitions --list
+    python -m app.database.partitions --drop-before 2024-01
+"""
+import argparse
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from pymongo import IndexModel
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import CollectionInvalid
+
+from app.config import settings
+from app.database.mongodb import (
+    connect_to_mongo,
+    close_mongo_connection,
+    get_database,
+    get_messages_collection,
+    get_message_partition
+)
+from app.database.versions import write_versions
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "messages_"
+PARTITION_PATTERN = re.compile(r"^messages_(\d{4})(\d{2})$")
+
+# Запись в любую партицию меняет версию messages (кэши ответов и подсчетов)
+write_versions.register_group(PARTITION_PREFIX, "messages")
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value: datetime) -> datetime:
+    start = month_start(value)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+def partition_name(value: datetime) -> str:
+    return f"{PARTITION_PREFIX}{value:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """Начало месяца партиции или None, если это не имя партиции."""
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+class MessagePartitions:
+    """Маршрутизация запросов сообщений по помесячным коллекциям."""
+
+    def __init__(self, indexes: List[IndexModel]):
+        # Индексы создаются в каждой новой партиции при первой записи
+        self.indexes = indexes
+        self._names: Optional[Set[str]] = None
+        self._legacy = False
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        """Перечитывает список партиций из базы."""
+        names = await get_database().list_collection_names()
+        self._names = {name for name in names if partition_month(name) is not None}
+        # Пустую коллекцию messages (например, созданную сверкой индексов) не читаем
+        self._legacy = (
+            "messages" in names
+            and await get_messages_collection().estimated_document_count() > 0
+        )
+
+    async def names(self) -> List[str]:
+        """Имена существующих партиций, новые сначала."""
+        if self._names is None:
+            await self.refresh()
+        return sorted(self._names, reverse=True)
+
+    async def for_write(self, created_at: datetime) -> AsyncCollection:
+        """Партиция для сообщения; новая создается вместе с индексами."""
+        name = partition_name(created_at)
+        if self._names is None:
+            await self.refresh()
+        if name not in self._names:
+            async with self._lock:
+                if name not in self._names:
+                    await self._create(name)
+                    self._names.add(name)
+        return get_message_partition(name)
+
+    async def _create(self, name: str):
+        try:
+            await get_database().create_collection(name)
+            logger.info(f"Создана партиция сообщений {name}")
+        except CollectionInvalid:
+            # Партицию уже создал другой процесс
+            pass
+        await get_message_partition(name).create_indexes(self.indexes)
+
+    async def for_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[AsyncCollection]:
+        """
+        Коллекции, которые могут содержать сообщения с created_at в [start, end],
+        новые сначала. Коллекция messages (данные до партиционирования) - последней.
+        """
+        collections = []
+        for name in await self.names():
+            month = partition_month(name)
+            if start is not None and next_month(month) <= start:
+                continue
+            if end is not None and month > end:
+                continue
+            collections.append(get_message_partition(name))
+        if self._legacy:
+            collections.append(get_messages_collection())
+        return collections
+
+    async def drop_before(self, cutoff: datetime) -> List[str]:
+        """Удаляет партиции, все сообщения которых старше cutoff."""
+        dropped = []
+        for name in await self.names():
+            if next_month(partition_month(name)) <= cutoff:
+                await get_database().drop_collection(name)
+                self._names.discard(name)
+                write_versions.bump(name)
+                dropped.append(name)
+                logger.info(f"Удалена партиция сообщений {name}")
+        return dropped
+
+
+async def main(list_partitions: bool, drop_before: Optional[datetime]):
+    from app.services.message_service import message_partitions
+
+    await connect_to_mongo()
+    try:
+        if list_partitions:
+            for name in await message_partitions.names():
+                count = await get_message_partition(name).estimated_document_count()
+                print(f"{name}\t{count}")
+        if drop_before is not None:
+            await message_partitions.drop_before(drop_before)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Помесячные партиции сообщений")
+    parser.add_argument("--list", action="store_true", help="показать партиции и число сообщений")
+    parser.add_argument(
+        "--drop-before",
+        help="удалить партиции до месяца YYYY-MM (по умолчанию - по MESSAGES_RETENTION_DAYS)",
+        nargs="?",
+        const=""
+    )
+    args = parser.parse_args()
+
+    cutoff = None
+    if args.drop_before:
+        cutoff = datetime.strptime(args.drop_before, "%Y-%m")
+    elif args.drop_before == "" and settings.MESSAGES_RETENTION_DAYS:
+        cutoff = datetime.now() - timedelta(days=settings.MESSAGES_RETENTION_DAYS)
+    asyncio.run(main(args.list, cutoff))
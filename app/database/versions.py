@@ -0,0 +1,35 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Tuple
+
+
+class WriteVersions:
+    """
+    Счетчики версий коллекций в памяти процесса.
+
+    Репозитории увеличивают версию при каждой записи; кэши, построенные
+    на данных коллекции, сравнивают сохраненную версию с текущей.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = defaultdict(int)
+        # Префикс имени коллекции -> общая версия группы (например, партиции сообщений)
+        self._groups: Dict[str, str] = {}
+
+    def register_group(self, prefix: str, group: str):
+        self._groups[prefix] = group
+
+    def bump(self, collection: str):
+        self._versions[collection] += 1
+        for prefix, group in self._groups.items():
+            if collection.startswith(prefix) and collection != group:
+                self._versions[group] += 1
+
+    def get(self, collection: str) -> int:
+        return self._versions[collection]
+
+    def snapshot(self, collections: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._versions[collection] for collection in collections)
+
+
+# Глобальные версии коллекций
+write_versions = WriteVersions()
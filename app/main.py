@@ -2,14 +2,20 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from threading import Thread
-from app.consumers.rabbit_consumer import start_consumer_thread
+from app.consumers.rabbit_consumer import run_consumer
 from app.api import incidents
 from app.api import events
 from app.api import messages
-from app.database.mongodb import get_incidents_collection
+from app.api import metrics
+from app.api import analytics
+from app.database.mongodb import connect_to_mongo, close_mongo_connection
+from app.database.indexes import reconcile_all_indexes
+from app.services.archive_service import archive_service
+from app.services.response_cache import ResponseCacheMiddleware
 from app.websocket.endpoints import websocket_endpoint
+from app.websocket.manager import manager
 
+import asyncio
 import logging
 from typing import AsyncGenerator
 
@@ -17,33 +23,45 @@ from typing import AsyncGenerator
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def ensure_indexes():
-    """Создает индексы в MongoDB при старте."""
-    collection = get_incidents_collection()
-    collection.create_index(
-        [("host", 1), ("message", 1)],
-        unique=True,
-        name="host_message_unique"
-    )
-    logger.info("MongoDB индексы созданы")
-
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Управление жизненным циклом приложения."""
     # Startup
-    ensure_indexes()
-    rabbit_thread = Thread(target=start_consumer_thread, daemon=True)
-    rabbit_thread.start()
+    await connect_to_mongo()
+    # Сверяем индексы, объявленные в репозиториях, с базой
+    await reconcile_all_indexes()
+    # Потребитель работает в том же event loop, что и API:
+    # все обращения к MongoDB и Netbox асинхронные и не блокируют его
+    consumer_task = asyncio.create_task(run_consumer(), name="rabbit-consumer")
+    # Перенос старых сообщений и закрытых событий в архив (ARCHIVE_ENABLED)
+    archive_service.start()
     
     logger.info("Сервисы запущены")
     yield
     logger.info("Приложение завершает работу")
+    await archive_service.stop()
+    await manager.stop()
+    consumer_task.cancel()
+    await asyncio.gather(consumer_task, return_exceptions=True)
+    await close_mongo_connection()
 
 app = FastAPI(
     title="Incident Tracker",
     lifespan=lifespan
 )
 
+# Кэш ответов для опрашиваемых табло: путь -> коллекции, от которых зависит ответ.
+# Добавляется до CORS, чтобы CORS-заголовки выставлялись и для ответов из кэша
+app.add_middleware(
+    ResponseCacheMiddleware,
+    routes={
+        "/events/": ["events"],
+        "/incidents/": ["incidents"],
+        "/messages/": ["messages"],
+        "/messages/count-by-time/": ["messages", "message_rollups"],
+    }
+)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -58,4 +76,6 @@ app.add_api_websocket_route("/ws", websocket_endpoint)
 # Подключение роутеров
 app.include_router(incidents.router)
 app.include_router(events.router)
-app.include_router(messages.router)
\ No newline at end of file
+app.include_router(messages.router)
+app.include_router(metrics.router)
+app.include_router(analytics.router)
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Копирует ip, services и статус события в старые сообщения.
+
+Новые сообщения получают эти поля при приеме. Миграция обрабатывает
+сообщения пачками по возрастанию _id и после каждой пачки сохраняет
+позицию в коллекции migrations, поэтому ее можно прервать и запустить
+снова на работающей базе:
+    python -m app.migrations.denormalize_messages --batch-size 1000 --pause 0.1
+"""
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateMany, ASCENDING
+
+from app.database.mongodb import (
+    connect_to_mongo,
+    close_mongo_connection,
+    get_events_collection,
+    get_messages_collection,
+    get_migrations_collection
+)
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "denormalize_messages"
+
+
+async def load_checkpoint() -> Optional[ObjectId]:
+    state = await get_migrations_collection().find_one({"_id": MIGRATION_ID})
+    return state.get("last_id") if state else None
+
+
+async def save_checkpoint(last_id: Optional[ObjectId], processed: int, completed: bool = False):
+    await get_migrations_collection().update_one(
+        {"_id": MIGRATION_ID},
+        {
+            "$set": {"last_id": last_id, "updated_at": datetime.now(), "completed": completed},
+            "$inc": {"processed": processed}
+        },
+        upsert=True
+    )
+
+
+async def migrate_batch(after_id: Optional[ObjectId], batch_size: int) -> Tuple[Optional[ObjectId], int]:
+    """Обрабатывает одну пачку. Возвращает _id последнего сообщения и размер пачки."""
+    messages = get_messages_collection()
+    query = {"services": {"$exists": False}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+
+    cursor = messages.find(query, {"event_id": 1}).sort("_id", ASCENDING).limit(batch_size)
+    docs = await cursor.to_list(length=batch_size)
+    if not docs:
+        return None, 0
+
+    message_ids_by_event = defaultdict(list)
+    for doc in docs:
+        if doc.get("event_id"):
+            message_ids_by_event[doc["event_id"]].append(doc["_id"])
+
+    events_cursor = get_events_collection().find(
+        {"_id": {"$in": list(message_ids_by_event)}},
+        {"ip": 1, "services": 1, "status": 1}
+    )
+    operations = [
+        UpdateMany(
+            {"_id": {"$in": message_ids_by_event[event["_id"]]}},
+            {"$set": {
+                "ip": event.get("ip"),
+                "services": event.get("services") or [],
+                "event_status": event.get("status")
+            }}
+        )
+        async for event in events_cursor
+    ]
+    if operations:
+        await messages.bulk_write(operations, ordered=False)
+
+    return docs[-1]["_id"], len(docs)
+
+
+async def run(batch_size: int, pause: float, restart: bool):
+    last_id = None if restart else await load_checkpoint()
+    total = 0
+    logger.info(f"Старт миграции {MIGRATION_ID} после _id={last_id}")
+
+    while True:
+        batch_last_id, processed = await migrate_batch(last_id, batch_size)
+        if not processed:
+            break
+
+        last_id = batch_last_id
+        total += processed
+        await save_checkpoint(last_id, processed)
+        logger.info(f"Обработано {total} сообщений, последнее _id={last_id}")
+
+        # Пауза между пачками снижает нагрузку на рабочую базу
+        if pause:
+            await asyncio.sleep(pause)
+
+    await save_checkpoint(last_id, 0, completed=True)
+    logger.info(f"Миграция {MIGRATION_ID} завершена: {total} сообщений")
+
+
+async def main(batch_size: int, pause: float, restart: bool):
+    await connect_to_mongo()
+    try:
+        await run(batch_size, pause, restart)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Денормализация сервисов событий в сообщения")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1, help="пауза между пачками, секунды")
+    parser.add_argument("--restart", action="store_true", help="начать сначала, игнорируя сохраненную позицию")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.pause, args.restart))
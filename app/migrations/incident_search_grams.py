@@ -0,0 +1,66 @@
+"""
+Заполняет триграммы (message_grams) у инцидентов, созданных до поискового индекса.
+
+Новые инциденты получают триграммы при создании. Миграция обрабатывает
+только документы без поля, поэтому ее можно прервать и запустить снова:
+    python -m app.migrations.incident_search_grams --batch-size 1000
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne, ASCENDING
+
+from app.database.mongodb import connect_to_mongo, close_mongo_connection, get_incidents_collection
+from app.database.versions import write_versions
+from app.services.search_service import trigrams
+
+logger = logging.getLogger(__name__)
+
+
+async def run(batch_size: int, pause: float):
+    collection = get_incidents_collection()
+    query = {"message_grams": {"$exists": False}}
+    total = 0
+    last_id = None
+
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        cursor = collection.find(batch_query, {"message": 1}).sort("_id", ASCENDING).limit(batch_size)
+        docs = await cursor.to_list(length=batch_size)
+        if not docs:
+            break
+
+        await collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"message_grams": trigrams(doc.get("message") or "")}})
+            for doc in docs
+        ], ordered=False)
+        write_versions.bump(collection.name)
+
+        last_id = docs[-1]["_id"]
+        total += len(docs)
+        logger.info(f"Обработано {total} инцидентов")
+
+        if pause:
+            await asyncio.sleep(pause)
+
+    logger.info(f"Миграция триграмм инцидентов завершена: {total} документов")
+
+
+async def main(batch_size: int, pause: float):
+    await connect_to_mongo()
+    try:
+        await run(batch_size, pause)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Триграммы для поиска по инцидентам")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1, help="пауза между пачками, секунды")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.pause))
@@ -0,0 +1,159 @@
+"""
+Переводит события, созданные до шаблонов (имя - сырой текст сообщения
+text[:300]), на имена шаблонов.
+
+После перехода на шаблоны новые и закрывающие (SOLVED) сообщения приходят
+в событие с именем шаблона, и старое открытое событие с сырым именем
+никогда бы не закрылось. Для каждого события без template_id имя
+пропускается через дерево шаблонов:
+- имя не изменилось (в тексте нет изменчивых частей) - проставляется template_id;
+- события с именем шаблона еще нет - событие переименовывается;
+- есть - события сливаются: счетчики складываются, статус и данные берутся
+  у более свежего, сообщения перевешиваются на оставшееся событие.
+
+Запускать после обновления до старта сервиса: шаблоны, созданные миграцией,
+сохраняются в event_templates и загружаются сервисом при старте. Позиция
+сохраняется в коллекции migrations, миграцию можно прервать и запустить снова:
+    python -m app.migrations.template_event_names --batch-size 1000 --pause 0.1
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from app.database.mongodb import (
+    connect_to_mongo,
+    close_mongo_connection,
+    get_events_collection,
+    get_migrations_collection
+)
+from app.services.message_service import MessageRepository
+from app.services.template_miner import template_miner
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "template_event_names"
+
+# Поля, которые берутся у более свежего из сливаемых событий
+LATEST_FIELDS = ("status", "updated_at", "severity", "hostname", "location", "services", "model", "role")
+
+
+async def load_checkpoint() -> Optional[ObjectId]:
+    state = await get_migrations_collection().find_one({"_id": MIGRATION_ID})
+    return state.get("last_id") if state else None
+
+
+async def save_checkpoint(last_id: Optional[ObjectId], processed: int, completed: bool = False):
+    await get_migrations_collection().update_one(
+        {"_id": MIGRATION_ID},
+        {
+            "$set": {"last_id": last_id, "updated_at": datetime.now(), "completed": completed},
+            "$inc": {"processed": processed}
+        },
+        upsert=True
+    )
+
+
+async def merge_into(legacy: dict, target: dict):
+    """Сливает событие со старым именем в событие с именем шаблона."""
+    events = get_events_collection()
+    update = {
+        "$inc": {"count_message": legacy.get("count_message", 0)},
+        "$min": {"created_at": legacy.get("created_at") or target.get("created_at")},
+    }
+    if (legacy.get("updated_at") or datetime.min) > (target.get("updated_at") or datetime.min):
+        update["$set"] = {field: legacy[field] for field in LATEST_FIELDS if field in legacy}
+    if legacy.get("tags"):
+        update["$addToSet"] = {"tags": {"$each": legacy["tags"]}}
+    await events.update_one({"_id": target["_id"]}, update)
+
+    for collection in await MessageRepository()._collections_for_range():
+        await collection.update_many({"event_id": legacy["_id"]}, {"$set": {"event_id": target["_id"]}})
+    await events.delete_one({"_id": legacy["_id"]})
+
+
+async def migrate_event(event: dict) -> str:
+    """Переводит одно событие. Возвращает, что с ним сделано."""
+    events = get_events_collection()
+    template = template_miner.identify(event.get("model"), event["name"])
+    if template.name == event["name"]:
+        await events.update_one({"_id": event["_id"]}, {"$set": {"template_id": template.id}})
+        return "kept"
+
+    target = await events.find_one({"ip": event["ip"], "name": template.name})
+    if target is None:
+        await events.update_one(
+            {"_id": event["_id"]},
+            {"$set": {"name": template.name, "template_id": template.id}}
+        )
+        return "renamed"
+
+    await merge_into(event, target)
+    return "merged"
+
+
+async def migrate_batch(after_id: Optional[ObjectId], batch_size: int) -> Tuple[Optional[ObjectId], int]:
+    """Обрабатывает одну пачку. Возвращает _id последнего события и размер пачки."""
+    query = {"template_id": {"$exists": False}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+
+    cursor = get_events_collection().find(query).sort("_id", ASCENDING).limit(batch_size)
+    docs = await cursor.to_list(length=batch_size)
+    if not docs:
+        return None, 0
+
+    results = {}
+    for doc in docs:
+        result = await migrate_event(doc)
+        results[result] = results.get(result, 0) + 1
+    await template_miner.flush()
+    logger.info(f"Пачка событий: {results}")
+
+    return docs[-1]["_id"], len(docs)
+
+
+async def run(batch_size: int, pause: float, restart: bool):
+    last_id = None if restart else await load_checkpoint()
+    total = 0
+    logger.info(f"Старт миграции {MIGRATION_ID} после _id={last_id}")
+    await template_miner.load()
+
+    while True:
+        batch_last_id, processed = await migrate_batch(last_id, batch_size)
+        if not processed:
+            break
+
+        last_id = batch_last_id
+        total += processed
+        await save_checkpoint(last_id, processed)
+        logger.info(f"Обработано {total} событий, последнее _id={last_id}")
+
+        # Пауза между пачками снижает нагрузку на рабочую базу
+        if pause:
+            await asyncio.sleep(pause)
+
+    await save_checkpoint(last_id, 0, completed=True)
+    logger.info(f"Миграция {MIGRATION_ID} завершена: {total} событий")
+
+
+async def main(batch_size: int, pause: float, restart: bool):
+    await connect_to_mongo()
+    try:
+        await run(batch_size, pause, restart)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Перевод событий со старыми именами на имена шаблонов")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1, help="пауза между пачками, секунды")
+    parser.add_argument("--restart", action="store_true", help="начать сначала, игнорируя сохраненную позицию")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.pause, args.restart))
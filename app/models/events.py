@@ -17,9 +17,17 @@ class HostData(BaseModel):
 class Event(HostData):
     id: Optional[str] = Field(None, alias="_id")
     name: Optional[str] = None
+    # Шаблон сообщений события (см. app/services/template_miner.py)
+    template_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now())
     updated_at: datetime = Field(default_factory=lambda: datetime.now())
     status: bool = True
+    # Важность и теги по правилам разбора текста (app/services/rule_engine.py)
+    severity: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    # Отметки детектора аномалий (app/services/anomaly_service.py)
+    storm: bool = False
+    flapping: bool = False
     count_message: int = 1
 
     @field_validator('id', mode='before')
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional
 
@@ -10,6 +10,8 @@ class Incident(BaseModel):
     location: str
     count: int = 1
     last_updated: datetime = None
+    # Ранг совпадения при поиске (меньше - лучше); нужен для курсора, в ответ не входит
+    search_rank: Optional[int] = Field(None, exclude=True)
 
     class Config:
         json_schema_extra = {
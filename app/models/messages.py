@@ -10,6 +10,10 @@ class Message(BaseModel):
     
     text: str
     event_id: Optional[str] = None
+    # Копия данных события на момент приема: позволяет фильтровать сообщения без $lookup
+    ip: Optional[str] = None
+    services: List[str] = Field(default_factory=list)
+    event_status: Optional[bool] = None
 
     @field_validator('id', 'event_id', mode='before')
     def validate_id(cls, v):
@@ -36,6 +40,17 @@ class RawMessage(BaseModel):
     ip: str
     text: str
 
+# Счетчик сообщений за минуту (service="*" - все сообщения)
+class MessageRollup(BaseModel):
+    id: Optional[str] = Field(None, alias="_id")
+    bucket: datetime
+    service: str
+    count: int = 0
+
+    @field_validator('id', mode='before')
+    def validate_id(cls, v):
+        return str(v) if v is not None else None
+
 # Модель для ответа
 class MessageCountResponse(BaseModel):
     timestamp: datetime
@@ -0,0 +1,260 @@
+"""
+Отложенная запись счетчиков активных событий (write-behind).
+
+Во время всплеска одно событие (ip, name) получает сотни сообщений в секунду,
+и каждое давало отдельный find_one_and_update. Первое сообщение события по-
+прежнему пишется в базу сразу (нужен _id для ссылки из сообщения), после чего
+событие попадает в таблицу активных событий. Следующие сообщения только
+меняют состояние в памяти: счетчик, статус, данные хоста, важность и теги.
+Накопленное уходит одной операцией на событие общим bulk_write раз в
+EVENT_FLUSH_INTERVAL_MS или сразу после EVENT_FLUSH_MAX_MESSAGES сообщений
+события. При остановке записывается все.
+
+Чем меньше интервал и порог, тем свежее данные в базе и выше нагрузка записи.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.database.versions import write_versions
+from app.models.events import Event, HostData
+from app.services.rule_engine import Classification, merge_classifications
+from app.services.template_miner import LogTemplate
+
+logger = logging.getLogger(__name__)
+
+EventKey = Tuple[str, str]
+
+
+class ActiveEvent:
+    __slots__ = ("document", "pending", "host_data", "template", "classification", "updated_at")
+
+    def __init__(self, document: dict):
+        # Состояние события с учетом еще не записанных сообщений
+        self.document = document
+        # Не записанные в базу сообщения и их итог
+        self.pending = 0
+        self.host_data: Optional[HostData] = None
+        self.template: Optional[LogTemplate] = None
+        self.classification: Optional[Classification] = None
+        self.updated_at: Optional[datetime] = None
+
+
+class ActiveEventTable:
+    def __init__(
+        self,
+        get_collection: Callable[[], AsyncCollection],
+        build_update: Callable[[HostData, LogTemplate, Classification, int, datetime], dict],
+        flush_interval_ms: int,
+        flush_max_messages: int,
+        max_size: int,
+        idle_ttl: float
+    ):
+        self._get_collection = get_collection
+        self._build_update = build_update
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_messages = flush_max_messages
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        # Порядок - по последнему сообщению: давно не обновлявшиеся в начале
+        self._events: "OrderedDict[EventKey, ActiveEvent]" = OrderedDict()
+        self._flusher: Optional[asyncio.Task] = None
+        # Записи идут по очереди: снимок, взятый раньше, не может лечь в базу позже
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.absorbed = 0
+
+    @property
+    def collection(self) -> AsyncCollection:
+        return self._get_collection()
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None
+
+    def get(self, key: EventKey) -> Optional[ActiveEvent]:
+        """Активное событие; None, если его нет или запись не отложенная (таблица не запущена)."""
+        if not self.running:
+            return None
+        return self._events.get(key)
+
+    def add(self, key: EventKey, document: dict):
+        """Событие только что записано в базу: следующие сообщения можно копить в памяти."""
+        if self.running:
+            self._events[key] = ActiveEvent(document)
+            self._events.move_to_end(key)
+
+    def absorb(
+        self,
+        key: EventKey,
+        entry: ActiveEvent,
+        host_data: HostData,
+        template: LogTemplate,
+        classification: Classification,
+        count: int,
+        now: datetime
+    ) -> Event:
+        """Учитывает сообщения события в памяти и возвращает его новое состояние."""
+        entry.pending += count
+        entry.host_data = host_data
+        entry.template = template
+        entry.classification = (
+            classification if entry.classification is None
+            else merge_classifications(entry.classification, classification)
+        )
+        entry.updated_at = now
+
+        document = entry.document
+        document.update(host_data.model_dump())
+        document["template_id"] = template.id
+        document["updated_at"] = now
+        document["status"] = classification.status
+        document["count_message"] = document.get("count_message", 0) + count
+        if classification.severity is not None:
+            document["severity"] = classification.severity
+        tags = document.setdefault("tags", [])
+        tags.extend(tag for tag in classification.tags if tag not in tags)
+
+        self._events.move_to_end(key)
+        self.absorbed += count
+        return Event(**document)
+
+    def due(self, entry: ActiveEvent) -> bool:
+        return entry.pending >= self.flush_max_messages
+
+    def refresh(self, event: Event):
+        """Событие изменено в базе в обход таблицы (например, отметки аномалий)."""
+        entry = self._events.get((event.ip, event.name))
+        if entry is None:
+            return
+        document = event.model_dump(by_alias=True)
+        document["count_message"] = event.count_message + entry.pending
+        entry.document.update(document)
+
+    def patch(self, event: Event, fields: dict) -> Event:
+        """
+        Поля события изменены в базе в обход таблицы. Возвращает событие
+        с учетом не записанных сообщений, если оно активно.
+        """
+        entry = self._events.get((event.ip, event.name))
+        if entry is None:
+            return event
+        entry.document.update(fields)
+        return Event(**entry.document)
+
+    def forget(self, event_id: str):
+        for key, entry in list(self._events.items()):
+            if entry.document.get("_id") == event_id:
+                del self._events[key]
+
+    async def flush(self, keys: Optional[List[EventKey]] = None):
+        """Записывает накопленные изменения (всех событий или только keys) одним bulk_write."""
+        async with self._flush_lock:
+            await self._flush(keys)
+
+    async def _flush(self, keys: Optional[List[EventKey]]):
+        if keys is None:
+            keys = [key for key, entry in self._events.items() if entry.pending]
+        batch: Dict[EventKey, ActiveEvent] = {}
+        for key in keys:
+            entry = self._events.get(key)
+            if entry is None or not entry.pending:
+                continue
+            # Снимок: сообщения, пришедшие во время записи, попадут в следующий раз
+            snapshot = ActiveEvent(entry.document)
+            snapshot.pending, entry.pending = entry.pending, 0
+            snapshot.host_data, snapshot.template = entry.host_data, entry.template
+            snapshot.classification, entry.classification = entry.classification, None
+            snapshot.updated_at = entry.updated_at
+            batch[key] = snapshot
+        if not batch:
+            return
+
+        operations = [
+            UpdateOne(
+                {"ip": ip, "name": name},
+                self._build_update(
+                    snapshot.host_data, snapshot.template, snapshot.classification,
+                    snapshot.pending, snapshot.updated_at
+                ),
+                upsert=True
+            )
+            for (ip, name), snapshot in batch.items()
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception:
+            self._restore(batch)
+            raise
+        write_versions.bump(self.collection.name)
+        self.flushes += 1
+
+    async def flush_due(self, keys: List[EventKey]):
+        """
+        Запись событий, набравших flush_max_messages. Ошибка не прерывает прием
+        сообщения: изменения остаются в таблице и уйдут с периодической записью.
+        """
+        try:
+            await self.flush(keys)
+        except Exception as e:
+            logger.error(f"Ошибка записи активных событий: {e!r}")
+
+    def _restore(self, batch: Dict[EventKey, ActiveEvent]):
+        """Возвращает незаписанный снимок в таблицу, чтобы не потерять сообщения."""
+        for key, snapshot in batch.items():
+            entry = self._events.get(key)
+            if entry is None:
+                entry = self._events[key] = ActiveEvent(snapshot.document)
+            entry.pending += snapshot.pending
+            if entry.classification is None:
+                entry.classification = snapshot.classification
+                entry.host_data, entry.template = snapshot.host_data, snapshot.template
+                entry.updated_at = snapshot.updated_at
+            else:
+                entry.classification = merge_classifications(snapshot.classification, entry.classification)
+
+    def _expire(self):
+        """Убирает записанные события без новых сообщений и лишние сверх max_size."""
+        now = datetime.now()
+        for key in list(self._events):
+            entry = self._events[key]
+            last_seen = entry.updated_at or entry.document.get("updated_at") or now
+            if len(self._events) <= self.max_size and (now - last_seen).total_seconds() <= self.idle_ttl:
+                break
+            if not entry.pending:
+                del self._events[key]
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи активных событий: {e!r}")
+            self._expire()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="active-events-flush")
+
+    async def stop(self):
+        """Останавливает периодическую запись и записывает все накопленное."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        self._events.clear()
+
+    def stats(self) -> dict:
+        return {
+            "events": len(self._events),
+            "pending_messages": sum(entry.pending for entry in self._events.values()),
+            "absorbed": self.absorbed,
+            "flushes": self.flushes,
+        }
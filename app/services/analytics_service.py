@@ -0,0 +1,195 @@
+"""
+Самые частые хосты, сервисы, площадки и шаблоны событий за последние минуты.
+
+Потоковые скетчи с ограниченной памятью обновляются при приеме сообщений,
+запрос к базе не нужен. Окно разбито на корзины по ANALYTICS_BUCKET_SECONDS;
+в каждой корзине для каждого измерения хранятся:
+- Space-Saving на K счетчиков - кандидаты в самые частые;
+- Count-Min - оценка числа любого значения (не меньше истинного).
+Для запроса за последние N минут кандидаты объединяются по корзинам,
+их число оценивается суммой Count-Min по тем же корзинам.
+"""
+import heapq
+import math
+import random
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+DIMENSIONS = ("host", "service", "location", "template")
+# Сколько кандидатов на одно место в ответе оценивается по Count-Min
+CANDIDATES_PER_ITEM = 4
+
+
+class SpaceSaving:
+    """
+    Top-K по алгоритму Space-Saving: K счетчиков; новое значение при
+    заполненной таблице вытесняет минимальный счетчик и наследует его
+    число (оно же - верхняя граница ошибки).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        # Куча (число, значение) с ленивым удалением устаревших записей
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    def update(self, item: Hashable, count: int = 1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            minimum, evicted = self._pop_min()
+            del counts[evicted]
+            del self.errors[evicted]
+            counts[item] = minimum + count
+            self.errors[item] = minimum
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(value, key) for key, value in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, Hashable]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+
+class CountMin:
+    """Count-Min: depth строк по width счетчиков, оценка - минимум по строкам."""
+
+    def __init__(self, width: int, depth: int, seeds: List[Tuple[int, int]], typecode: str = "I"):
+        self.width = width
+        self.depth = depth
+        self._seeds = seeds
+        self._table = array(typecode, [0]) * (width * depth)
+
+    @classmethod
+    def merged(cls, sketches: List["CountMin"]) -> "CountMin":
+        """Сумма скетчей с общими коэффициентами хешей (64-битные счетчики)."""
+        first = sketches[0]
+        result = cls(first.width, first.depth, first._seeds, "Q")
+        result._table = array("Q", map(sum, zip(*(sketch._table for sketch in sketches))))
+        return result
+
+    def _cells(self, item: Hashable) -> Iterable[int]:
+        value = hash(item)
+        width = self.width
+        return [
+            row * width + ((a * value + b) % 2305843009213693951) % width
+            for row, (a, b) in enumerate(self._seeds)
+        ]
+
+    def update(self, item: Hashable, count: int = 1):
+        table = self._table
+        for cell in self._cells(item):
+            table[cell] += count
+
+    def estimate(self, item: Hashable) -> int:
+        table = self._table
+        return min(table[cell] for cell in self._cells(item))
+
+
+class WindowBucket:
+    __slots__ = ("bucket", "total", "top", "counts")
+
+    def __init__(self, bucket: int, top_k: int, width: int, depth: int, seeds: List[Tuple[int, int]]):
+        self.bucket = bucket
+        # Число сообщений в корзине
+        self.total = 0
+        self.top = {dimension: SpaceSaving(top_k) for dimension in DIMENSIONS}
+        self.counts = {dimension: CountMin(width, depth, seeds) for dimension in DIMENSIONS}
+
+
+class HeavyHitters:
+    """Скетчи по корзинам скользящего окна (кольцевой буфер)."""
+
+    def __init__(self, window_minutes: int, bucket_seconds: int, top_k: int, width: int, depth: int):
+        self.bucket_seconds = bucket_seconds
+        self.top_k = top_k
+        self.width = width
+        self.depth = depth
+        # Коэффициенты хешей общие для корзин: одинаковое значение попадает в одни ячейки
+        rng = random.Random()
+        self._seeds = [(rng.randrange(1, 1 << 61), rng.randrange(1 << 61)) for _ in range(depth)]
+        self._buckets: List[Optional[WindowBucket]] = [None] * math.ceil(window_minutes * 60 / bucket_seconds)
+
+    @property
+    def window_minutes(self) -> float:
+        return len(self._buckets) * self.bucket_seconds / 60
+
+    def _current(self, now: float) -> WindowBucket:
+        number = int(now // self.bucket_seconds)
+        slot = number % len(self._buckets)
+        bucket = self._buckets[slot]
+        if bucket is None or bucket.bucket != number:
+            bucket = self._buckets[slot] = WindowBucket(number, self.top_k, self.width, self.depth, self._seeds)
+        return bucket
+
+    def record(self, messages: int, values: Dict[str, Counter], now: Optional[float] = None):
+        """Учитывает сообщения: values - измерение -> значение -> число сообщений."""
+        bucket = self._current(time.time() if now is None else now)
+        bucket.total += messages
+        for dimension, counter in values.items():
+            top = bucket.top[dimension]
+            counts = bucket.counts[dimension]
+            for item, count in counter.items():
+                top.update(item, count)
+                counts.update(item, count)
+
+    def top(self, dimension: str, minutes: float, limit: int, now: Optional[float] = None) -> dict:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds)
+        oldest = current - math.ceil(minutes * 60 / self.bucket_seconds) + 1
+        buckets = [
+            bucket for bucket in self._buckets
+            if bucket is not None and oldest <= bucket.bucket <= current
+        ]
+
+        # Кандидаты ранжируются по сумме счетчиков Space-Saving, по Count-Min
+        # оцениваются только лучшие: оценка стоит depth хешей на кандидата
+        ranked: Counter = Counter()
+        lower: Counter = Counter()
+        for bucket in buckets:
+            top = bucket.top[dimension]
+            ranked.update(top.counts)
+            for item, count in top.counts.items():
+                lower[item] += count - top.errors[item]
+        candidates = [item for item, _ in ranked.most_common(limit * CANDIDATES_PER_ITEM)]
+
+        items = []
+        if candidates:
+            # Таблицы корзин складываются один раз, каждый кандидат оценивается один раз
+            counts = CountMin.merged([bucket.counts[dimension] for bucket in buckets])
+            items = [
+                {"key": item, "count": counts.estimate(item), "lower_bound": lower[item]}
+                for item in candidates
+            ]
+        items.sort(key=lambda entry: (-entry["count"], -entry["lower_bound"]))
+
+        return {
+            "dimension": dimension,
+            "minutes": minutes,
+            "total": sum(bucket.total for bucket in buckets),
+            "items": items[:limit],
+        }
+
+
+# Глобальный экземпляр: скетчи заполняет JournalService.analyze, читает /analytics/top
+heavy_hitters = HeavyHitters(
+    window_minutes=settings.ANALYTICS_WINDOW_MINUTES,
+    bucket_seconds=settings.ANALYTICS_BUCKET_SECONDS,
+    top_k=settings.ANALYTICS_TOP_K,
+    width=settings.ANALYTICS_SKETCH_WIDTH,
+    depth=settings.ANALYTICS_SKETCH_DEPTH,
+)
@@ -0,0 +1,255 @@
+"""
+Инкрементальное обнаружение всплесков потока сообщений (storm) и
+"мигания" событий между открытым и решенным состоянием (flapping).
+
+Состояние обновляется при приеме каждого сообщения и занимает O(1) на ключ:
+- событие (ip, name - ключ события, храним по id): две экспоненциально
+  сглаженные скорости (короткая и базовая), последний статус и кольцо
+  времен последних смен статуса;
+- сервис: те же две скорости.
+Всплеск - короткая скорость выше базовой в ANOMALY_STORM_FACTOR раз и не
+ниже минимального порога; снимается с гистерезисом (вдвое ниже порогов).
+Мигание - ANOMALY_FLAP_TRANSITIONS смен статуса за ANOMALY_FLAP_WINDOW секунд.
+
+Ключи без сообщений дольше ANOMALY_IDLE_TTL удаляются (с отметками - со снятием
+отметок). Отметки активных ключей перепроверяются раз в ANOMALY_CHECK_INTERVAL,
+чтобы всплеск снимался и после того, как сообщения перестали приходить.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from app.config import settings
+
+STORM = "storm"
+FLAPPING = "flapping"
+
+SCOPE_EVENT = "event"
+SCOPE_SERVICE = "service"
+
+
+class AnomalyChange(NamedTuple):
+    scope: str
+    key: str
+    kind: str
+    active: bool
+    # Короткая скорость, сообщений в минуту
+    rate: float
+
+
+class RateState:
+    __slots__ = ("short", "long", "last", "storm")
+    # У сервиса нет статуса, отметка мигания всегда снята (у события - слот)
+    flapping = False
+
+    def __init__(self, now: float):
+        # Скорости в сообщениях в секунду
+        self.short = 0.0
+        self.long = 0.0
+        self.last = now
+        self.storm = False
+
+    def rates(self, now: float, short_tau: float, long_tau: float) -> Tuple[float, float]:
+        elapsed = max(now - self.last, 0.0)
+        return self.short * math.exp(-elapsed / short_tau), self.long * math.exp(-elapsed / long_tau)
+
+    def add(self, now: float, count: int, short_tau: float, long_tau: float):
+        short, long = self.rates(now, short_tau, long_tau)
+        self.short = short + count / short_tau
+        self.long = long + count / long_tau
+        self.last = max(now, self.last)
+
+
+class EventState(RateState):
+    __slots__ = ("status", "transitions", "position", "flapping")
+
+    def __init__(self, now: float, status: bool):
+        super().__init__(now)
+        self.status = status
+        # Кольцо времен последних смен статуса (создается при первой смене:
+        # у большинства событий статус не меняется)
+        self.transitions: Optional[List[float]] = None
+        self.position = 0
+        self.flapping = False
+
+    def transition(self, now: float, size: int):
+        if self.transitions is None:
+            self.transitions = []
+        if len(self.transitions) < size:
+            self.transitions.append(now)
+        else:
+            self.transitions[self.position] = now
+            self.position = (self.position + 1) % size
+
+    def oldest_transition(self, size: int) -> Optional[float]:
+        if self.transitions is None or len(self.transitions) < size:
+            return None
+        return self.transitions[self.position]
+
+
+class AnomalyDetector:
+    def __init__(
+        self,
+        short_window: float,
+        long_window: float,
+        storm_factor: float,
+        storm_min_rate: float,
+        service_storm_min_rate: float,
+        flap_transitions: int,
+        flap_window: float,
+        idle_ttl: float,
+        max_keys: int,
+        check_interval: float
+    ):
+        self.short_tau = short_window
+        self.long_tau = long_window
+        self.storm_factor = storm_factor
+        # Пороги в настройках - сообщения в минуту
+        self.storm_min_rate = storm_min_rate / 60
+        self.service_storm_min_rate = service_storm_min_rate / 60
+        self.flap_transitions = flap_transitions
+        self.flap_window = flap_window
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.check_interval = check_interval
+
+        # Порядок - по последнему сообщению: устаревшие ключи в начале
+        self.events: "OrderedDict[str, EventState]" = OrderedDict()
+        self.services: "OrderedDict[str, RateState]" = OrderedDict()
+        # Ключи с отметками - их перепроверяем по таймеру
+        self._active: Set[Tuple[str, str]] = set()
+        self._next_check = 0.0
+
+    def __len__(self) -> int:
+        return len(self.events) + len(self.services)
+
+    def _storm(self, state: RateState, now: float, min_rate: float) -> Optional[bool]:
+        """Новое значение отметки всплеска или None, если не изменилась."""
+        short, long = state.rates(now, self.short_tau, self.long_tau)
+        if not state.storm:
+            if short >= min_rate and short > self.storm_factor * long:
+                return True
+        elif short < min_rate / 2 or short < self.storm_factor / 2 * long:
+            return False
+        return None
+
+    def _flapping(self, state: EventState, now: float) -> Optional[bool]:
+        oldest = state.oldest_transition(self.flap_transitions)
+        flapping = oldest is not None and now - oldest <= self.flap_window
+        return flapping if flapping != state.flapping else None
+
+    def _check(self, scope: str, key: str, state: RateState, now: float, changes: List[AnomalyChange]):
+        min_rate = self.storm_min_rate if scope == SCOPE_EVENT else self.service_storm_min_rate
+        storm = self._storm(state, now, min_rate)
+        if storm is not None:
+            state.storm = storm
+            changes.append(AnomalyChange(scope, key, STORM, storm, self._rate(state, now)))
+        if scope == SCOPE_EVENT:
+            flapping = self._flapping(state, now)
+            if flapping is not None:
+                state.flapping = flapping
+                changes.append(AnomalyChange(scope, key, FLAPPING, flapping, self._rate(state, now)))
+
+        if state.storm or state.flapping:
+            self._active.add((scope, key))
+        else:
+            self._active.discard((scope, key))
+
+    def _rate(self, state: RateState, now: float) -> float:
+        return round(state.rates(now, self.short_tau, self.long_tau)[0] * 60, 2)
+
+    def observe(self, events: Iterable[Tuple[str, bool, List[str]]], now: Optional[float] = None) -> List[AnomalyChange]:
+        """
+        Учитывает сообщения: (id события, статус события после сообщения, сервисы).
+        Возвращает изменившиеся отметки.
+        """
+        now = time.time() if now is None else now
+        event_counts: Dict[str, int] = {}
+        statuses: Dict[str, List[bool]] = {}
+        service_counts: Dict[str, int] = {}
+        for event_id, status, services in events:
+            event_counts[event_id] = event_counts.get(event_id, 0) + 1
+            statuses.setdefault(event_id, []).append(status)
+            for service in set(services):
+                service_counts[service] = service_counts.get(service, 0) + 1
+
+        changes: List[AnomalyChange] = []
+        for event_id, count in event_counts.items():
+            state = self.events.get(event_id)
+            if state is None:
+                state = self.events[event_id] = EventState(now, statuses[event_id][0])
+            else:
+                self.events.move_to_end(event_id)
+            for status in statuses[event_id]:
+                if status != state.status:
+                    state.status = status
+                    state.transition(now, self.flap_transitions)
+            state.add(now, count, self.short_tau, self.long_tau)
+            self._check(SCOPE_EVENT, event_id, state, now, changes)
+
+        for service, count in service_counts.items():
+            state = self.services.get(service)
+            if state is None:
+                state = self.services[service] = RateState(now)
+            else:
+                self.services.move_to_end(service)
+            state.add(now, count, self.short_tau, self.long_tau)
+            self._check(SCOPE_SERVICE, service, state, now, changes)
+
+        changes.extend(self.sweep(now))
+        return changes
+
+    def sweep(self, now: Optional[float] = None) -> List[AnomalyChange]:
+        """Удаляет простаивающие ключи и перепроверяет отметки (не чаще check_interval)."""
+        now = time.time() if now is None else now
+        changes: List[AnomalyChange] = []
+        for scope, states in ((SCOPE_EVENT, self.events), (SCOPE_SERVICE, self.services)):
+            limit = self.max_keys if scope == SCOPE_EVENT else self.max_keys // 10
+            while states:
+                key, state = next(iter(states.items()))
+                if now - state.last <= self.idle_ttl and len(states) <= limit:
+                    break
+                del states[key]
+                self._clear(scope, key, state, now, changes)
+
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            for scope, key in list(self._active):
+                states = self.events if scope == SCOPE_EVENT else self.services
+                self._check(scope, key, states[key], now, changes)
+        return changes
+
+    def _clear(self, scope: str, key: str, state: RateState, now: float, changes: List[AnomalyChange]):
+        """Снимает отметки удаляемого ключа."""
+        if state.storm:
+            changes.append(AnomalyChange(scope, key, STORM, False, self._rate(state, now)))
+        if state.flapping:
+            changes.append(AnomalyChange(scope, key, FLAPPING, False, self._rate(state, now)))
+        self._active.discard((scope, key))
+
+    def stats(self) -> dict:
+        return {
+            "events": len(self.events),
+            "services": len(self.services),
+            "storm": sorted(key for scope, key in self._active if self._state(scope, key).storm),
+            "flapping": sorted(key for scope, key in self._active if self._state(scope, key).flapping),
+        }
+
+    def _state(self, scope: str, key: str) -> RateState:
+        return (self.events if scope == SCOPE_EVENT else self.services)[key]
+
+
+# Глобальный экземпляр детектора: состояние заполняет JournalService
+anomaly_detector = AnomalyDetector(
+    short_window=settings.ANOMALY_SHORT_WINDOW,
+    long_window=settings.ANOMALY_LONG_WINDOW,
+    storm_factor=settings.ANOMALY_STORM_FACTOR,
+    storm_min_rate=settings.ANOMALY_STORM_MIN_RATE,
+    service_storm_min_rate=settings.ANOMALY_SERVICE_STORM_MIN_RATE,
+    flap_transitions=settings.ANOMALY_FLAP_TRANSITIONS,
+    flap_window=settings.ANOMALY_FLAP_WINDOW,
+    idle_ttl=settings.ANOMALY_IDLE_TTL,
+    max_keys=settings.ANOMALY_MAX_KEYS,
+    check_interval=settings.ANOMALY_CHECK_INTERVAL,
+)
@@ -0,0 +1,309 @@
+"""
+Архивирование старых сообщений и закрытых событий в сжатые сегменты на диске.
+
+Сегмент - файл <день>.ndjson.gz, в который дописываются gzip-блоки (по одному
+на пачку). Рядом лежит индекс <день>.idx.json: смещение, длина и диапазон
+времени каждого блока, поэтому при чтении распаковываются только блоки,
+пересекающиеся с запрошенным периодом.
+
+Порядок записи пачки: блок в сегмент (fsync) -> запись в индекс -> удаление
+из MongoDB -> отметка deleted в индексе. Если процесс упал после записи
+в индекс, при следующем запуске документы блока удаляются повторно.
+
+Однократный запуск:
+    python -m app.services.archive_service
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.config import settings
+from app.database.mongodb import (
+    connect_to_mongo,
+    close_mongo_connection,
+    get_database,
+    get_events_collection
+)
+from app.database.versions import write_versions
+from app.services.message_service import MessageRepository, message_partitions
+
+logger = logging.getLogger(__name__)
+
+DAY_FORMAT = "%Y-%m-%d"
+
+
+class SegmentArchive:
+    """Сегменты одной коллекции в каталоге directory (по одному на день)."""
+
+    def __init__(self, directory: Path, time_field: str):
+        self.directory = directory
+        self.time_field = time_field
+
+    def _segment_path(self, day: str) -> Path:
+        return self.directory / f"{day}.ndjson.gz"
+
+    def _index_path(self, day: str) -> Path:
+        return self.directory / f"{day}.idx.json"
+
+    def _load_index(self, day: str) -> dict:
+        path = self._index_path(day)
+        if not path.exists():
+            return {"segment": self._segment_path(day).name, "blocks": []}
+        return json.loads(path.read_text())
+
+    def _save_index(self, day: str, index: dict):
+        # Индекс заменяется атомарно, чтобы не оставить его недописанным
+        path = self._index_path(day)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index))
+        os.replace(tmp_path, path)
+
+    def days(self) -> List[str]:
+        if not self.directory.exists():
+            return []
+        return sorted(path.name[:-len(".idx.json")] for path in self.directory.glob("*.idx.json"))
+
+    def append(self, day: str, collection: str, docs: List[dict]) -> dict:
+        """Дописывает пачку документов одного дня блоком в сегмент и индекс."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index = self._load_index(day)
+        blocks = index["blocks"]
+        # Байты после последнего блока из индекса - остаток неудачной записи
+        offset = blocks[-1]["offset"] + blocks[-1]["length"] if blocks else 0
+
+        data = gzip.compress("".join(
+            json_util.dumps(doc, json_options=RELAXED_JSON_OPTIONS) + "\n" for doc in docs
+        ).encode())
+        segment_path = self._segment_path(day)
+        with open(segment_path, "r+b" if segment_path.exists() else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        times = [doc[self.time_field] for doc in docs]
+        block = {
+            "offset": offset,
+            "length": len(data),
+            "start": min(times).isoformat(),
+            "end": max(times).isoformat(),
+            "count": len(docs),
+            "collection": collection,
+            "deleted": False,
+        }
+        blocks.append(block)
+        self._save_index(day, index)
+        return block
+
+    def mark_deleted(self, day: str, offset: int):
+        index = self._load_index(day)
+        for block in index["blocks"]:
+            if block["offset"] == offset:
+                block["deleted"] = True
+        self._save_index(day, index)
+
+    def read_block(self, day: str, block: dict) -> List[dict]:
+        with open(self._segment_path(day), "rb") as f:
+            f.seek(block["offset"])
+            data = gzip.decompress(f.read(block["length"]))
+        return [json_util.loads(line) for line in data.decode().splitlines() if line]
+
+    def pending(self) -> List[Tuple[str, dict]]:
+        """Блоки, документы которых еще могут оставаться в MongoDB."""
+        return [
+            (day, block)
+            for day in self.days()
+            for block in self._load_index(day)["blocks"]
+            if not block["deleted"]
+        ]
+
+    def blocks_in_range(self, start: Optional[datetime], end: Optional[datetime]) -> List[Tuple[str, dict]]:
+        result = []
+        for day in self.days():
+            day_start = datetime.strptime(day, DAY_FORMAT)
+            if start is not None and day_start + timedelta(days=1) <= start:
+                continue
+            if end is not None and day_start > end:
+                continue
+            for block in self._load_index(day)["blocks"]:
+                if start is not None and datetime.fromisoformat(block["end"]) < start:
+                    continue
+                if end is not None and datetime.fromisoformat(block["start"]) > end:
+                    continue
+                result.append((day, block))
+        return result
+
+    async def read(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match: Optional[Callable[[dict], bool]] = None
+    ) -> AsyncIterator[dict]:
+        """Документы за период [start, end] в порядке архивирования, блок за блоком."""
+        for day, block in self.blocks_in_range(start, end):
+            docs = await asyncio.to_thread(self.read_block, day, block)
+            for doc in docs:
+                value = doc[self.time_field]
+                if start is not None and value < start:
+                    continue
+                if end is not None and value > end:
+                    continue
+                if match is None or match(doc):
+                    yield doc
+
+
+class CollectionArchiver:
+    """Переносит документы старше cutoff из MongoDB в SegmentArchive."""
+
+    def __init__(
+        self,
+        archive: SegmentArchive,
+        get_collections: Callable[[datetime], Awaitable[List[AsyncCollection]]],
+        build_query: Callable[[datetime], dict],
+        after_days: Callable[[], int]
+    ):
+        self.archive = archive
+        self.get_collections = get_collections
+        self.build_query = build_query
+        self.after_days = after_days
+
+    async def recover(self):
+        """Удаляет документы блоков, запись которых прервалась до удаления."""
+        for day, block in self.archive.pending():
+            docs = await asyncio.to_thread(self.archive.read_block, day, block)
+            collection = get_database()[block["collection"]]
+            await self._delete(collection, docs, datetime.fromisoformat(block["end"]))
+            await asyncio.to_thread(self.archive.mark_deleted, day, block["offset"])
+
+    async def _delete(self, collection: AsyncCollection, docs: List[dict], cutoff: datetime):
+        # Условие выборки повторяется: документ, изменившийся после чтения
+        # (например, событие снова открылось), не удаляется. Граница включает
+        # cutoff: BSON хранит время с точностью до миллисекунды
+        query = self.build_query(cutoff + timedelta(milliseconds=1))
+        query["_id"] = {"$in": [doc["_id"] for doc in docs]}
+        await collection.delete_many(query)
+        write_versions.bump(collection.name)
+
+    async def archive_collection(self, collection: AsyncCollection, cutoff: datetime) -> int:
+        time_field = self.archive.time_field
+        archived = 0
+        while True:
+            cursor = collection.find(self.build_query(cutoff)).sort(time_field, ASCENDING)
+            docs = await cursor.limit(settings.ARCHIVE_BATCH_SIZE).to_list(length=settings.ARCHIVE_BATCH_SIZE)
+            if not docs:
+                return archived
+
+            by_day: Dict[str, List[dict]] = defaultdict(list)
+            for doc in docs:
+                by_day[doc[time_field].strftime(DAY_FORMAT)].append(doc)
+
+            blocks = []
+            for day, day_docs in by_day.items():
+                block = await asyncio.to_thread(self.archive.append, day, collection.name, day_docs)
+                blocks.append((day, block))
+
+            await self._delete(collection, docs, cutoff)
+            for day, block in blocks:
+                await asyncio.to_thread(self.archive.mark_deleted, day, block["offset"])
+            archived += len(docs)
+
+    async def run_once(self) -> int:
+        if not self.after_days():
+            return 0
+        await self.recover()
+        cutoff = datetime.now() - timedelta(days=self.after_days())
+        archived = 0
+        for collection in await self.get_collections(cutoff):
+            archived += await self.archive_collection(collection, cutoff)
+        return archived
+
+
+async def _message_collections(cutoff: datetime) -> List[AsyncCollection]:
+    return await MessageRepository()._collections_for_range(None, cutoff)
+
+
+async def _event_collections(cutoff: datetime) -> List[AsyncCollection]:
+    return [get_events_collection()]
+
+
+archive_root = Path(settings.ARCHIVE_DIR)
+
+message_archive = SegmentArchive(archive_root / "messages", "created_at")
+event_archive = SegmentArchive(archive_root / "events", "updated_at")
+
+message_archiver = CollectionArchiver(
+    message_archive,
+    _message_collections,
+    lambda cutoff: {"created_at": {"$lt": cutoff}},
+    lambda: settings.ARCHIVE_MESSAGES_AFTER_DAYS
+)
+# Архивируются только закрытые события
+event_archiver = CollectionArchiver(
+    event_archive,
+    _event_collections,
+    lambda cutoff: {"status": False, "updated_at": {"$lt": cutoff}},
+    lambda: settings.ARCHIVE_EVENTS_AFTER_DAYS
+)
+
+
+class ArchiveService:
+    """Периодически запускает архивирование в фоне."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self):
+        messages = await message_archiver.run_once()
+        if settings.ARCHIVE_MESSAGES_AFTER_DAYS:
+            # Партиции, целиком ушедшие в архив, пусты - удаляем их
+            cutoff = datetime.now() - timedelta(days=settings.ARCHIVE_MESSAGES_AFTER_DAYS)
+            if MessageRepository().partitioned:
+                await message_partitions.drop_before(cutoff)
+        events = await event_archiver.run_once()
+        logger.info(f"Архивировано сообщений: {messages}, событий: {events}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка архивирования: {e}")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL)
+
+    def start(self):
+        if settings.ARCHIVE_ENABLED:
+            self._task = asyncio.create_task(self._loop(), name="archiver")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+archive_service = ArchiveService()
+
+
+async def main():
+    await connect_to_mongo()
+    try:
+        await archive_service.run_once()
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
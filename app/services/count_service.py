@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from bson import json_util
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.config import settings
+from app.database.versions import write_versions
+
+
+class CountCache:
+    """
+    Подсчет документов для total в списках.
+
+    - без фильтра используется estimated_document_count (по метаданным коллекции);
+    - результаты с фильтром кэшируются на ttl секунд и сбрасываются,
+      как только в коллекцию что-то записали.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # (коллекция, фильтр) -> (версия коллекции, время истечения, значение)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, int]]" = OrderedDict()
+
+    async def count(self, collection: AsyncCollection, query: dict) -> int:
+        if not query:
+            return await collection.estimated_document_count()
+
+        key = (collection.name, json_util.dumps(query))
+        version = write_versions.get(collection.name)
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_version, expires_at, value = entry
+            if entry_version == version and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+
+        value = await collection.count_documents(query)
+        self._entries[key] = (version, time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+
+# Глобальный кэш подсчетов
+count_cache = CountCache(ttl=settings.COUNT_CACHE_TTL, max_size=settings.COUNT_CACHE_SIZE)
@@ -1,4 +1,6 @@
-from app.services.netbox_service import NetboxService
+from app.config import settings
+from app.services.netbox_service import NetboxService, inventory
+from app.services.host_cache import host_cache
 from app.models.messages import RawMessage
 from app.models.events import HostData
 
@@ -6,54 +8,25 @@ class DataEnricher:
     def __init__(self):        
         self.netbox = NetboxService()
         
+    async def start(self):
+        if settings.NETBOX_PRELOAD:
+            await self.netbox.start()
+
+    async def stop(self):
+        await self.netbox.stop()
+
     async def enriche(self, raw_message: RawMessage) -> HostData:
+        # Если инвентарь загружен, Netbox по каждому сообщению не запрашиваем
+        if settings.NETBOX_PRELOAD and inventory.loaded:
+            return inventory.lookup(raw_message.ip) or HostData(ip=raw_message.ip)
+
         enriched_data: HostData = await self.get_data_from_netbox(raw_message.ip)
         return enriched_data
     
     async def get_data_from_netbox(self,ip: str) -> HostData:
-        
-        data = {
-            "ip" : ip,
-            "hostname" : None,
-            "model" : None,
-            "role" : None,
-            "location": None,
-            "services": []
-        }
-
         try:
-            ipam_ip = self.netbox.nb.ipam.ip_addresses.get(address=ip)
-            netbox_device = None
-            if ipam_ip and ipam_ip.assigned_object:
-                netbox_device = self.netbox.nb.dcim.devices.get(id=ipam_ip.assigned_object.device.id)
-
-            if not netbox_device:
-                return HostData(**data)
-            
-            data["hostname"] = netbox_device.name
-            
-            #get model
-            if netbox_device.device_type.model != "unknown":
-                data["model"] = netbox_device.device_type.model
-            
-            #get role
-            if netbox_device.role.name != "unknown":
-                data["role"] = netbox_device.role.name
-
-            #get location
-            if netbox_device.site.name != "unknown":
-                data["location"] = netbox_device.site.name
-            
-            #get services
-            tags = netbox_device.tags
-            for tag in tags:
-                data["services"].append(tag.name)
-
-        except Exception as e:
-            if 'code 400' in str(e):
-                '''
-                    TODO
-                '''
-                pass
-        
-        return HostData(**data)
\ No newline at end of file
+            return await host_cache.get_or_load(ip, self.netbox.get_host_data)
+        except Exception:
+            # Netbox недоступен или медленный (в т.ч. разомкнут предохранитель):
+            # ошибки не кэшируются, возвращаем минимальные данные
+            return HostData(ip=ip)
@@ -3,18 +3,42 @@ from app.database.mongodb import get_events_collection
 from app.models.events import Event
 from app.models.events import HostData
 from app.models.messages import Message
-from datetime import datetime
-from typing import Optional, Tuple, List
 from bson import ObjectId
+from datetime import datetime
+from typing import Optional, Tuple, List, Dict
+from pymongo import UpdateOne, ReturnDocument, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
 from app.services.message_service import MessageRepository
+from app.services.pagination import apply_cursor
+from app.services.count_service import count_cache
+from app.services.search_service import ValueVocabulary
+from app.services.template_miner import LogTemplate, template_miner
+from app.services.rule_engine import Classification, merge_classifications, message_rules
+from app.services.active_events import ActiveEventTable
+from app.config import settings
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
 class EventRepository(BaseRepository):
+    indexes = [
+        # Ключ события: на нем держится атомарный upsert
+        IndexModel([("ip", ASCENDING), ("name", ASCENDING)], unique=True, name="ip_name_unique"),
+        # Сортировка списков: (updated_at, _id) - см. BaseRepository.sort
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="updated_at_id"),
+        IndexModel([("status", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="status_updated_at_id"),
+        IndexModel([("services", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="services_updated_at_id"),
+    ]
+    hot_queries = [
+        {"name": "upsert_by_key", "filter": {"ip": "0.0.0.0", "name": ""}},
+        {"name": "list", "filter": {}, "sort": BaseRepository.sort},
+        {"name": "list_by_status", "filter": {"status": True}, "sort": BaseRepository.sort},
+        {"name": "list_by_service", "filter": {"services": ""}, "sort": BaseRepository.sort},
+    ]
+
     def __init__(self):
-        super().__init__(get_events_collection(), Event)
+        super().__init__(get_events_collection, Event)
     
     async def get_list(
         self,
@@ -22,22 +46,19 @@ class EventRepository(BaseRepository):
         limit: int = 10,
         text_search: Optional[str] = None,
         service_filter: Optional[str] = None,
+        after: Optional[str] = None,
+        projection: Optional[dict] = None,
+        raw: bool = False,
         **filters
     ) -> List[Event]:
-        query = {}
-
-        if text_search:
-            query["$text"] = {"$search": text_search}
+        query = await self.build_query(text_search, service_filter, filters)
         
-        if service_filter:
-            query["services"] = {"$regex": service_filter, "$options": "i"}  # case-insensitive search
-        
-        for field, value in filters.items():
-            if value is not None:
-                query[field] = value
-        
-        cursor = self.collection.find(query).sort("updated_at", -1).skip(skip).limit(limit)
-        return [self.model(**item) for item in cursor]
+        if after:
+            query = apply_cursor(query, self.sort, after)
+            skip = 0
+
+        cursor = self.collection.find(query, projection).sort(self.sort).skip(skip).limit(limit)
+        return await self._load(cursor, raw)
     
     async def get_count(
         self,
@@ -45,130 +66,193 @@ class EventRepository(BaseRepository):
         service_filter: Optional[str] = None,
         **filters
     ) -> int:
-        query = {}
-        
-        if text_search:
-            query["$text"] = {"$search": text_search}
+        query = await self.build_query(text_search, service_filter, filters)
+        return await count_cache.count(self.collection, query)
+
+    async def build_query(
+        self,
+        text_search: Optional[str] = None,
+        service_filter: Optional[str] = None,
+        filters: Optional[dict] = None
+    ) -> dict:
+        query = self._build_list_query(text_search, filters or {})
         
         if service_filter:
-            query["services"] = {"$regex": service_filter, "$options": "i"}
-        
-        for field, value in filters.items():
-            if value is not None:
-                query[field] = value
-        
-        return self.collection.count_documents(query)
+            # Подстрока ищется по списку сервисов в памяти, в базу идет $in по индексу
+            services = await service_vocabulary.matching(self.collection, service_filter)
+            query["services"] = {"$in": services}
+        return query
     
 
     async def upsert(self, host_data: HostData, message_data: Message) -> Event:
+        """
+        Атомарно создает или обновляет событие по ключу (ip, name) за один запрос.
+        Если сообщение уже сохранено (есть id), в нем проставляется ссылка на событие.
+        """
         try:
             # Process message text and determine status
-            status, processed_text = self._process_message_text(message_data.text)
+            classification = self._process_message_text(message_data.text)
 
             # Determine event name
-            name = await self._identify_event(host_data.model, processed_text)
-
-            # Find existing event
-            existing_event = await self._find_existing_event(host_data.ip, name)
-            
-            event_data = None
-            if existing_event:
-                event_data = await self._update_existing_event(
-                    host_data,
-                    existing_event["_id"], 
-                    status
-                )
+            template = await self._identify_event(host_data.model, classification.text)
+
+            key = (host_data.ip, template.name)
+            entry = active_events.get(key)
+            if entry is not None:
+                # Событие активно: сообщение учитывается в памяти, запись - пачкой позже
+                event = active_events.absorb(key, entry, host_data, template, classification, 1, datetime.now())
+                if active_events.due(entry):
+                    await active_events.flush_due([key])
             else:
-                event_data = await self._create_new_event(
-                    host_data, 
-                    name, 
-                    message_data.id, 
-                    status
-                )
-
-            return Event(**event_data)
+                event_data = await self._upsert_event(host_data, template, classification)
+                active_events.add(key, dict(event_data))
+                event = Event(**event_data)
+
+            if message_data.id:
+                await self.update_message_event_reference(message_data.id, event.id)
+
+            return event
         
         except Exception as e:
             logger.error(f"Error in upsert event:\n{traceback.format_exc()}")
             raise
     
 
-    async def _identify_event(self, model: str, text: str) -> str:
-        """Identify and return event name based on model and message text"""
-        # TODO: Implement more sophisticated event identification logic
-        return text[:300]
-    
+    async def upsert_many(self, items: List[Tuple[HostData, Message]]) -> List[Event]:
+        """
+        Создает или обновляет события для пачки сообщений.
 
-    def _process_message_text(self, text: str) -> Tuple[bool, str]:
-        """Process message text and return status and cleaned text"""
-        cleaned_text = text.strip()
-        if "SOLVED" in cleaned_text:
-            return False, cleaned_text.replace("SOLVED", "").strip()
-        return True, cleaned_text
-
-    async def _find_existing_event(self, ip: str, name: str) -> Optional[dict]:
-        """Find existing event by IP and name"""
-        return self.collection.find_one({
-            "ip": ip,
-            "name": name
-        })
-    
-    async def _create_new_event(self, host_data: HostData, name: str, message_id: str, status: bool) -> dict:
-        """Create a new event document"""
-
-        event_data = {
-            **host_data.model_dump(),
-            "name": name,
-            "status": status,
-            "count_message": 1,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
-        }
-        
-        # Вставляем новый документ
-        insert_result = self.collection.insert_one(event_data)
-        
-        # Получаем созданный документ
-        created_event = self.collection.find_one({"_id": insert_result.inserted_id})
-        # Обновляем ссылку на событие в сообщении
-        await self.update_message_event_reference(message_id, str(insert_result.inserted_id))
-        
-        # Убедимся, что _id преобразован в строку
-        if created_event and '_id' in created_event:
-            created_event['_id'] = str(created_event['_id'])
-        
-        return created_event
+        Сообщения группируются по (ip, name): на каждое событие уходит одна
+        upsert-операция в общем bulk_write, затем события читаются одним find.
+        Возвращает события в порядке входных сообщений.
+        """
+        if not items:
+            return []
+
+        now = datetime.now()
+        keys: List[Tuple[str, str]] = []
+        grouped: Dict[Tuple[str, str], dict] = {}
+
+        for host_data, message_data in items:
+            classification = self._process_message_text(message_data.text)
+            template = await self._identify_event(host_data.model, classification.text)
+            key = (host_data.ip, template.name)
+            keys.append(key)
+
+            group = grouped.setdefault(key, {"count": 0, "template": template})
+            group["count"] += 1
+            # Последнее сообщение в пачке определяет статус и данные хоста
+            previous = group.get("classification")
+            if previous is not None:
+                classification = merge_classifications(previous, classification)
+            group["classification"] = classification
+            group["host_data"] = host_data
+
+        # Активные события учитываются в памяти, остальные пишутся сразу
+        events: Dict[Tuple[str, str], Event] = {}
+        due: List[Tuple[str, str]] = []
+        for key, group in list(grouped.items()):
+            entry = active_events.get(key)
+            if entry is None:
+                continue
+            events[key] = active_events.absorb(
+                key, entry, group["host_data"], group["template"], group["classification"], group["count"], now
+            )
+            if active_events.due(entry):
+                due.append(key)
+            del grouped[key]
+
+        operations = [
+            UpdateOne(
+                {"ip": ip, "name": name},
+                self._build_upsert(group["host_data"], group["template"], group["classification"], group["count"], now),
+                upsert=True
+            )
+            for (ip, name), group in grouped.items()
+        ]
+
+        try:
+            if due:
+                await active_events.flush_due(due)
+
+            if operations:
+                await self.collection.bulk_write(operations, ordered=False)
+                self._mark_written()
+
+                cursor = self.collection.find({
+                    "$or": [{"ip": ip, "name": name} for ip, name in grouped]
+                })
+                async for item in cursor:
+                    item["_id"] = str(item["_id"])
+                    key = (item["ip"], item["name"])
+                    active_events.add(key, dict(item))
+                    events[key] = Event(**item)
+
+            return [events[key] for key in keys]
+
+        except Exception as e:
+            logger.error(f"Error in bulk upsert events:\n{traceback.format_exc()}")
+            raise
+
+    async def _identify_event(self, model: str, text: str) -> LogTemplate:
+        """
+        Шаблон сообщения для модели устройства: сообщения, отличающиеся только
+        счетчиками, временем, адресами и номерами интерфейсов, попадают в одно событие.
+        """
+        return template_miner.identify(model, text)
     
-    async def _update_existing_event(self, host_data: HostData, event_id, status: bool) -> dict:
-        """Update existing event with new message and status"""
 
-        # Убедимся, что event_id - ObjectId
-        if not isinstance(event_id, ObjectId):
-            event_id = ObjectId(event_id)
-        
-        # Получаем данные из host_data в виде словаря
-        host_data_dict = host_data.model_dump()
-
-        updated_event = self.collection.find_one_and_update(
-            {"_id": event_id},
-            {
-                "$set": {
-                    **host_data_dict,
-                    "updated_at": datetime.now(),
-                    "status": status
-                },
-                "$inc": {
-                    "count_message": 1
-                }
+    def _process_message_text(self, text: str) -> Classification:
+        """Статус, важность и теги сообщения по правилам и текст без служебных меток (SOLVED)"""
+        return message_rules.classify(text.strip())
+
+    @staticmethod
+    def _build_upsert(
+        host_data: HostData,
+        template: LogTemplate,
+        classification: Classification,
+        count: int,
+        now: datetime
+    ) -> dict:
+        """Build update document for upsert of event keyed by (ip, name)"""
+        update = {
+            "$set": {
+                **host_data.model_dump(),
+                "template_id": template.id,
+                "status": classification.status
             },
-            return_document=True
-        )
-        
+            # Отложенная запись с более старым снимком не откатывает время
+            "$max": {"updated_at": now},
+            "$inc": {"count_message": count},
+            "$setOnInsert": {"created_at": now}
+        }
+        # Сообщение о решении обычно без важности: важность события сохраняется
+        if classification.severity is not None:
+            update["$set"]["severity"] = classification.severity
+        if classification.tags:
+            update["$addToSet"] = {"tags": {"$each": classification.tags}}
+        return update
+
+    async def _upsert_event(self, host_data: HostData, template: LogTemplate, classification: Classification) -> dict:
+        """Create or update event with a single find_one_and_update(upsert=True)"""
+        query = {"ip": host_data.ip, "name": template.name}
+        update = EventRepository._build_upsert(host_data, template, classification, 1, datetime.now())
+
+        try:
+            event_data = await self.collection.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Параллельный upsert уже создал событие - повторяем как обновление
+            event_data = await self.collection.find_one_and_update(
+                query, update, return_document=ReturnDocument.AFTER
+            )
+
+        self._mark_written()
+
         # Убедимся, что _id преобразован в строку
-        if updated_event and '_id' in updated_event:
-            updated_event['_id'] = str(updated_event['_id'])
-        
-        return updated_event
+        event_data['_id'] = str(event_data['_id'])
+        return event_data
 
     async def update_message_event_reference(
         self, 
@@ -179,4 +263,42 @@ class EventRepository(BaseRepository):
         Обновляет ссылку на событие в сообщении.
         """
         message_repo = MessageRepository()
-        message_repo.update_message_event_reference(message_id, event_id )
\ No newline at end of file
+        await message_repo.update_message_event_reference(message_id, event_id)
+
+
+    async def update(self, id: str, update_data: dict) -> Optional[Event]:
+        event = await super().update(id, update_data)
+        if event is not None:
+            active_events.refresh(event)
+        return event
+
+    async def set_markers(self, id: str, markers: dict) -> Optional[Event]:
+        """
+        Отметки детектора аномалий (storm, flapping). updated_at не меняется:
+        отметка не должна поднимать событие в списках и откладывать архивацию.
+        """
+        event_data = await self.collection.find_one_and_update(
+            {"_id": ObjectId(id)}, {"$set": markers}, return_document=ReturnDocument.AFTER
+        )
+        if event_data is None:
+            return None
+        self._mark_written()
+        return active_events.patch(Event(**event_data), markers)
+
+    async def delete(self, id: str) -> bool:
+        active_events.forget(id)
+        return await super().delete(id)
+
+
+# Сервисы событий для поиска по подстроке (обновляются раз в минуту)
+service_vocabulary = ValueVocabulary("services", ttl=60)
+
+# Глобальная таблица активных событий: отложенная запись счетчиков (запускает JournalService)
+active_events = ActiveEventTable(
+    get_events_collection,
+    EventRepository._build_upsert,
+    flush_interval_ms=settings.EVENT_FLUSH_INTERVAL_MS,
+    flush_max_messages=settings.EVENT_FLUSH_MAX_MESSAGES,
+    max_size=settings.EVENT_ACTIVE_TABLE_SIZE,
+    idle_ttl=settings.EVENT_ACTIVE_IDLE_TTL,
+)
@@ -0,0 +1,113 @@
+"""
+Потоковая выгрузка документов в NDJSON или CSV.
+
+Документы читаются курсором и сериализуются напрямую, без pydantic-моделей;
+в памяти держится только текущая пачка строк.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Колонки CSV (NDJSON содержит документ целиком)
+EVENT_EXPORT_COLUMNS = [
+    "id", "ip", "hostname", "name", "template_id", "status", "severity", "tags", "count_message", "services",
+    "location", "role", "model", "created_at", "updated_at",
+]
+MESSAGE_EXPORT_COLUMNS = [
+    "id", "created_at", "updated_at", "ip", "text", "event_id", "services", "event_status",
+]
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """MongoDB сравнивает даты в UTC: aware-даты приводятся к naive UTC, как это делает драйвер."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _with_id(document: dict) -> dict:
+    # Поле id - как в ответах списков
+    document["id"] = str(document.pop("_id"))
+    return document
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ";".join(str(item) for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return ""
+    return str(value)
+
+
+async def _ndjson_lines(documents: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for document in documents:
+        yield json.dumps(_with_id(document), default=_json_default, ensure_ascii=False) + "\n"
+
+
+async def _csv_lines(documents: AsyncIterator[dict], columns: List[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for document in documents:
+        document = _with_id(document)
+        writer.writerow([_csv_value(document.get(column)) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок выгрузки без строк
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def _chunked(lines: AsyncIterator[str], chunk_size: int) -> AsyncIterator[str]:
+    """Склеивает строки в блоки, чтобы не отправлять каждую строку отдельной записью."""
+    chunk: List[str] = []
+    async for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def export_response(
+    documents: AsyncIterator[dict],
+    fmt: str,
+    columns: List[str],
+    filename: str
+) -> StreamingResponse:
+    if fmt == "csv":
+        lines = _csv_lines(documents, columns)
+        media_type = "text/csv"
+    else:
+        lines = _ndjson_lines(documents)
+        media_type = "application/x-ndjson"
+
+    headers: Dict[str, str] = {
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"'
+    }
+    return StreamingResponse(
+        _chunked(lines, settings.EXPORT_BATCH_SIZE),
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.models.events import HostData
+
+
+class HostDataCache:
+    """
+    Ограниченный по размеру кэш HostData по IP с TTL и вытеснением LRU.
+
+    - промахи (IP не найден в Netbox) тоже кэшируются, но с отдельным TTL;
+    - параллельные запросы одного IP объединяются в один вызов загрузчика.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # ip -> (время истечения, данные или None для ненайденного IP)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[HostData]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def _get(self, ip: str) -> Tuple[bool, Optional[HostData]]:
+        entry = self._entries.get(ip)
+        if entry is None:
+            return False, None
+
+        expires_at, host_data = entry
+        if expires_at < time.monotonic():
+            del self._entries[ip]
+            self.expirations += 1
+            return False, None
+
+        self._entries.move_to_end(ip)
+        return True, host_data
+
+    def _put(self, ip: str, host_data: Optional[HostData]):
+        ttl = self.ttl if host_data is not None else self.negative_ttl
+        self._entries[ip] = (time.monotonic() + ttl, host_data)
+        self._entries.move_to_end(ip)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(
+        self,
+        ip: str,
+        loader: Callable[[str], Awaitable[Optional[HostData]]]
+    ) -> HostData:
+        """
+        Возвращает данные хоста из кэша или загружает их через loader.
+        loader возвращает None, если IP не найден; исключения не кэшируются.
+        """
+        found, host_data = self._get(ip)
+        if found:
+            if host_data is None:
+                self.negative_hits += 1
+                return HostData(ip=ip)
+            self.hits += 1
+            return host_data.model_copy(deep=True)
+
+        inflight = self._inflight.get(ip)
+        if inflight is not None:
+            self.coalesced += 1
+            host_data = await asyncio.shield(inflight)
+            return host_data.model_copy(deep=True) if host_data else HostData(ip=ip)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ip] = future
+        try:
+            host_data = await loader(ip)
+            self._put(ip, host_data)
+            future.set_result(host_data)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение как полученное, чтобы asyncio не ругался,
+            # если никто не ждал этот запрос
+            future.exception()
+            raise
+        finally:
+            del self._inflight[ip]
+
+        return host_data.model_copy(deep=True) if host_data else HostData(ip=ip)
+
+    def invalidate(self, ip: Optional[str] = None):
+        """Удаляет запись по IP или очищает весь кэш."""
+        if ip is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(ip, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# Глобальный кэш данных Netbox
+host_cache = HostDataCache(
+    max_size=settings.NETBOX_CACHE_SIZE,
+    ttl=settings.NETBOX_CACHE_TTL,
+    negative_ttl=settings.NETBOX_CACHE_NEGATIVE_TTL
+)
@@ -5,13 +5,34 @@ from app.database.mongodb import get_incidents_collection
 from app.models.incident import Incident
 
 from app.websocket.manager import manager
+from app.websocket.subscriptions import TOPIC_INCIDENTS
+from app.services.pagination import SortSpec, apply_cursor, keyset_sort
+from app.services.count_service import count_cache
+from app.database.versions import write_versions
+from app.services.search_service import exact_query, rank_expression, substring_query, trigrams
 
-from pymongo import DESCENDING, ASCENDING
+from pymongo import DESCENDING, ASCENDING, IndexModel
+
+# Индексы коллекции incidents и частые запросы (см. app/database/indexes.py)
+INCIDENT_INDEXES = [
+    IndexModel([("host", ASCENDING), ("message", ASCENDING)], unique=True, name="host_message_unique"),
+    IndexModel([("last_updated", DESCENDING), ("_id", DESCENDING)], name="last_updated_id"),
+    # Триграммы текста инцидента для поиска подстроки (см. app/services/search_service.py)
+    IndexModel([("message_grams", ASCENDING)], name="message_grams"),
+]
+INCIDENT_HOT_QUERIES = [
+    {"name": "upsert_by_key", "filter": {"host": "", "message": ""}},
+    {"name": "latest", "filter": {}, "sort": [("last_updated", DESCENDING), ("_id", DESCENDING)]},
+    {"name": "search", "filter": {"message_grams": {"$all": ["abc"]}}},
+]
+
+# Поле ранга совпадения при поиске (вычисляется в запросе, не хранится)
+SEARCH_RANK = "search_rank"
 
 async def upsert_incident(incident_data: Dict) -> Incident:
     collection = get_incidents_collection()
 
-    result = collection.find_one_and_update(
+    result = await collection.find_one_and_update(
         {"host": incident_data["host"], "message": incident_data["message"]},
         {
             "$inc": {"count": 1},
@@ -19,11 +40,14 @@ async def upsert_incident(incident_data: Dict) -> Incident:
                 "last_updated": datetime.now(),
                 "location": incident_data.get("location", ""),
                 "hostname": incident_data["hostname"]
-            }
+            },
+            "$setOnInsert": {"message_grams": trigrams(incident_data["message"])}
         },
         upsert=True,
-        return_document=ReturnDocument.AFTER
+        return_document=ReturnDocument.AFTER,
+        projection={"message_grams": 0}
     )
+    write_versions.bump(collection.name)
     
     if result:
         # Convert MongoDB document to dict and handle _id
@@ -40,46 +64,44 @@ async def upsert_incident(incident_data: Dict) -> Incident:
     if 'last_updated' in incident_data and incident_data['last_updated']:
         incident_data['last_updated'] = incident_data['last_updated'].isoformat()
     
-    await manager.broadcast({
-        "type": "incident_update",
-        "data": incident_data
-    })
+    await manager.publish(TOPIC_INCIDENTS, incident_data)
 
     return new_incident
 
-def get_incidents(
-    page: int = 1,
-    per_page: int = 10,
-    latest: bool = False,
-    first_sort_key: Optional[str] = None,
-    first_sort_order: Optional[str] = None,
-    second_sort_key: Optional[str] = None,
-    second_sort_order: Optional[str] = None,
+def _build_incidents_query(
     host_filter: Optional[str] = None,
     name_filter: Optional[str] = None,
     incident_filter: Optional[str] = None
-
-) -> List[Incident]:
-    collection = get_incidents_collection()
-    skip = (page - 1) * per_page
-    cursor = collection.find()
-
-    # Создаем query для фильтрации
+) -> Dict:
     query = {}
     
     if host_filter:
-        query["host"] = {"$regex": f"^{host_filter}$", "$options": "i"}  # Точное совпадение с учетом регистра
+        query.update(exact_query("host", host_filter))  # Точное совпадение без учета регистра
     
     if name_filter:
-        query["hostname"] = {"$regex": f"^{name_filter}$", "$options": "i"}
+        query.update(exact_query("hostname", name_filter))
     
     if incident_filter:
-        query["message"] = {"$regex": incident_filter, "$options": "i"}  # Частичное совпадение
-    
-    cursor = collection.find(query)
+        query.update(substring_query("message", "message_grams", incident_filter))  # Частичное совпадение
 
-    # Сначала применяем сортировку (если есть)
+    return query
+
+def get_incidents_sort(
+    latest: bool = False,
+    first_sort_key: Optional[str] = None,
+    first_sort_order: Optional[str] = None,
+    second_sort_key: Optional[str] = None,
+    second_sort_order: Optional[str] = None,
+    incident_filter: Optional[str] = None
+) -> SortSpec:
+    """
+    Сортировка списка инцидентов; _id в конце делает порядок однозначным для курсоров.
+    При поиске без явной сортировки результаты упорядочены по рангу совпадения.
+    """
     sort_spec = []
+
+    if incident_filter and not latest and not first_sort_key and not second_sort_key:
+        return keyset_sort([(SEARCH_RANK, ASCENDING), ("last_updated", DESCENDING), ("_id", DESCENDING)])
     
     if latest:
         sort_spec.append(("last_updated", DESCENDING))
@@ -91,17 +113,61 @@ def get_incidents(
     if second_sort_key and second_sort_order:
         order = ASCENDING if second_sort_order == 'asc' else DESCENDING
         sort_spec.append((second_sort_key, order))
-    
-    if sort_spec:
-        cursor = cursor.sort(sort_spec)
-    
-    # Затем применяем пагинацию
-    if not latest:
-        cursor = cursor.skip(skip)
-    cursor = cursor.limit(per_page)
+
+    return keyset_sort(sort_spec)
+
+async def get_incidents(
+    page: int = 1,
+    per_page: int = 10,
+    latest: bool = False,
+    first_sort_key: Optional[str] = None,
+    first_sort_order: Optional[str] = None,
+    second_sort_key: Optional[str] = None,
+    second_sort_order: Optional[str] = None,
+    host_filter: Optional[str] = None,
+    name_filter: Optional[str] = None,
+    incident_filter: Optional[str] = None,
+    after: Optional[str] = None,
+    projection: Optional[dict] = None,
+    raw: bool = False
+) -> List[Incident]:
+    """
+    raw=True возвращает документы MongoDB без моделей (с _id, по нему строится
+    курсор), projection - поля документа (см. app/services/serialization.py).
+    """
+    collection = get_incidents_collection()
+    skip = (page - 1) * per_page
+
+    # Создаем query для фильтрации
+    query = _build_incidents_query(host_filter, name_filter, incident_filter)
+
+    sort_spec = get_incidents_sort(
+        latest, first_sort_key, first_sort_order, second_sort_key, second_sort_order, incident_filter
+    )
+    # Триграммы нужны только для поиска и в ответ не попадают
+    if projection is None:
+        projection = {"message_grams": 0}
+
+    if sort_spec[0][0] == SEARCH_RANK:
+        cursor = await _search_incidents(collection, query, incident_filter, sort_spec, after, skip, per_page, projection)
+    else:
+        # Курсор заменяет номер страницы: продолжаем сразу после последнего элемента
+        if after:
+            query = apply_cursor(query, sort_spec, after)
+
+        # Сначала применяем сортировку
+        cursor = collection.find(query, projection).sort(sort_spec)
+        
+        # Затем применяем пагинацию
+        if not latest and not after:
+            cursor = cursor.skip(skip)
+        cursor = cursor.limit(per_page)
+
+    if raw:
+        return [incident async for incident in cursor]
     
     result = []
-    for incident in cursor:
+    async for incident in cursor:
         incident_dict = dict(incident)
         if "_id" in incident_dict:
             incident_dict["id"] = str(incident_dict["_id"])
@@ -110,21 +176,35 @@ def get_incidents(
         
     return result
 
-def get_total_incidents_count(
+async def _search_incidents(
+    collection,
+    query: Dict,
+    incident_filter: str,
+    sort_spec: SortSpec,
+    after: Optional[str],
+    skip: int,
+    per_page: int,
+    projection: Dict
+):
+    """Результаты поиска, упорядоченные по рангу совпадения (ранг вычисляется в запросе)."""
+    pipeline = [
+        {"$match": query},
+        {"$addFields": {SEARCH_RANK: rank_expression("message", incident_filter)}},
+    ]
+    if after:
+        pipeline.append({"$match": apply_cursor({}, sort_spec, after)})
+    pipeline.append({"$sort": dict(sort_spec)})
+    if not after:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": per_page})
+    pipeline.append({"$project": projection})
+    return await collection.aggregate(pipeline)
+
+async def get_total_incidents_count(
         host_filter: Optional[str] = None,
         name_filter: Optional[str] = None,
         incident_filter: Optional[str] = None
 ) -> int:
     collection = get_incidents_collection()
-    query = {}
-    
-    if host_filter:
-        query["host"] = {"$regex": f"^{host_filter}$", "$options": "i"}
-    
-    if name_filter:
-        query["hostname"] = {"$regex": f"^{name_filter}$", "$options": "i"}
-    
-    if incident_filter:
-        query["message"] = {"$regex": incident_filter, "$options": "i"}
-                            
-    return collection.count_documents(query)
\ No newline at end of file
+    query = _build_incidents_query(host_filter, name_filter, incident_filter)
+    return await count_cache.count(collection, query)
\ No newline at end of file
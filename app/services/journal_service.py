@@ -1,9 +1,20 @@
 from app.models.messages import RawMessage
 from app.services.data_enricher import DataEnricher
 from app.services.message_service import MessageRepository
-from app.services.event_service import EventRepository
+from app.services.event_service import EventRepository, active_events
+from app.services.template_miner import template_miner
+from app.services.analytics_service import DIMENSIONS, heavy_hitters
+from app.services.rollup_service import rollup_gaps
+from app.services.anomaly_service import SCOPE_EVENT, AnomalyChange, anomaly_detector
 from app.models.messages import Message
 from app.models.events import Event, HostData
+from app.config import settings
+from app.websocket.manager import manager
+from app.websocket.subscriptions import TOPIC_EVENTS
+from datetime import datetime
+from collections import Counter
+from typing import List, Optional, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,6 +24,26 @@ class JournalService:
         self.data_enricher = DataEnricher()
         self.message_repo = MessageRepository()
         self.event_repo = EventRepository()
+        self._anomaly_sweeper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Подготавливает сервис к приему сообщений (загрузка инвентаря Netbox и шаблонов событий)."""
+        await self.data_enricher.start()
+        await template_miner.start()
+        if settings.EVENT_WRITE_BEHIND_ENABLED:
+            active_events.start()
+        if settings.ANOMALY_ENABLED and self._anomaly_sweeper is None:
+            self._anomaly_sweeper = asyncio.create_task(self._sweep_anomalies(), name="anomaly-sweep")
+
+    async def stop(self):
+        if self._anomaly_sweeper is not None:
+            self._anomaly_sweeper.cancel()
+            await asyncio.gather(self._anomaly_sweeper, return_exceptions=True)
+            self._anomaly_sweeper = None
+        # Сначала дописываются накопленные счетчики событий
+        await active_events.stop()
+        await template_miner.stop()
+        await self.data_enricher.stop()
 
     async def handle(self, raw_message: RawMessage) -> Event:
         try:
@@ -22,13 +53,20 @@ class JournalService:
             host_data = await self.get_host_data(raw_message)
             logger.debug(f"Host data retrieved: {host_data}")
             
-            # Создаем сообщение
-            message = await self.create_message(raw_message)
-            logger.debug(f"Message created: {message}")
-            
-            # Создаем или обновляем событие
+            # Создаем или обновляем событие (один атомарный запрос)
+            message = Message(text=raw_message.text)
             event = await self.create_event(host_data, message)
             logger.info(f"Event processed: {event}")
+
+            # Сохраняем сообщение сразу со ссылкой на событие
+            self.link_message(message, event)
+            message = await self.create_message(message)
+            logger.debug(f"Message created: {message}")
+
+            await self.update_rollups([(message.created_at, message.services)])
+            await self.publish_events([event])
+            await self.analyze([event])
+            await self.detect_anomalies([event])
             
             return event
             
@@ -36,6 +74,43 @@ class JournalService:
             logger.error(f"Failed to process message: {str(e)}")
             raise
     
+    async def handle_batch(self, raw_messages: List[RawMessage]) -> List[Event]:
+        """
+        Обрабатывает пачку сообщений: события обновляются одним bulk_write,
+        сообщения (уже со ссылкой на событие) вставляются одним insert_many.
+        """
+        try:
+            logger.info(f"Processing batch of {len(raw_messages)} messages")
+
+            # Данные о хостах запрашиваем один раз на каждый IP в пачке
+            by_ip = {raw_message.ip: raw_message for raw_message in raw_messages}
+            host_data_list = await asyncio.gather(
+                *(self.get_host_data(raw_message) for raw_message in by_ip.values())
+            )
+            host_data_by_ip = dict(zip(by_ip, host_data_list))
+
+            messages = [Message(text=raw_message.text) for raw_message in raw_messages]
+            events = await self.event_repo.upsert_many([
+                (host_data_by_ip[raw_message.ip], message)
+                for raw_message, message in zip(raw_messages, messages)
+            ])
+
+            for message, event in zip(messages, events):
+                self.link_message(message, event)
+            await self.message_repo.create_many(messages)
+
+            await self.update_rollups([(message.created_at, message.services) for message in messages])
+            await self.publish_events(events)
+            await self.analyze(events)
+            await self.detect_anomalies(events)
+
+            logger.info(f"Batch processed: {len(messages)} messages, {len(set(e.id for e in events))} events")
+            return events
+
+        except Exception as e:
+            logger.error(f"Failed to process batch: {str(e)}")
+            raise
+
     async def get_host_data(self, raw_message: RawMessage) -> HostData:
         try:
             host_data: HostData = await self.data_enricher.enriche(raw_message)
@@ -45,15 +120,45 @@ class JournalService:
             # Возвращаем минимальные данные, если обогащение не удалось
             return HostData(ip=raw_message.ip)
 
-    async def create_message(self, raw_message: RawMessage) -> Message:
+    async def create_message(self, message_data: Message) -> Message:
         try:
-            message_data = Message(text=raw_message.text)
             message: Message = await self.message_repo.create(message_data)
             return message
         except Exception as e:
             logger.error(f"Error creating message: {str(e)}")
             raise
 
+    def link_message(self, message: Message, event: Event):
+        """Связывает сообщение с событием и копирует в него поля события для фильтрации."""
+        message.event_id = event.id
+        message.ip = event.ip
+        message.services = list(event.services)
+        message.event_status = event.status
+
+    async def update_rollups(self, items: List[Tuple[datetime, List[str]]]):
+        """
+        Обновляет поминутные счетчики сообщений. Ошибка не прерывает обработку:
+        минуты с незаписанными счетчиками считаются по сообщениям, а после
+        следующей успешной записи пересчитываются (см. RollupGaps).
+        """
+        if not settings.MESSAGE_ROLLUPS_ENABLED:
+            return
+        try:
+            await self.message_repo.rollup_repo.increment(items)
+            if rollup_gaps.minutes:
+                await self.message_repo.repair_rollups()
+        except Exception as e:
+            logger.error(f"Error updating message rollups: {str(e)}")
+
+    async def publish_events(self, events: List[Event]):
+        """Отправляет подписчикам WebSocket обновленные события (последнее состояние каждого)."""
+        # События получают только подписчики: без них не тратим время на model_dump
+        if not manager.subscriptions:
+            return
+        latest = {event.id: event for event in events}
+        for event in latest.values():
+            await manager.publish(TOPIC_EVENTS, event.model_dump())
+
     async def create_event(self, host_data: HostData, message: Message) -> Event:
         try:
             event = await self.event_repo.upsert(host_data, message)
@@ -62,8 +167,56 @@ class JournalService:
             logger.error(f"Error creating/updating event: {str(e)}")
             raise
 
-    async def analyze(self):
-        pass
-        '''
-            TODO
-        '''
\ No newline at end of file
+    async def analyze(self, events: List[Event]):
+        """
+        Учитывает сообщения в скетчах самых частых значений (/analytics/top).
+        events - события принятых сообщений, по одному на сообщение.
+        """
+        if not settings.ANALYTICS_ENABLED or not events:
+            return
+        values = {dimension: Counter() for dimension in DIMENSIONS}
+        for event in events:
+            values["host"][event.ip] += 1
+            values["template"][event.name] += 1
+            if event.location:
+                values["location"][event.location] += 1
+            for service in set(event.services):
+                values["service"][service] += 1
+        heavy_hitters.record(len(events), values)
+
+    async def detect_anomalies(self, events: List[Event]):
+        """
+        Обновляет детектор всплесков и мигания. Изменившиеся отметки сохраняются
+        в событиях и рассылаются по WebSocket. Ошибка не прерывает обработку.
+        """
+        if not settings.ANOMALY_ENABLED or not events:
+            return
+        changes = anomaly_detector.observe((event.id, event.status, event.services) for event in events)
+        await self.apply_anomalies(changes)
+
+    async def _sweep_anomalies(self):
+        """
+        Перепроверка отметок по таймеру: всплеск снимается и простаивающие
+        ключи удаляются, даже если сообщения перестали приходить.
+        """
+        while True:
+            await asyncio.sleep(settings.ANOMALY_CHECK_INTERVAL)
+            try:
+                await self.apply_anomalies(anomaly_detector.sweep())
+            except Exception as e:
+                logger.error(f"Error sweeping anomaly markers: {str(e)}")
+
+    async def apply_anomalies(self, changes: List[AnomalyChange]):
+        for change in changes:
+            try:
+                await self.apply_anomaly(change)
+            except Exception as e:
+                logger.error(f"Error applying anomaly marker {change}: {str(e)}")
+
+    async def apply_anomaly(self, change: AnomalyChange):
+        await manager.broadcast({"type": "anomaly", **change._asdict()})
+        if change.scope != SCOPE_EVENT:
+            return
+        event = await self.event_repo.set_markers(change.key, {change.kind: change.active})
+        if event is not None:
+            await manager.publish(TOPIC_EVENTS, event.model_dump())
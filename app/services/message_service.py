@@ -1,28 +1,198 @@
 from app.services.repository_service import BaseRepository
-from app.database.mongodb import get_messages_collection
+from app.database.mongodb import get_messages_collection, STORAGE_MONTHLY
+from app.database.partitions import MessagePartitions, partition_name
+from app.services.pagination import apply_cursor
+from app.services.count_service import count_cache
 from app.models.messages import Message
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from app.services.rollup_service import MessageRollupRepository, ALL_SERVICES, EPOCH, ceil_minute, floor_minute, rollup_gaps
+from app.config import settings
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 from typing import Literal, Optional,List,Dict
+from pymongo.asynchronous.collection import AsyncCollection
+import asyncio
 
 class MessageRepository(BaseRepository):
+    indexes = [
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="updated_at_id"),
+        IndexModel([("event_id", ASCENDING)], name="event_id"),
+        IndexModel([("services", ASCENDING), ("created_at", ASCENDING)], name="services_created_at"),
+    ]
+    hot_queries = [
+        {"name": "list", "filter": {}, "sort": BaseRepository.sort},
+        {"name": "by_time_range", "filter": {"created_at": {"$gte": datetime(1970, 1, 1)}}},
+        {"name": "by_event", "filter": {"event_id": ObjectId("000000000000000000000000")}},
+        {"name": "by_service_time_range", "filter": {"services": "", "created_at": {"$gte": datetime(1970, 1, 1)}}},
+    ]
+
     def __init__(self):
-        super().__init__(get_messages_collection(), Message)
+        super().__init__(get_messages_collection, Message)
+        self.rollup_repo = MessageRollupRepository()
+
+    @property
+    def partitioned(self) -> bool:
+        return settings.MESSAGES_STORAGE == STORAGE_MONTHLY
+
+    async def _collections_for_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[AsyncCollection]:
+        """В режиме monthly - только партиции, пересекающиеся с периодом."""
+        if not self.partitioned:
+            return [self.collection]
+        return await message_partitions.for_range(start, end)
+
+    async def _collections_for_id(self, id: ObjectId) -> List[AsyncCollection]:
+        if not self.partitioned:
+            return [self.collection]
+        # _id создается вместе с сообщением, поэтому сначала проверяем партиции
+        # рядом с его временем (created_at - локальное время, отсюда запас в сутки),
+        # затем остальные - поиск по _id в каждой идет по индексу
+        created_at = id.generation_time.replace(tzinfo=None)
+        likely = await message_partitions.for_range(
+            created_at - timedelta(days=1), created_at + timedelta(days=1)
+        )
+        names = {collection.name for collection in likely}
+        rest = [c for c in await message_partitions.for_range() if c.name not in names]
+        return likely + rest
+
+    async def create(self, item: Message) -> Message:
+        if not self.partitioned:
+            return await super().create(item)
+        collection = await message_partitions.for_write(item.created_at)
+        res = await collection.insert_one(self._to_document(item))
+        self._mark_written(collection)
+        item.id = str(res.inserted_id)
+        return item
+
+    async def create_many(self, items: List[Message]) -> List[Message]:
+        if not self.partitioned or not items:
+            return await super().create_many(items)
+        # Пачка может попасть на границу месяца - вставляем по партициям
+        by_partition: Dict[str, List[Message]] = {}
+        for item in items:
+            by_partition.setdefault(partition_name(item.created_at), []).append(item)
+        for partition_items in by_partition.values():
+            collection = await message_partitions.for_write(partition_items[0].created_at)
+            res = await collection.insert_many(
+                [self._to_document(item) for item in partition_items],
+                ordered=False
+            )
+            self._mark_written(collection)
+            for item, inserted_id in zip(partition_items, res.inserted_ids):
+                item.id = str(inserted_id)
+        return items
+
+    async def get_list(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        text_search: Optional[str] = None,
+        after: Optional[str] = None,
+        projection: Optional[dict] = None,
+        raw: bool = False,
+        **filters
+    ) -> List[Message]:
+        """
+        В режиме monthly партиции читаются от новых к старым, пока не наберется
+        страница: сообщения не изменяются после записи, поэтому порядок
+        по updated_at совпадает с порядком партиций.
+        """
+        if not self.partitioned:
+            return await super().get_list(skip, limit, text_search, after, projection, raw, **filters)
+
+        query = self._build_list_query(text_search, filters)
+        if after:
+            query = apply_cursor(query, self.sort, after)
+            skip = 0
+
+        items = []
+        for collection in await self._collections_for_range():
+            if skip:
+                # Партиции целиком до нужной страницы пропускаем по числу документов
+                total = await count_cache.count(collection, query)
+                if total <= skip:
+                    skip -= total
+                    continue
+            cursor = collection.find(query, projection).sort(self.sort).skip(skip).limit(limit - len(items))
+            items.extend(await self._load(cursor, raw))
+            skip = 0
+            if len(items) >= limit:
+                break
+        return items
+
+    async def get_by_time_period(
+        self,
+        time_field: str = "created_at",
+        hours: Optional[int] = None,
+        days: Optional[int] = None,
+        minutes: Optional[int] = None,
+        sort_desc: bool = True,
+        **filters
+    ) -> List[Message]:
+        if not self.partitioned:
+            return await super().get_by_time_period(time_field, hours, days, minutes, sort_desc, **filters)
+
+        start_time = self._period_start(hours, days, minutes)
+        if start_time is None:
+            return []
+        query = {**filters, time_field: {"$gte": start_time}}
+
+        # Партиции отбираются по created_at; для других полей читаем все
+        collections = await self._collections_for_range(
+            start_time if time_field == "created_at" else None
+        )
+        if not sort_desc:
+            collections.reverse()
+
+        sort_order = -1 if sort_desc else 1
+        items = []
+        for collection in collections:
+            cursor = collection.find(query).sort(time_field, sort_order)
+            items.extend([self.model(**item) async for item in cursor])
+        if time_field != "created_at":
+            items.sort(key=lambda item: getattr(item, time_field), reverse=sort_desc)
+        return items
+
+    async def get_count(self, **filters) -> int:
+        if not self.partitioned:
+            return await super().get_count(**filters)
+        query = {field: value for field, value in filters.items() if value is not None}
+        counts = await asyncio.gather(*[
+            count_cache.count(collection, query)
+            for collection in await self._collections_for_range()
+        ])
+        return sum(counts)
+
+    def _to_document(self, item: Message) -> dict:
+        document = super()._to_document(item)
+        # Ссылка на событие хранится как ObjectId
+        if document.get("event_id"):
+            document["event_id"] = ObjectId(document["event_id"])
+        return document
     
 
-    def update_message_event_reference(
+    async def update_message_event_reference(
         self, 
         message_id: str, 
         event_id: str
     ):
-        self.collection.find_one_and_update(
-            {"_id": ObjectId(message_id)},
-            {
-                "$set": {
-                    "event_id": ObjectId(event_id)
+        for collection in await self._collections_for_id(ObjectId(message_id)):
+            result = await collection.update_one(
+                {"_id": ObjectId(message_id)},
+                {
+                    "$set": {
+                        "event_id": ObjectId(event_id)
+                    }
                 }
-            }
-        )
+            )
+            if result.matched_count:
+                self._mark_written(collection)
+                break
     
     async def get_messages_count_by_time(
         self,
@@ -40,7 +210,7 @@ class MessageRepository(BaseRepository):
             interval: Интервал группировки (например, "5m" - каждые 5 минут)
             start_time: Начальная дата/время (если не указано, вычисляется из time_range)
             end_time: Конечная дата/время (по умолчанию текущее время)
-            service: Фильтрация по полю service в events
+            service: Фильтрация по сервису события (поле services сообщения)
             
         Returns:
             Список словарей с ключами "timestamp" и "count"
@@ -65,6 +235,13 @@ class MessageRepository(BaseRepository):
                 raise ValueError(f"Unknown time unit: {time_unit}")
                 
             start_time = end_time - delta
+
+        # MongoDB сравнивает даты в UTC: приводим aware-даты к naive UTC,
+        # как это делает драйвер, чтобы их можно было сравнивать между собой
+        if start_time.tzinfo is not None:
+            start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+        if end_time.tzinfo is not None:
+            end_time = end_time.astimezone(timezone.utc).replace(tzinfo=None)
             
         # Парсим интервал
         interval_value = int(interval[:-1])
@@ -77,71 +254,124 @@ class MessageRepository(BaseRepository):
         else:
             raise ValueError(f"Unknown interval unit: {interval_unit}")
         
-        print("SERVICE: ", service)
+        interval_ms = interval_seconds * 1000
+
+        if not settings.MESSAGE_ROLLUPS_ENABLED:
+            counts = await self._count_raw(start_time, end_time, interval_ms, service)
+            return self._format_counts(counts)
+
+        # Полные минуты берем из поминутных счетчиков, а неполные минуты
+        # на краях диапазона (и период до появления счетчиков) - из сообщений
+        rollups_since = await self.rollup_repo.complete_since()
+        rollup_start = ceil_minute(start_time)
+        if rollups_since is not None:
+            rollup_start = max(rollup_start, rollups_since)
+        rollup_end = floor_minute(end_time)
+
+        if rollups_since is None or rollup_start >= rollup_end:
+            counts = await self._count_raw(start_time, end_time, interval_ms, service)
+            return self._format_counts(counts)
+
+        counts = await self.rollup_repo.get_counts(rollup_start, rollup_end, interval_ms, service)
+        edges = [
+            self._count_raw(start_time, rollup_start, interval_ms, service, include_end=False),
+            self._count_raw(rollup_end, end_time, interval_ms, service),
+        ]
+        # Минуты, счетчики которых не удалось записать, тоже считаем по сообщениям
+        edges.extend(
+            self._count_raw(gap_start, gap_end, interval_ms, service, include_end=False)
+            for gap_start, gap_end in rollup_gaps.within(rollup_start, rollup_end)
+        )
+        for edge_counts in await asyncio.gather(*edges):
+            for key, count in edge_counts.items():
+                counts[key] = counts.get(key, 0) + count
+
+        return self._format_counts(counts)
+
+    async def repair_rollups(self):
+        """
+        Пересчитывает из сообщений закончившиеся минуты, поминутные счетчики
+        которых не удалось записать. Ошибка оставляет минуту до следующей попытки.
+        """
+        if rollup_gaps.repairing:
+            return
+        rollup_gaps.repairing = True
+        try:
+            for minute in rollup_gaps.closed(datetime.now()):
+                end = minute + timedelta(minutes=1)
+                counts: Counter = Counter()
+                query = {"created_at": {"$gte": minute, "$lt": end}}
+                for collection in await self._collections_for_range(minute, end):
+                    async for item in collection.find(query, {"services": 1, "_id": 0}):
+                        counts[ALL_SERVICES] += 1
+                        for service in set(item.get("services") or []):
+                            counts[service] += 1
+                if counts:
+                    await self.rollup_repo.overwrite(minute, counts)
+                rollup_gaps.resolve(minute)
+        finally:
+            rollup_gaps.repairing = False
+
+    def _format_counts(self, counts: Dict[int, int]) -> List[Dict]:
+        return [
+            {"timestamp": EPOCH + timedelta(milliseconds=key), "count": counts[key]}
+            for key in sorted(counts)
+        ]
+
+    async def _count_raw(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        interval_ms: int,
+        service: Optional[str] = None,
+        include_end: bool = True
+    ) -> Dict[int, int]:
+        """Считает сообщения в диапазоне по исходной коллекции, группируя по интервалам."""
+        if start_time > end_time or (start_time == end_time and not include_end):
+            return {}
+
         # Создаем агрегационный pipeline
         pipeline = [
             {
                 "$match": {
                     "created_at": {
                         "$gte": start_time,
-                        "$lte": end_time
+                        "$lte" if include_end else "$lt": end_time
                     }
                 }
             }
         ]
         
         if service:
-            pipeline.extend([
-                {
-                    "$lookup": {
-                        "from": "events",
-                        "localField": "event_id",
-                        "foreignField": "_id",
-                        "as": "event_data"
-                    }
-                },
-                {
-                    "$unwind": "$event_data"  # Разворачиваем массив в объект
-                },
-                {
-                    "$match": {
-                        "event_data.services": service
-                    }
-                },
-                {
-                    "$unset": "event_data"  # Удаляем временное поле
-                }
-            ])
+            # Сервисы события хранятся в самом сообщении (см. app/migrations/denormalize_messages.py)
+            pipeline[0]["$match"]["services"] = service
 
-        pipeline.extend([
+        pipeline.append(
             {
                 "$group": {
                     "_id": {
                         "$subtract": [
                             {"$toLong": "$created_at"},
-                            {"$mod": [{"$toLong": "$created_at"}, interval_seconds * 1000]}
+                            {"$mod": [{"$toLong": "$created_at"}, interval_ms]}
                         ]
                     },
                     "count": {"$sum": 1}
                 }
-            },
-            {
-                "$sort": {"_id": 1}
-            },
-            {
-                "$project": {
-                    "timestamp": {
-                        "$toDate": "$_id"
-                    },
-                    "count": 1,
-                    "_id": 0
-                }
             }
-        ])
+        )
 
-        
-        # Выполняем запрос
-        cursor = self.collection.aggregate(pipeline)
-        results = cursor.to_list(length=None)
-        
-        return results
\ No newline at end of file
+        # Выполняем запрос по каждой коллекции, пересекающейся с диапазоном
+        async def aggregate(collection: AsyncCollection) -> Dict[int, int]:
+            cursor = await collection.aggregate(pipeline)
+            return {item["_id"]: item["count"] async for item in cursor}
+
+        counts: Dict[int, int] = {}
+        collections = await self._collections_for_range(start_time, end_time)
+        for partial in await asyncio.gather(*[aggregate(c) for c in collections]):
+            for key, count in partial.items():
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+
+# Партиции сообщений общие для всех экземпляров репозитория
+message_partitions = MessagePartitions(MessageRepository.indexes)
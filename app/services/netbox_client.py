@@ -0,0 +1,196 @@
+from app.config import settings
+from collections import deque
+from typing import AsyncIterator, Optional
+import asyncio
+import logging
+import time
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class NetboxError(Exception):
+    """Ошибка запроса к Netbox (таймаут, сетевая ошибка, 5xx)."""
+
+
+class CircuitOpenError(NetboxError):
+    """Netbox временно не опрашивается после серии ошибок."""
+
+
+class CircuitBreaker:
+    """
+    Простой предохранитель: после threshold ошибок подряд размыкается
+    на reset_timeout секунд, затем пропускает один пробный запрос.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Пропускаем один пробный запрос, остальные ждут его результата
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+
+class LatencyStats:
+    """Счетчики и перцентили задержки по последним запросам."""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def observe(self, elapsed: float):
+        self.requests += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.samples.append(elapsed)
+
+    def _percentile(self, ordered: list, p: float) -> Optional[float]:
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(len(ordered) * p))
+        return round(ordered[index] * 1000, 2)
+
+    def stats(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_time / self.requests * 1000, 2) if self.requests else None,
+            "max_ms": round(self.max_time * 1000, 2),
+            "p50_ms": self._percentile(ordered, 0.50),
+            "p95_ms": self._percentile(ordered, 0.95),
+            "p99_ms": self._percentile(ordered, 0.99),
+        }
+
+
+class NetboxClient:
+    """
+    Асинхронный клиент REST API Netbox на общей keep-alive сессии aiohttp.
+
+    Сессия создается при первом запросе в том event loop, где работает клиент.
+    """
+
+    def __init__(self):
+        self.base_url = settings.NETBOX_URL.rstrip("/")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.breaker = CircuitBreaker(
+            threshold=settings.NETBOX_BREAKER_THRESHOLD,
+            reset_timeout=settings.NETBOX_BREAKER_RESET_TIMEOUT
+        )
+        self.latency = LatencyStats()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.NETBOX_POOL_SIZE,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Token {settings.NETBOX_TOKEN}",
+                    "Accept": "application/json"
+                }
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, path: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        GET-запрос к API Netbox. Возвращает JSON или None для 400/404.
+        Таймауты, сетевые ошибки и 5xx учитываются предохранителем.
+        """
+        if not self.breaker.allow():
+            self.latency.rejected += 1
+            raise CircuitOpenError("Netbox circuit breaker is open")
+
+        url = path if path.startswith("http") else f"{self.base_url}/api/{path.lstrip('/')}"
+        request_timeout = aiohttp.ClientTimeout(total=timeout or settings.NETBOX_TIMEOUT)
+        started = time.monotonic()
+
+        try:
+            async with self._get_session().get(url, params=params, timeout=request_timeout) as response:
+                if response.status in (400, 404):
+                    # Некорректный или отсутствующий объект - это "не найден", а не сбой
+                    data = None
+                elif response.status >= 400:
+                    raise NetboxError(f"Netbox responded {response.status} for {url}")
+                else:
+                    data = await response.json()
+        except asyncio.TimeoutError:
+            self.latency.timeouts += 1
+            self.breaker.record_failure()
+            raise NetboxError(f"Netbox request timed out: {url}")
+        except (aiohttp.ClientError, NetboxError) as e:
+            self.latency.errors += 1
+            self.breaker.record_failure()
+            raise NetboxError(str(e)) from e
+        finally:
+            self.latency.observe(time.monotonic() - started)
+
+        self.breaker.record_success()
+        return data
+
+    async def iter_all(self, path: str, params: Optional[dict] = None) -> AsyncIterator[dict]:
+        """Постранично перебирает все объекты списка (ссылка next из ответа Netbox)."""
+        params = {**(params or {}), "limit": settings.NETBOX_PAGE_SIZE}
+        next_url: Optional[str] = path
+
+        while next_url:
+            page = await self.get(next_url, params=params, timeout=settings.NETBOX_BULK_TIMEOUT)
+            if not page:
+                return
+            for item in page.get("results", []):
+                yield item
+            next_url = page.get("next")
+            # Параметры уже содержатся в ссылке next
+            params = None
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+            **self.latency.stats()
+        }
+
+
+# Глобальный клиент Netbox
+netbox_client = NetboxClient()
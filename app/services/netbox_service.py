@@ -1,11 +1,245 @@
 from app.config import settings
-import pynetbox
+from app.models.events import HostData
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import time
+from app.services.netbox_client import netbox_client
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceInfo(NamedTuple):
+    hostname: Optional[str]
+    model: Optional[str]
+    role: Optional[str]
+    location: Optional[str]
+    services: Tuple[str, ...]
+
+
+class NetboxInventory:
+    """
+    Индекс инвентаря Netbox в памяти: IP -> устройство.
+
+    Словари заменяются целиком при полной загрузке и обновляются
+    точечно при инкрементальной, поэтому чтение не требует блокировок.
+    """
+
+    def __init__(self):
+        self.devices: Dict[int, DeviceInfo] = {}
+        self.ip_to_device: Dict[str, int] = {}
+        # Максимальный last_updated среди загруженных объектов (время Netbox)
+        self.devices_updated_since: Optional[str] = None
+        self.ips_updated_since: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self.refreshed_at: Optional[datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def lookup(self, ip: str) -> Optional[HostData]:
+        device_id = self.ip_to_device.get(ip)
+        if device_id is None:
+            return None
+        device = self.devices.get(device_id)
+        if device is None:
+            return None
+        return HostData(
+            ip=ip,
+            hostname=device.hostname,
+            model=device.model,
+            role=device.role,
+            location=device.location,
+            services=list(device.services)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "devices": len(self.devices),
+            "ip_addresses": len(self.ip_to_device),
+            "loaded_at": self.loaded_at,
+            "refreshed_at": self.refreshed_at,
+        }
+
+
+def _known(value: Optional[str]) -> Optional[str]:
+    return value if value and value != "unknown" else None
+
+
+def _name(obj: Optional[dict], key: str = "name") -> Optional[str]:
+    return _known(obj.get(key)) if obj else None
+
+
+def _device_info(device: dict) -> DeviceInfo:
+    # В Netbox < 4.0 роль устройства называется device_role
+    role = device.get("role") or device.get("device_role")
+    return DeviceInfo(
+        hostname=device.get("name"),
+        model=_name(device.get("device_type"), "model"),
+        role=_name(role),
+        location=_name(device.get("site")),
+        services=tuple(tag["name"] for tag in device.get("tags") or [])
+    )
+
+
+def _ip_device_id(ip_address: dict) -> Optional[int]:
+    assigned = ip_address.get("assigned_object")
+    device = assigned.get("device") if assigned else None
+    return device["id"] if device else None
+
+
+def _strip_prefix(address: str) -> str:
+    # В Netbox адрес хранится с маской: 10.0.0.1/24
+    return address.split("/", 1)[0]
+
+
+def _max_updated(current: Optional[str], record: dict) -> Optional[str]:
+    value = record.get("last_updated")
+    if value and (current is None or value > current):
+        return value
+    return current
+
 
 class NetboxService:
     def __init__(self):
-        self.nb = pynetbox.api(
-            settings.NETBOX_URL,
-            token=settings.NETBOX_TOKEN
+        self.client = netbox_client
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_host_data(self, ip: str) -> Optional[HostData]:
+        """
+        Запрашивает данные хоста по IP. Возвращает None, если хост не найден.
+        Netbox REST не отдает IP вместе с полным устройством, поэтому запросов два,
+        но оба идут по одной keep-alive сессии.
+        """
+        ip_page = await self.client.get("ipam/ip-addresses/", params={"address": ip})
+        results = ip_page.get("results", []) if ip_page else []
+        device_id = _ip_device_id(results[0]) if results else None
+        if device_id is None:
+            return None
+
+        device = await self.client.get(f"dcim/devices/{device_id}/")
+        if not device:
+            return None
+
+        info = _device_info(device)
+        return HostData(
+            ip=ip,
+            hostname=info.hostname,
+            model=info.model,
+            role=info.role,
+            location=info.location,
+            services=list(info.services)
         )
-    
 
+    async def _load_full(self) -> NetboxInventory:
+        """Полная постраничная загрузка устройств и IP-адресов."""
+        index = NetboxInventory()
+
+        async for device in self.client.iter_all("dcim/devices/"):
+            index.devices[device["id"]] = _device_info(device)
+            index.devices_updated_since = _max_updated(index.devices_updated_since, device)
+
+        async for ip_address in self.client.iter_all("ipam/ip-addresses/"):
+            device_id = _ip_device_id(ip_address)
+            if device_id is not None:
+                index.ip_to_device[_strip_prefix(ip_address["address"])] = device_id
+            index.ips_updated_since = _max_updated(index.ips_updated_since, ip_address)
+
+        index.loaded_at = index.refreshed_at = datetime.now()
+        return index
+
+    async def _load_changes(self, index: NetboxInventory) -> Tuple[List[dict], List[dict]]:
+        """Загружает только объекты, измененные после последнего обновления."""
+        devices = []
+        if index.devices_updated_since:
+            devices = [
+                device async for device in self.client.iter_all(
+                    "dcim/devices/", {"last_updated__gte": index.devices_updated_since}
+                )
+            ]
+
+        ip_addresses = []
+        if index.ips_updated_since:
+            ip_addresses = [
+                ip_address async for ip_address in self.client.iter_all(
+                    "ipam/ip-addresses/", {"last_updated__gte": index.ips_updated_since}
+                )
+            ]
+
+        return devices, ip_addresses
+
+    async def load_inventory(self):
+        """Загружает весь инвентарь и заменяет индекс."""
+        started = time.monotonic()
+        index = await self._load_full()
+
+        inventory.devices = index.devices
+        inventory.ip_to_device = index.ip_to_device
+        inventory.devices_updated_since = index.devices_updated_since
+        inventory.ips_updated_since = index.ips_updated_since
+        inventory.loaded_at = index.loaded_at
+        inventory.refreshed_at = index.refreshed_at
+
+        logger.info(
+            f"Инвентарь Netbox загружен: {len(index.devices)} устройств, "
+            f"{len(index.ip_to_device)} IP за {time.monotonic() - started:.1f}с"
+        )
+
+    async def refresh_inventory(self):
+        """Применяет к индексу изменения, сделанные в Netbox с прошлого обновления."""
+        devices, ip_addresses = await self._load_changes(inventory)
+
+        for device in devices:
+            inventory.devices[device["id"]] = _device_info(device)
+            inventory.devices_updated_since = _max_updated(inventory.devices_updated_since, device)
+
+        for ip_address in ip_addresses:
+            ip = _strip_prefix(ip_address["address"])
+            device_id = _ip_device_id(ip_address)
+            if device_id is None:
+                # Адрес сняли с устройства
+                inventory.ip_to_device.pop(ip, None)
+            else:
+                inventory.ip_to_device[ip] = device_id
+            inventory.ips_updated_since = _max_updated(inventory.ips_updated_since, ip_address)
+
+        inventory.refreshed_at = datetime.now()
+        if devices or ip_addresses:
+            logger.info(f"Инвентарь Netbox обновлен: {len(devices)} устройств, {len(ip_addresses)} IP")
+
+    async def _refresh_loop(self):
+        last_full_load = time.monotonic()
+        while True:
+            await asyncio.sleep(settings.NETBOX_REFRESH_INTERVAL)
+            try:
+                # Удаленные объекты видны только при полной загрузке
+                full_reload_due = time.monotonic() - last_full_load >= settings.NETBOX_FULL_RELOAD_INTERVAL
+                if not inventory.loaded or full_reload_due:
+                    await self.load_inventory()
+                    last_full_load = time.monotonic()
+                else:
+                    await self.refresh_inventory()
+            except Exception as e:
+                logger.error(f"Ошибка обновления инвентаря Netbox: {e}")
+
+    async def start(self):
+        """Загружает инвентарь и запускает фоновое обновление."""
+        try:
+            await self.load_inventory()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить инвентарь Netbox, используются запросы по IP: {e}")
+        self._refresh_task = asyncio.create_task(self._refresh_loop(), name="netbox-refresh")
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        await self.client.close()
+
+
+# Глобальный индекс инвентаря Netbox
+inventory = NetboxInventory()
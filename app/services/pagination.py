@@ -0,0 +1,76 @@
+import base64
+from typing import Any, List, Optional, Sequence, Tuple
+
+from bson import ObjectId, json_util
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING
+
+SortSpec = List[Tuple[str, int]]
+
+
+def keyset_sort(sort_spec: Sequence[Tuple[str, int]]) -> SortSpec:
+    """Добавляет _id в конец сортировки, чтобы порядок был однозначным."""
+    sort = list(sort_spec)
+    if not any(key == "_id" for key, _ in sort):
+        direction = sort[-1][1] if sort else ASCENDING
+        sort.append(("_id", direction))
+    return sort
+
+
+def _item_value(item: Any, key: str) -> Any:
+    if isinstance(item, BaseModel):
+        if key == "_id":
+            return ObjectId(item.id)
+        return getattr(item, key, None)
+    return item.get(key)
+
+
+def encode_cursor(item: Any, sort: SortSpec) -> str:
+    """Кодирует значения ключей сортировки последнего элемента страницы в непрозрачный токен."""
+    payload = {
+        "k": [key for key, _ in sort],
+        "v": [_item_value(item, key) for key, _ in sort],
+    }
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: SortSpec) -> List[Any]:
+    """Раскодирует токен. Бросает ValueError, если токен поврежден или от другой сортировки."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        keys, values = payload["k"], payload["v"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    if keys != [key for key, _ in sort] or len(values) != len(keys):
+        raise ValueError("Cursor does not match the requested sort order")
+    return values
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> dict:
+    """
+    Условие "строго после курсора" для составной сортировки:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    branches = []
+    for i, (key, direction) in enumerate(sort):
+        branch = {prev_key: values[j] for j, (prev_key, _) in enumerate(sort[:i])}
+        branch[key] = {"$lt" if direction == DESCENDING else "$gt": values[i]}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+def apply_cursor(query: dict, sort: SortSpec, cursor: Optional[str]) -> dict:
+    """Добавляет к запросу условие keyset-пагинации, если передан курсор."""
+    if not cursor:
+        return query
+    condition = keyset_filter(sort, decode_cursor(cursor, sort))
+    return {"$and": [query, condition]} if query else condition
+
+
+def next_cursor(items: List[Any], limit: int, sort: SortSpec) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя."""
+    if len(items) < limit or not items:
+        return None
+    return encode_cursor(items[-1], sort)
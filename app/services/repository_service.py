@@ -1,33 +1,144 @@
-from typing import Optional, List, Type, TypeVar
+from typing import AsyncIterator, Callable, Optional, List, Tuple, Type, TypeVar
 from bson import ObjectId
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from pymongo.collection import Collection
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from app.services.pagination import apply_cursor, keyset_sort, next_cursor
+from app.services.count_service import count_cache
+from app.services.serialization import model_fields, parse_fields
+from app.database.versions import write_versions
 
 T = TypeVar('T', bound=BaseModel)
 
 class BaseRepository:
-    def __init__(self, collection: Collection, model: Type[T]):
-        self.collection = collection
+    # Индексы коллекции и частые запросы для проверки explain()
+    # (сверяются при старте, см. app/database/indexes.py)
+    indexes: List[IndexModel] = []
+    hot_queries: List[dict] = []
+    # Сортировка списков; _id добавляется для однозначной keyset-пагинации
+    sort: List[Tuple[str, int]] = keyset_sort([("updated_at", DESCENDING)])
+
+    def __init__(self, get_collection: Callable[[], AsyncCollection], model: Type[T]):
+        # Коллекция берется при каждом обращении: клиент MongoDB
+        # открывается в lifespan, уже после создания репозиториев
+        self._get_collection = get_collection
         self.model = model
+
+    @property
+    def collection(self) -> AsyncCollection:
+        return self._get_collection()
+
+    def _mark_written(self, collection: Optional[AsyncCollection] = None):
+        """Сообщает кэшам, что данные коллекции изменились."""
+        write_versions.bump((collection if collection is not None else self.collection).name)
+
+    async def _collections_for_id(self, id: ObjectId) -> List[AsyncCollection]:
+        """Коллекции, в которых может лежать документ с этим _id."""
+        return [self.collection]
+
+    async def _collections_for_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[AsyncCollection]:
+        """Коллекции с документами за период, новые сначала."""
+        return [self.collection]
+
+    async def iter_documents(
+        self,
+        query: dict,
+        time_field: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[dict]:
+        """
+        Документы за период [start, end] по возрастанию time_field без построения
+        моделей. Курсор читается с сервера пачками по batch_size.
+        """
+        query = dict(query)
+        time_range = {}
+        if start is not None:
+            time_range["$gte"] = start
+        if end is not None:
+            time_range["$lte"] = end
+        if time_range:
+            query[time_field] = time_range
+
+        collections = await self._collections_for_range(start, end)
+        for collection in reversed(collections):
+            cursor = collection.find(query).sort(time_field, ASCENDING).batch_size(batch_size)
+            async for document in cursor:
+                yield document
     
+    def _to_document(self, item: T) -> dict:
+        """Преобразует модель в документ MongoDB."""
+        return item.model_dump(by_alias=True, exclude={"id"})
+
     async def create(self, item: T) -> T:
-        item_dict = item.model_dump(by_alias=True, exclude={"id"})
-        res = self.collection.insert_one(item_dict)
+        item_dict = self._to_document(item)
+        res = await self.collection.insert_one(item_dict)
+        self._mark_written()
         item.id = str(res.inserted_id)
         return item
 
+    async def create_many(self, items: List[T]) -> List[T]:
+        """Вставляет несколько элементов одним запросом insert_many."""
+        if not items:
+            return items
+        res = await self.collection.insert_many(
+            [self._to_document(item) for item in items],
+            ordered=False
+        )
+        self._mark_written()
+        for item, inserted_id in zip(items, res.inserted_ids):
+            item.id = str(inserted_id)
+        return items
+
     async def get(self, id: str) -> Optional[T]:
-        item_data = self.collection.find_one({"_id": ObjectId(id)})
-        return self.model(**item_data) if item_data else None
+        for collection in await self._collections_for_id(ObjectId(id)):
+            item_data = await collection.find_one({"_id": ObjectId(id)})
+            if item_data:
+                return self.model(**item_data)
+        return None
     
     async def get_list(
         self,
         skip: int = 0,
         limit: int = 10,
         text_search: Optional[str] = None,
+        after: Optional[str] = None,
+        projection: Optional[dict] = None,
+        raw: bool = False,
         **filters
     ) -> List[T]:
+        """
+        Страница элементов. Если передан after (курсор из next_cursor),
+        страница строится по ключам сортировки вместо skip.
+        raw=True возвращает документы MongoDB без моделей (быстрый путь чтения,
+        см. app/services/serialization.py), projection - поля документа.
+        """
+        query = self._build_list_query(text_search, filters)
+        
+        if after:
+            query = apply_cursor(query, self.sort, after)
+            skip = 0
+
+        # Добавляем сортировку по убыванию по полю updated_at
+        cursor = self.collection.find(query, projection).sort(self.sort).skip(skip).limit(limit)
+        return await self._load(cursor, raw)
+
+    async def _load(self, cursor, raw: bool = False) -> list:
+        if raw:
+            return [item async for item in cursor]
+        return [self.model(**item) async for item in cursor]
+
+    def projection(self, fields: Optional[str]) -> Optional[dict]:
+        """Проекция для параметра fields= (ключи сортировки добавляются для курсора)."""
+        return parse_fields(fields, model_fields(self.model), self.sort)
+
+    def _build_list_query(self, text_search: Optional[str], filters: dict) -> dict:
         query = {}
 
         if text_search:
@@ -36,10 +147,11 @@ class BaseRepository:
         for field, value in filters.items():
             if value is not None:
                 query[field] = value
-        
-        # Добавляем сортировку по убыванию по полю updated_at
-        cursor = self.collection.find(query).sort("updated_at", -1).skip(skip).limit(limit)
-        return [self.model(**item) for item in cursor]
+        return query
+
+    def next_cursor(self, items: List[T], limit: int) -> Optional[str]:
+        """Курсор для запроса следующей страницы после items."""
+        return next_cursor(items, limit, self.sort)
     
     async def get_by_time_period(
         self,
@@ -66,14 +178,8 @@ class BaseRepository:
         """
         query = {**filters}
         
-        now = datetime.now()
-        if minutes is not None:
-            start_time = now - timedelta(minutes=minutes)
-        elif hours is not None:
-            start_time = now - timedelta(hours=hours)
-        elif days is not None:
-            start_time = now - timedelta(days=days)
-        else:
+        start_time = self._period_start(hours, days, minutes)
+        if start_time is None:
             # Если период не указан, возвращаем пустой список
             return []
         
@@ -81,14 +187,29 @@ class BaseRepository:
         
         sort_order = -1 if sort_desc else 1
         cursor = self.collection.find(query).sort(time_field, sort_order)
-        return [self.model(**item) for item in cursor]
+        return [self.model(**item) async for item in cursor]
     
+    def _period_start(
+        self,
+        hours: Optional[int] = None,
+        days: Optional[int] = None,
+        minutes: Optional[int] = None
+    ) -> Optional[datetime]:
+        now = datetime.now()
+        if minutes is not None:
+            return now - timedelta(minutes=minutes)
+        if hours is not None:
+            return now - timedelta(hours=hours)
+        if days is not None:
+            return now - timedelta(days=days)
+        return None
+
     async def get_count(self, **filters) -> int:
         query = {}
         for field, value in filters.items():
             if value is not None:
                 query[field] = value
-        return self.collection.count_documents(query)
+        return await count_cache.count(self.collection, query)
     
     async def update(self, id: str, update_data: dict) -> Optional[T]:
         update_data = {k: v for k, v in update_data.items() if v is not None}
@@ -101,13 +222,21 @@ class BaseRepository:
         
         update_data["updated_at"] = datetime.now()
 
-        result = self.collection.find_one_and_update(
-            {"_id": ObjectId(id)},
-            {"$set": update_data},
-            return_document=True
-        )
-        return self.model(**result) if result else None
+        for collection in await self._collections_for_id(ObjectId(id)):
+            result = await collection.find_one_and_update(
+                {"_id": ObjectId(id)},
+                {"$set": update_data},
+                return_document=True
+            )
+            if result:
+                self._mark_written(collection)
+                return self.model(**result)
+        return None
     
     async def delete(self, id: str) -> bool:
-        result = self.collection.delete_one({"_id": ObjectId(id)})
-        return result.deleted_count > 0
\ No newline at end of file
+        for collection in await self._collections_for_id(ObjectId(id)):
+            result = await collection.delete_one({"_id": ObjectId(id)})
+            if result.deleted_count:
+                self._mark_written(collection)
+                return True
+        return False
\ No newline at end of file
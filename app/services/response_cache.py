@@ -0,0 +1,160 @@
+"""
+Кэш ответов частых GET-запросов (табло NOC опрашивают одни и те же URL).
+
+Ключ - путь и отсортированные параметры запроса. Запись действительна,
+пока не изменились версии коллекций, из которых строится ответ
+(app/database/versions.py), и не истек TTL - он ограничивает устаревание
+ответов, зависящих от текущего времени, и записей из других процессов.
+
+ETag - хэш тела ответа: если клиент прислал If-None-Match с тем же
+значением и запись действительна, отдается 304 без обращения к базе.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.database.versions import write_versions
+
+
+class CachedResponse(NamedTuple):
+    versions: Tuple[int, ...]
+    expires_at: float
+    etag: str
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def get(self, key: tuple, collections: List[str]) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.versions != write_versions.snapshot(collections) or entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(
+        self,
+        key: tuple,
+        versions: Tuple[int, ...],
+        headers: List[Tuple[bytes, bytes]],
+        body: bytes
+    ) -> CachedResponse:
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CachedResponse(versions, time.monotonic() + self.ttl, etag, headers, body)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+        }
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI-middleware: кэширует успешные GET-ответы маршрутов из routes
+    (путь -> коллекции, от которых зависит ответ).
+    """
+
+    # Заголовки, которые middleware выставляет само
+    _OWN_HEADERS = {b"content-length", b"etag", b"cache-control"}
+
+    def __init__(self, app: ASGIApp, routes: Dict[str, List[str]], cache: Optional[ResponseCache] = None):
+        self.app = app
+        self.routes = routes
+        self.cache = cache or response_cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or scope["path"] not in self.routes
+            or not settings.RESPONSE_CACHE_ENABLED
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        collections = self.routes[scope["path"]]
+        query = tuple(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+        key = (scope["path"], query)
+        if_none_match = Headers(scope=scope).get("if-none-match")
+
+        entry = self.cache.get(key, collections)
+        if entry is not None:
+            self.cache.hits += 1
+            await self._send(send, entry, if_none_match)
+            return
+
+        # Версии берутся до выполнения запроса: запись во время его обработки
+        # сделает сохраненный ответ недействительным
+        self.cache.misses += 1
+        versions = write_versions.snapshot(collections)
+        start: Optional[Message] = None
+        body = []
+
+        async def capture(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        if start is None:
+            return
+        if start["status"] != 200:
+            await send(start)
+            await send({"type": "http.response.body", "body": b"".join(body)})
+            return
+
+        headers = [(name, value) for name, value in start["headers"] if name.lower() not in self._OWN_HEADERS]
+        entry = self.cache.put(key, versions, headers, b"".join(body))
+        await self._send(send, entry, if_none_match)
+
+    async def _send(self, send: Send, entry: CachedResponse, if_none_match: Optional[str]):
+        # no-cache: клиент хранит ответ, но каждый раз проверяет его по ETag
+        headers = [(b"etag", entry.etag.encode()), (b"cache-control", b"no-cache")]
+        if _etag_matches(if_none_match, entry.etag):
+            self.cache.not_modified += 1
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers = entry.headers + headers + [(b"content-length", str(len(entry.body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
+
+
+# Глобальный кэш ответов
+response_cache = ResponseCache(ttl=settings.RESPONSE_CACHE_TTL, max_size=settings.RESPONSE_CACHE_SIZE)
@@ -0,0 +1,177 @@
+from app.services.repository_service import BaseRepository
+from app.database.mongodb import get_message_rollups_collection
+from app.models.messages import MessageRollup
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pymongo import UpdateOne, IndexModel, ASCENDING
+
+# Ключ счетчика "все сообщения"
+ALL_SERVICES = "*"
+
+EPOCH = datetime(1970, 1, 1)
+
+# Минуту пересчитываем из сообщений не раньше, чем она закончилась с запасом:
+# сообщения этой минуты к тому времени уже записаны
+REPAIR_DELAY = timedelta(minutes=2)
+
+
+def floor_minute(value: datetime) -> datetime:
+    return value.replace(second=0, microsecond=0)
+
+
+def ceil_minute(value: datetime) -> datetime:
+    floored = floor_minute(value)
+    return floored if floored == value else floored + timedelta(minutes=1)
+
+
+def to_millis(value: datetime) -> int:
+    """Миллисекунды от эпохи - так же, как $toLong для даты в MongoDB."""
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+class RollupGaps:
+    """
+    Минуты, для которых не удалось записать поминутные счетчики. Пока минута
+    не пересчитана из сообщений, count-by-time считает ее по сообщениям.
+    """
+
+    def __init__(self):
+        self.minutes: Set[datetime] = set()
+        self.failed_writes = 0
+        self.repaired = 0
+        self.repairing = False
+
+    def mark(self, minutes: Iterable[datetime]):
+        self.failed_writes += 1
+        self.minutes.update(minutes)
+
+    def within(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Диапазоны [начало, конец) из подряд идущих минут с пропусками внутри [start, end)."""
+        ranges: List[Tuple[datetime, datetime]] = []
+        for minute in sorted(m for m in self.minutes if start <= m < end):
+            if ranges and ranges[-1][1] == minute:
+                ranges[-1] = (ranges[-1][0], minute + timedelta(minutes=1))
+            else:
+                ranges.append((minute, minute + timedelta(minutes=1)))
+        return ranges
+
+    def closed(self, now: datetime) -> List[datetime]:
+        """Минуты, которые уже можно пересчитать."""
+        return sorted(m for m in self.minutes if m + REPAIR_DELAY <= now)
+
+    def resolve(self, minute: datetime):
+        self.minutes.discard(minute)
+        self.repaired += 1
+
+    def stats(self) -> dict:
+        return {
+            "failed_writes": self.failed_writes,
+            "pending_minutes": len(self.minutes),
+            "repaired_minutes": self.repaired,
+        }
+
+
+class MessageRollupRepository(BaseRepository):
+    """
+    Поминутные счетчики сообщений (всего и по каждому сервису).
+    Заполняются при приеме сообщений через $inc-upsert.
+    """
+
+    indexes = [
+        IndexModel([("service", ASCENDING), ("bucket", ASCENDING)], unique=True, name="service_bucket_unique"),
+    ]
+    hot_queries = [
+        {"name": "range", "filter": {"service": ALL_SERVICES, "bucket": {"$gte": EPOCH}}},
+    ]
+
+    def __init__(self):
+        super().__init__(get_message_rollups_collection, MessageRollup)
+        # Первая полная минута, с которой счетчики ведутся (кэшируется после первого запроса)
+        self._complete_since: Optional[datetime] = None
+
+    async def increment(self, items: Iterable[Tuple[datetime, List[str]]]):
+        """Увеличивает счетчики для сообщений (created_at, services) одним bulk_write."""
+        counts: Counter = Counter()
+        for created_at, services in items:
+            bucket = floor_minute(created_at)
+            counts[(ALL_SERVICES, bucket)] += 1
+            for service in set(services):
+                counts[(service, bucket)] += 1
+
+        if not counts:
+            return
+
+        try:
+            await self.collection.bulk_write([
+                UpdateOne(
+                    {"service": service, "bucket": bucket},
+                    {"$inc": {"count": count}},
+                    upsert=True
+                )
+                for (service, bucket), count in counts.items()
+            ], ordered=False)
+        except Exception:
+            # Часть $inc могла не записаться: минуты пересчитаются из сообщений
+            rollup_gaps.mark(bucket for _, bucket in counts)
+            raise
+        self._mark_written()
+
+    async def overwrite(self, bucket: datetime, counts: Dict[str, int]):
+        """Заменяет счетчики минуты пересчитанными значениями (сервис -> число)."""
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"service": service, "bucket": bucket},
+                {"$set": {"count": count}},
+                upsert=True
+            )
+            for service, count in counts.items()
+        ], ordered=False)
+        self._mark_written()
+
+    async def complete_since(self) -> Optional[datetime]:
+        """
+        Начало периода, за который счетчики полные. Первая минута могла
+        начаться до включения счетчиков, поэтому она не считается полной.
+        """
+        if self._complete_since is None:
+            first = await self.collection.find_one(
+                {"service": ALL_SERVICES}, sort=[("bucket", ASCENDING)]
+            )
+            if first:
+                self._complete_since = first["bucket"] + timedelta(minutes=1)
+        return self._complete_since
+
+    async def get_counts(
+        self,
+        start: datetime,
+        end: datetime,
+        interval_ms: int,
+        service: Optional[str] = None
+    ) -> Dict[int, int]:
+        """
+        Суммы поминутных счетчиков в [start, end), сгруппированные по интервалам.
+        Минуты с незаписанными счетчиками (rollup_gaps) пропускаются.
+        """
+        bucket_range = {"$gte": start, "$lt": end}
+        gaps = [minute for minute in rollup_gaps.minutes if start <= minute < end]
+        if gaps:
+            bucket_range["$nin"] = gaps
+        cursor = self.collection.find(
+            {
+                "service": service or ALL_SERVICES,
+                "bucket": bucket_range
+            },
+            {"bucket": 1, "count": 1, "_id": 0}
+        )
+
+        counts: Dict[int, int] = {}
+        async for item in cursor:
+            millis = to_millis(item["bucket"])
+            key = millis - millis % interval_ms
+            counts[key] = counts.get(key, 0) + item["count"]
+        return counts
+
+
+# Глобальный учет незаписанных минут: общий для всех экземпляров репозитория
+rollup_gaps = RollupGaps()
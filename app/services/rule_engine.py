@@ -0,0 +1,382 @@
+"""
+Правила разбора текста сообщения: статус (открыто/решено), важность и теги.
+
+Правила читаются из YAML (settings.MESSAGE_RULES_FILE) и перечитываются при
+изменении файла. Все строки правил собираются в один автомат Ахо-Корасик,
+поэтому текст проходится один раз независимо от числа правил. Из каждого
+регулярного выражения извлекается обязательная строка (якорь), она ищется тем
+же автоматом, и выражение проверяется только если якорь нашелся. Выражения
+без якоря проверяются всегда. Результат тот же, что при проверке каждого
+правила по очереди, включая перекрывающиеся совпадения разных правил.
+
+Формат файла:
+    severities: [info, warning, minor, major, critical]   # по возрастанию
+    rules:
+      - name: solved
+        literal: SOLVED          # или regex: '...'
+        ignore_case: false
+        word: false              # только целое слово (для literal)
+        status: closed           # open / closed
+        severity: major
+        tags: [link]
+        strip: true              # убрать совпадение из текста (имя события)
+
+Статус берется из первого по порядку сработавшего правила, важность -
+наибольшая из сработавших, теги объединяются.
+"""
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import yaml
+from pydantic import BaseModel, model_validator
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATUS_OPEN = "open"
+STATUS_CLOSED = "closed"
+
+DEFAULT_SEVERITIES = ["info", "warning", "minor", "major", "critical"]
+# Правило по умолчанию, если файла правил нет: прежняя проверка на SOLVED
+DEFAULT_RULES = [{"name": "solved", "literal": "SOLVED", "status": STATUS_CLOSED, "strip": True}]
+# Якорь короче не отсекает выражения, а только добавляет совпадений автомату
+MIN_ANCHOR_LENGTH = 3
+
+_REGEX_SPECIAL = set(".^$*+?{}[]()|\\")
+_QUANTIFIERS = set("*?{")  # "+" обрабатывается отдельно
+# Экранирования с продолжением (\x41, \u0041, \N{...}, восьмеричные и ссылки на группы):
+# символы после буквы - не литералы, такие выражения остаются без якоря
+_MULTICHAR_ESCAPES = set("xuUN0123456789")
+# Флаги внутри выражения: (?x) меняет смысл пробелов, (?i) - регистр
+_INLINE_FLAGS = re.compile(r"\(\?[aiLmsux-]")
+
+
+def regex_anchor(pattern: str) -> Optional[str]:
+    """
+    Самая длинная строка, которая обязана встретиться в тексте при совпадении
+    выражения (берутся только литералы верхнего уровня). None, если такой нет,
+    выражение содержит | вне скобок, флаги внутри выражения или экранирования
+    кодов символов.
+    """
+    if _INLINE_FLAGS.search(pattern):
+        return None
+    runs = []
+    run = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = None
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if escaped in _MULTICHAR_ESCAPES:
+                return None
+            if not escaped.isalnum():
+                literal = escaped
+        elif char == "[":
+            # Класс символов пропускается целиком
+            i += 2 if pattern[i + 1:i + 2] == "]" else 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth += 1
+            i += 1
+        elif char == ")":
+            depth -= 1
+            i += 1
+        elif char == "|":
+            if depth == 0:
+                return None
+            i += 1
+        else:
+            i += 1
+            if char not in _REGEX_SPECIAL:
+                literal = char
+
+        if literal is not None and depth == 0:
+            quantifier = pattern[i] if i < len(pattern) else ""
+            if quantifier in _QUANTIFIERS:
+                # Символ с квантификатором * ? {} может отсутствовать
+                runs.append(run)
+                run = ""
+            elif quantifier == "+":
+                # Символ обязателен, но за ним могут идти его повторы
+                runs.append(run + literal)
+                run = ""
+            else:
+                run += literal
+        else:
+            runs.append(run)
+            run = ""
+    runs.append(run)
+
+    anchor = max(runs, key=len)
+    return anchor if len(anchor) >= MIN_ANCHOR_LENGTH else None
+
+
+class MessageRule(BaseModel):
+    name: str
+    literal: Optional[str] = None
+    regex: Optional[str] = None
+    ignore_case: bool = False
+    word: bool = False
+    status: Optional[str] = None
+    severity: Optional[str] = None
+    tags: List[str] = []
+    strip: bool = False
+
+    @model_validator(mode="after")
+    def check(self):
+        if (self.literal is None) == (self.regex is None):
+            raise ValueError(f"rule {self.name}: exactly one of literal/regex is required")
+        if self.literal == "":
+            raise ValueError(f"rule {self.name}: empty literal")
+        if self.status not in (None, STATUS_OPEN, STATUS_CLOSED):
+            raise ValueError(f"rule {self.name}: status must be {STATUS_OPEN} or {STATUS_CLOSED}")
+        return self
+
+
+class Classification(NamedTuple):
+    status: bool
+    severity: Optional[str]
+    tags: List[str]
+    # Текст без фрагментов правил со strip
+    text: str
+
+
+def merge_classifications(previous: Classification, current: Classification) -> Classification:
+    """Итог нескольких сообщений события: статус последнего, важность последняя заданная, теги объединяются."""
+    return current._replace(
+        severity=current.severity or previous.severity,
+        tags=previous.tags + [tag for tag in current.tags if tag not in previous.tags]
+    )
+
+
+class LiteralAutomaton:
+    """
+    Автомат Ахо-Корасик над строками: за один проход по тексту находит все
+    вхождения всех строк, включая перекрывающиеся. Переходы достроены до
+    детерминированного автомата, поэтому на символ приходится один поиск в словаре.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.lengths = [len(pattern) for pattern in patterns]
+        delta: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                following = delta[state].get(char)
+                if following is None:
+                    delta.append({})
+                    out.append(())
+                    following = delta[state][char] = len(delta) - 1
+                state = following
+            out[state] += (index,)
+
+        # Обход в ширину: ссылки неудач и достраивание переходов
+        fail = [0] * len(delta)
+        queue = deque(delta[0].values())
+        while queue:
+            state = queue.popleft()
+            out[state] += out[fail[state]]
+            for char, following in delta[state].items():
+                queue.append(following)
+                fail[following] = delta[fail[state]].get(char, 0)
+            for char, following in delta[fail[state]].items():
+                delta[state].setdefault(char, following)
+
+        self._delta = delta
+        self._out = out
+
+    def search(self, text: str) -> List[Tuple[int, int, int]]:
+        """Совпадения (индекс строки, начало, конец)."""
+        delta, out, lengths = self._delta, self._out, self.lengths
+        found = []
+        state = 0
+        for position, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if out[state]:
+                end = position + 1
+                for index in out[state]:
+                    found.append((index, end - lengths[index], end))
+        return found
+
+
+class RuleSet:
+    """Скомпилированный набор правил."""
+
+    def __init__(self, rules: List[MessageRule], severities: List[str]):
+        self.rules = rules
+        self.severity_rank = {severity: rank for rank, severity in enumerate(severities)}
+        for rule in rules:
+            if rule.severity is not None and rule.severity not in self.severity_rank:
+                raise ValueError(f"rule {rule.name}: unknown severity {rule.severity}")
+
+        # Строки ищутся в тексте в нижнем регистре; регистр проверяется после совпадения.
+        # Автомат возвращает индекс строки: правило и признак якоря выражения
+        keys: List[Tuple[int, bool]] = []
+        strings: List[str] = []
+        self._patterns: Dict[int, re.Pattern] = {}
+        # Поиск строк правил в исходном тексте, если позиции в нижнем регистре не совпадают
+        self._literals: Dict[int, re.Pattern] = {}
+        # Выражения без якоря проверяются всегда, каждое своим finditer: в общем
+        # выражении-альтернативе в одной позиции срабатывало бы только первое
+        self._unanchored: List[int] = []
+        for i, rule in enumerate(rules):
+            if rule.literal is not None:
+                keys.append((i, False))
+                strings.append(rule.literal.lower())
+                self._literals[i] = re.compile(re.escape(rule.literal), re.IGNORECASE if rule.ignore_case else 0)
+                continue
+            self._patterns[i] = re.compile(rule.regex, re.IGNORECASE if rule.ignore_case else 0)
+            anchor = regex_anchor(rule.regex)
+            if anchor is None:
+                self._unanchored.append(i)
+            else:
+                keys.append((i, True))
+                strings.append(anchor.lower())
+        self._keys = keys
+        self._automaton = LiteralAutomaton(strings)
+
+    def _matches(self, text: str) -> List[Tuple[int, int, int]]:
+        """Сработавшие правила: (индекс правила, начало, конец)."""
+        matches = []
+        candidates = set()
+        literals = set()
+        lowered = text.lower()
+        same_length = len(lowered) == len(text)
+        for index, start, end in self._automaton.search(lowered):
+            rule_index, is_anchor = self._keys[index]
+            if is_anchor:
+                candidates.add(rule_index)
+                continue
+            if not same_length:
+                # В нижнем регистре длина текста изменилась (например, "İ"):
+                # позиции не совпадают с исходным текстом, ищем в нем заново
+                literals.add(rule_index)
+                continue
+            rule = self.rules[rule_index]
+            if not rule.ignore_case and text[start:end] != rule.literal:
+                continue
+            if self._word_rejected(rule, text, start, end):
+                continue
+            matches.append((rule_index, start, end))
+
+        for rule_index in literals:
+            rule = self.rules[rule_index]
+            for match in self._literals[rule_index].finditer(text):
+                if not self._word_rejected(rule, text, match.start(), match.end()):
+                    matches.append((rule_index, match.start(), match.end()))
+
+        for rule_index in candidates.union(self._unanchored):
+            for match in self._patterns[rule_index].finditer(text):
+                matches.append((rule_index, match.start(), match.end()))
+        return matches
+
+    @staticmethod
+    def _word_rejected(rule: MessageRule, text: str, start: int, end: int) -> bool:
+        """Совпадение внутри слова для правила с word."""
+        return rule.word and (
+            (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())
+        )
+
+    def classify(self, text: str) -> Classification:
+        matches = self._matches(text)
+        if not matches:
+            return Classification(True, None, [], text)
+
+        status = None
+        status_rule = len(self.rules)
+        severity = None
+        tags: List[str] = []
+        strip: List[Tuple[int, int]] = []
+        # По порядку правил: теги в порядке правил, как при проверке по очереди
+        for index, start, end in sorted(matches):
+            rule = self.rules[index]
+            if rule.status is not None and index < status_rule:
+                status, status_rule = rule.status, index
+            if rule.severity is not None and (
+                severity is None or self.severity_rank[rule.severity] > self.severity_rank[severity]
+            ):
+                severity = rule.severity
+            for tag in rule.tags:
+                if tag not in tags:
+                    tags.append(tag)
+            if rule.strip:
+                strip.append((start, end))
+
+        if strip:
+            parts = []
+            position = 0
+            for start, end in sorted(strip):
+                if start >= position:
+                    parts.append(text[position:start])
+                position = max(position, end)
+            parts.append(text[position:])
+            text = " ".join(" ".join(parts).split())
+
+        return Classification(status != STATUS_CLOSED, severity, tags, text)
+
+
+class RuleEngine:
+    """
+    Набор правил из файла. Время изменения файла проверяется не чаще раза
+    в reload_interval секунд; при ошибке в новом файле остаются прежние правила.
+    """
+
+    def __init__(self, path: str, reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._rule_set: Optional[RuleSet] = None
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+
+    @property
+    def rule_set(self) -> RuleSet:
+        now = time.monotonic()
+        if self._rule_set is None or now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self._reload()
+        return self._rule_set
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if self._rule_set is not None and mtime == self._mtime:
+            return
+
+        try:
+            if mtime is None:
+                logger.warning(f"Файл правил {self.path} не найден, используется правило SOLVED")
+                config = {"rules": DEFAULT_RULES}
+            else:
+                with open(self.path, encoding="utf-8") as f:
+                    config = yaml.safe_load(f) or {}
+            self._rule_set = RuleSet(
+                [MessageRule(**rule) for rule in config.get("rules") or []],
+                config.get("severities") or DEFAULT_SEVERITIES
+            )
+            self._mtime = mtime
+            logger.info(f"Загружено правил сообщений: {len(self._rule_set.rules)}")
+        except Exception as e:
+            if self._rule_set is None:
+                raise
+            logger.error(f"Ошибка в файле правил {self.path}, оставлены прежние правила: {e}")
+            self._mtime = mtime
+
+    def classify(self, text: str) -> Classification:
+        return self.rule_set.classify(text)
+
+
+# Глобальный экземпляр правил разбора сообщений
+message_rules = RuleEngine(settings.MESSAGE_RULES_FILE, settings.MESSAGE_RULES_RELOAD_INTERVAL)
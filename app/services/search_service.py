@@ -0,0 +1,113 @@
+"""
+Поиск подстроки по тексту через триграммный индекс.
+
+В документе хранится массив триграмм текста (мультиключевой индекс).
+Запрос выбирает кандидатов по триграммам искомой строки ($all идет по
+индексу) и проверяет точное вхождение экранированным регулярным выражением
+уже только на них. Строки короче трех символов ищутся одним регулярным
+выражением.
+"""
+import re
+import time
+from typing import List
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+GRAM_SIZE = 3
+# Сколько триграмм искомой строки попадает в запрос: остальные проверяет регулярное выражение
+MAX_QUERY_GRAMS = 8
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub(" ", text.strip().lower())
+
+
+def trigrams(text: str) -> List[str]:
+    """Триграммы текста для хранения в документе."""
+    text = normalize(text)
+    return sorted({text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)})
+
+
+def _query_grams(term: str) -> List[str]:
+    term = normalize(term)
+    grams = []
+    for i in range(len(term) - GRAM_SIZE + 1):
+        gram = term[i:i + GRAM_SIZE]
+        if gram not in grams:
+            grams.append(gram)
+    # Триграммы берутся равномерно по строке, а не только из ее начала
+    if len(grams) > MAX_QUERY_GRAMS:
+        step = len(grams) / MAX_QUERY_GRAMS
+        grams = [grams[int(i * step)] for i in range(MAX_QUERY_GRAMS)]
+    return grams
+
+
+def _pattern(term: str) -> str:
+    # Пробелы в строке поиска совпадают с любыми пробельными символами, как при normalize
+    return r"\s+".join(re.escape(part) for part in normalize(term).split(" "))
+
+
+def substring_query(field: str, grams_field: str, term: str) -> dict:
+    """Условие "field содержит term" без учета регистра."""
+    query = {field: {"$regex": _pattern(term), "$options": "i"}}
+    grams = _query_grams(term)
+    if grams:
+        query[grams_field] = {"$all": grams}
+    return query
+
+
+def exact_query(field: str, term: str) -> dict:
+    """Условие "field равно term" без учета регистра (ввод экранируется)."""
+    return {field: {"$regex": f"^{re.escape(term.strip())}$", "$options": "i"}}
+
+
+def rank_expression(field: str, term: str) -> dict:
+    """
+    Ранг совпадения для сортировки результатов (меньше - лучше):
+    0 - текст равен строке, 1 - начинается с нее, 2 - с нее начинается слово,
+    3 - строка внутри слова.
+    """
+    pattern = _pattern(term)
+    branches = [
+        (0, f"^{pattern}$"),
+        (1, f"^{pattern}"),
+        (2, rf"\b{pattern}"),
+    ]
+    return {
+        "$switch": {
+            "branches": [
+                {
+                    "case": {"$regexMatch": {"input": f"${field}", "regex": regex, "options": "i"}},
+                    "then": rank,
+                }
+                for rank, regex in branches
+            ],
+            "default": 3,
+        }
+    }
+
+
+class ValueVocabulary:
+    """
+    Различные значения поля коллекции (например, сервисы событий).
+    Значений немного, поэтому поиск подстроки идет по ним в памяти,
+    а в базу уходит $in по индексу.
+    """
+
+    def __init__(self, field: str, ttl: float):
+        self.field = field
+        self.ttl = ttl
+        self._values: List[str] = []
+        self._expires_at = 0.0
+
+    async def values(self, collection: AsyncCollection) -> List[str]:
+        if self._expires_at <= time.monotonic():
+            self._values = [value for value in await collection.distinct(self.field) if isinstance(value, str)]
+            self._expires_at = time.monotonic() + self.ttl
+        return self._values
+
+    async def matching(self, collection: AsyncCollection, term: str) -> List[str]:
+        term = normalize(term)
+        return [value for value in await self.values(collection) if term in normalize(value)]
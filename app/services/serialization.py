@@ -0,0 +1,81 @@
+"""
+Быстрый путь чтения: документы MongoDB отдаются без pydantic-моделей.
+
+ObjectId и datetime преобразуются при сериализации ответа (orjson, если
+установлен, иначе стандартный json), проекция fields= ограничивает поля,
+которые читаются из базы.
+"""
+import json
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Type
+
+from bson import ObjectId
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ из готовых документов: без jsonable_encoder и проверки response_model."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_fields(model: Type[BaseModel]) -> List[str]:
+    """Имена полей документа для модели (id хранится как _id)."""
+    return ["_id" if name == "id" else name for name in model.model_fields]
+
+
+def parse_fields(
+    fields: Optional[str],
+    allowed: Iterable[str],
+    required: Sequence[Tuple[str, int]] = ()
+) -> Optional[dict]:
+    """
+    Проекция MongoDB для параметра fields=a,b,c. Ключи сортировки (required)
+    добавляются всегда - по ним строится курсор следующей страницы.
+    Бросает ValueError для неизвестных полей.
+    """
+    if not fields:
+        return None
+
+    allowed = set(allowed)
+    projection = {}
+    for name in (field.strip() for field in fields.split(",")):
+        if not name:
+            continue
+        key = "_id" if name == "id" else name
+        if key not in allowed:
+            raise ValueError(f"Unknown field: {name}")
+        projection[key] = 1
+
+    for key, _ in required:
+        projection[key] = 1
+    return projection
+
+
+def rename_id(documents: List[dict]) -> List[dict]:
+    """_id -> id для ответов, где модель отдает поле id (инциденты)."""
+    for document in documents:
+        if "_id" in document:
+            document["id"] = document.pop("_id")
+    return documents
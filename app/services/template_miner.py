@@ -0,0 +1,275 @@
+"""
+Определение события по тексту сообщения: потоковый поиск шаблонов (Drain).
+
+Изменчивые части (время, IP, MAC, номера интерфейсов, числа) заменяются
+на <*>, затем сообщение проходит по дереву фиксированной глубины:
+модель устройства -> число токенов -> первые токены -> список шаблонов листа.
+В листе выбирается самый похожий шаблон; если похожих нет, создается новый.
+Несовпадающие токены шаблона со временем обобщаются до <*>, кроме коротких
+шаблонов: в них различающееся слово - обычно состояние (Down/Up).
+
+Имя шаблона (ключ события вместе с ip) фиксируется при создании и больше
+не меняется, идентификатор выводится из модели и имени. Шаблоны хранятся
+в коллекции event_templates и загружаются при старте.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.config import settings
+from app.database.mongodb import get_event_templates_collection
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "<*>"
+# Прежний предел длины имени события
+MAX_NAME_LENGTH = 300
+# В коротких шаблонах различающееся слово - обычно состояние (Down/Up,
+# failed/restored, removed/inserted): такие сообщения не обобщаются
+SHORT_TEMPLATE_LENGTH = 6
+
+# Изменчивые части токена; порядок важен: сначала составные значения, потом числа
+_VARIABLE = re.compile("|".join([
+    # 2024-01-31, 2024-01-31T12:00:00.123+03:00
+    r"\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?",
+    # 12:00:00.123
+    r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b",
+    # aa:bb:cc:dd:ee:ff, aa-bb-cc-dd-ee-ff, aabb.ccdd.eeff
+    r"\b[0-9a-fA-F]{2}(?:[:-][0-9a-fA-F]{2}){5}\b",
+    r"\b[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\b",
+    # 10.0.0.1, 10.0.0.0/24, 10.0.0.1:514
+    r"\b\d{1,3}(?:\.\d{1,3}){3}(?:/\d{1,2})?(?::\d+)?\b",
+    r"\b0x[0-9a-fA-F]+\b",
+    # Номер интерфейса, тип остается: Gi1/0/5 -> Gi<*>, ge-0/0/1.100 -> ge-<*>
+    r"\b(?P<interface>[A-Za-z][A-Za-z-]*)\d+(?:/\d+)+(?:[.:]\d+)?\b",
+    # Отдельные числа, но не часть слова: eth0, C9300, %LINK-3-UPDOWN остаются
+    r"(?<![\w.-])[-+]?\d+(?:\.\d+)?(?![\w.-])",
+]))
+_REPLACEMENT = rf"\g<interface>{WILDCARD}"
+# Регулярное выражение применяется только к токенам с цифрами или с
+# разделителями MAC-адреса: MAC бывает из одних букв (de:ad:be:ef:ca:fe)
+_MASKABLE = frozenset("0123456789:.-")
+_DIGITS = frozenset("0123456789")
+
+
+def mask(text: str) -> List[str]:
+    """Токены текста с изменчивыми частями, замененными на <*>."""
+    return [
+        token if _MASKABLE.isdisjoint(token) else _VARIABLE.sub(_REPLACEMENT, token)
+        for token in text.split()
+    ]
+
+
+def template_id(model: str, name: str) -> str:
+    return hashlib.blake2b(f"{model}\x00{name}".encode(), digest_size=8).hexdigest()
+
+
+class LogTemplate:
+    __slots__ = ("id", "model", "name", "tokens", "size", "created_at")
+
+    def __init__(self, model: str, name: str, tokens: List[str], size: int = 0,
+                 created_at: Optional[datetime] = None):
+        self.id = template_id(model, name)
+        self.model = model
+        self.name = name
+        self.tokens = tokens
+        self.size = size
+        self.created_at = created_at or datetime.now()
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        """Доля совпавших токенов (без <*>) и число <*> - для выбора лучшего шаблона."""
+        same = 0
+        wildcards = 0
+        for own, token in zip(self.tokens, tokens):
+            if own == WILDCARD:
+                wildcards += 1
+            elif own == token:
+                same += 1
+        return same / len(tokens), wildcards
+
+    def conflicts(self, tokens: List[str]) -> bool:
+        """Короткий шаблон и сообщение различаются словом, которое не маскируется."""
+        if len(self.tokens) > SHORT_TEMPLATE_LENGTH:
+            return False
+        return any(own != token and own != WILDCARD for own, token in zip(self.tokens, tokens))
+
+    def merge(self, tokens: List[str]) -> bool:
+        """Обобщает несовпадающие токены до <*>. True, если шаблон изменился."""
+        changed = False
+        for i, (own, token) in enumerate(zip(self.tokens, tokens)):
+            if own != token and own != WILDCARD:
+                self.tokens[i] = WILDCARD
+                changed = True
+        return changed
+
+
+class TemplateMiner:
+    def __init__(
+        self,
+        get_collection: Callable[[], AsyncCollection],
+        depth: int,
+        similarity: float,
+        max_children: int,
+        cache_size: int
+    ):
+        self._get_collection = get_collection
+        # Число первых токенов, по которым ветвится дерево
+        self.prefix_depth = max(depth - 2, 1)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.cache_size = cache_size
+        # модель -> число токенов -> первые токены ... -> список шаблонов
+        self._root: Dict[str, dict] = {}
+        self._templates: Dict[str, LogTemplate] = {}
+        # (модель, текст) -> шаблон: повторяющиеся сообщения не проходят дерево заново
+        self._cache: "OrderedDict[Tuple[str, str], LogTemplate]" = OrderedDict()
+        self._dirty: set = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self) -> AsyncCollection:
+        return self._get_collection()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _leaf(self, model: str, tokens: List[str]) -> list:
+        node = self._root.setdefault(model, {}).setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_depth]:
+            # Токены с цифрами скорее параметры, чем часть шаблона
+            key = token if _DIGITS.isdisjoint(token) else WILDCARD
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault("", [])
+
+    def _best(self, leaf: list, tokens: List[str]) -> Optional[LogTemplate]:
+        best, best_score = None, (-1.0, -1)
+        for template in leaf:
+            if template.conflicts(tokens):
+                continue
+            score = template.similarity(tokens)
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score[0] >= self.similarity:
+            return best
+        return None
+
+    def identify(self, model: Optional[str], text: str) -> LogTemplate:
+        """Шаблон для сообщения; новый создается, если похожего нет."""
+        model = model or ""
+        cache_key = (model, text)
+        template = self._cache.get(cache_key)
+        if template is not None:
+            self._cache.move_to_end(cache_key)
+        else:
+            template = self._match(model, text)
+            self._cache[cache_key] = template
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        template.size += 1
+        self._dirty.add(template.id)
+        return template
+
+    def _match(self, model: str, text: str) -> LogTemplate:
+        tokens = mask(text)
+        if not tokens:
+            tokens = [WILDCARD]
+        leaf = self._leaf(model, tokens)
+        template = self._best(leaf, tokens)
+        if template is not None:
+            template.merge(tokens)
+            return template
+
+        name = " ".join(tokens)[:MAX_NAME_LENGTH]
+        template = self._templates.get(template_id(model, name))
+        if template is None:
+            template = LogTemplate(model, name, list(tokens))
+            self._templates[template.id] = template
+            leaf.append(template)
+        return template
+
+    def _add(self, template: LogTemplate):
+        self._templates[template.id] = template
+        self._leaf(template.model, template.tokens).append(template)
+
+    async def load(self):
+        """Загружает сохраненные шаблоны в дерево."""
+        self._root.clear()
+        self._templates.clear()
+        self._cache.clear()
+        async for doc in self.collection.find({}):
+            self._add(LogTemplate(
+                doc["model"], doc["name"], list(doc["tokens"]),
+                size=doc.get("size", 0), created_at=doc.get("created_at")
+            ))
+        logger.info(f"Загружено шаблонов событий: {len(self._templates)}")
+
+    async def flush(self):
+        """Сохраняет шаблоны, изменившиеся с прошлого сохранения."""
+        if not self._dirty:
+            return
+        ids, self._dirty = self._dirty, set()
+        now = datetime.now()
+        try:
+            await self.collection.bulk_write([
+                UpdateOne(
+                    {"_id": template.id},
+                    {
+                        "$set": {"tokens": template.tokens, "size": template.size, "updated_at": now},
+                        "$setOnInsert": {
+                            "model": template.model,
+                            "name": template.name,
+                            "created_at": template.created_at,
+                        },
+                    },
+                    upsert=True
+                )
+                for template in (self._templates[i] for i in ids)
+            ], ordered=False)
+        except Exception:
+            # Не сохраненные шаблоны уйдут со следующей попыткой
+            self._dirty |= ids
+            raise
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(settings.EVENT_TEMPLATES_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения шаблонов событий: {e!r}")
+
+    async def start(self):
+        await self.load()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="event-templates-flush")
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+
+# Глобальный экземпляр: дерево шаблонов общее для всех обработчиков сообщений
+template_miner = TemplateMiner(
+    get_event_templates_collection,
+    depth=settings.EVENT_TEMPLATES_DEPTH,
+    similarity=settings.EVENT_TEMPLATES_SIMILARITY,
+    max_children=settings.EVENT_TEMPLATES_MAX_CHILDREN,
+    cache_size=settings.EVENT_TEMPLATES_CACHE_SIZE,
+)
@@ -5,7 +5,10 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            # Просто поддерживаем соединение
-            await websocket.receive_text()
+            # Команды подписки; клиент без подписки получает incident_update как раньше
+            text = await websocket.receive_text()
+            await manager.handle_message(websocket, text)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
\ No newline at end of file
@@ -1,26 +1,201 @@
+import asyncio
 import json
+import logging
+from collections import defaultdict
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import Dict, List, Optional
+from app.config import settings
+from app.services.serialization import dumps
+from app.websocket.subscriptions import (
+    TOPIC_INCIDENTS, TOPICS, DeltaCoalescer, SubscriptionIndex, parse_filters,
+)
+
+logger = logging.getLogger(__name__)
+
+# Политика для клиента, который не успевает читать сообщения
+SLOW_CLIENT_DROP_OLDEST = "drop_oldest"
+SLOW_CLIENT_DISCONNECT = "disconnect"
+
+
+class ClientConnection:
+    """
+    Соединение клиента со своей ограниченной очередью исходящих сообщений.
+    Отправкой занимается отдельная задача, поэтому медленный клиент
+    не задерживает рассылку остальным.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def offer(self, message: str, policy: str) -> bool:
+        """Ставит сообщение в очередь. False - клиент переполнен и должен быть отключен."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            if policy == SLOW_CLIENT_DISCONNECT:
+                return False
+            # Старые обновления менее ценны, чем свежие: вытесняем самое старое
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+            return True
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.disconnected_slow = 0
+        # Задачи закрытия медленных соединений (ссылки держим до завершения)
+        self._closing: set = set()
+        # Подписки с фильтрами и склейка обновлений в дельты раз в тик
+        self.subscriptions = SubscriptionIndex()
+        self.coalescer = DeltaCoalescer(settings.WS_DELTA_SNAPSHOT_SIZE)
+        self.delta_frames = 0
+        self._ticker: Optional[asyncio.Task] = None
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, settings.WS_QUEUE_SIZE)
+        client.writer = asyncio.create_task(self._write(client), name="ws-writer")
+        self.active_connections[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.subscriptions.unsubscribe(websocket)
+        self.coalescer.forget(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client and client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def _write(self, client: ClientConnection):
+        try:
+            while True:
+                message = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(message), timeout=settings.WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Клиент отключился или не принял сообщение за WS_SEND_TIMEOUT
+            logger.info(f"WebSocket клиент отключен при отправке: {e!r}")
+            self.disconnect(client.websocket)
+            await self._close(client.websocket)
+
+    async def _close(self, websocket: WebSocket, code: int = 1000):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _offer(self, websocket: WebSocket, client: ClientConnection, message: str):
+        if not client.offer(message, settings.WS_SLOW_CLIENT_POLICY):
+            self.disconnected_slow += 1
+            self.disconnect(websocket)
+            # 1013 - "try again later": клиент может переподключиться
+            task = asyncio.create_task(self._close(websocket, code=1013))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
 
     async def broadcast(self, data: Dict):
-        message = json.dumps(data)
-        for connection in self.active_connections:
+        # Сообщение сериализуется один раз для всех клиентов
+        message = dumps(data).decode()
+        # Копия списка: соединения могут удаляться во время рассылки
+        for websocket, client in list(self.active_connections.items()):
+            self._offer(websocket, client, message)
+
+    async def handle_message(self, websocket: WebSocket, text: str):
+        """Команда клиента: subscribe (заменяет подписку) или unsubscribe."""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        try:
+            command = json.loads(text)
+            action = command.get("action")
+            if action == "subscribe":
+                topics = command.get("topics") or list(TOPICS)
+                unknown = set(topics) - set(TOPICS)
+                if unknown:
+                    raise ValueError(f"Unknown topics: {sorted(unknown)}")
+                self.subscriptions.subscribe(websocket, topics, parse_filters(command.get("filters")))
+                self._start_ticker()
+            elif action == "unsubscribe":
+                self.subscriptions.unsubscribe(websocket)
+                self.coalescer.forget(websocket)
+            else:
+                raise ValueError(f"Unknown action: {action}")
+            reply = {"type": "ack", "action": action}
+        except (ValueError, AttributeError, TypeError) as e:
+            reply = {"type": "error", "detail": str(e)}
+        self._offer(websocket, client, dumps(reply).decode())
+
+    async def publish(self, topic: str, data: Dict):
+        """
+        Обновление события или инцидента. Клиенты без подписки получают
+        инциденты сразу (прежний формат incident_update), подписчики -
+        дельты по своим фильтрам раз в WS_COALESCE_INTERVAL.
+        """
+        if topic == TOPIC_INCIDENTS:
+            legacy = [
+                (websocket, client) for websocket, client in self.active_connections.items()
+                if websocket not in self.subscriptions
+            ]
+            if legacy:
+                message = dumps({"type": "incident_update", "data": data}).decode()
+                for websocket, client in legacy:
+                    self._offer(websocket, client, message)
+        if len(self.subscriptions):
+            self.coalescer.add(topic, data)
+
+    def _start_ticker(self):
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick(), name="ws-delta-ticker")
+
+    async def stop(self):
+        if self._ticker:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+            self._ticker = None
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(settings.WS_COALESCE_INTERVAL)
             try:
-                await connection.send_text(message)
-            except:
-                self.disconnect(connection)
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка рассылки дельт WebSocket: {e!r}")
+
+    def flush(self):
+        """Рассылает накопленные за тик дельты: один кадр на клиента."""
+        changes = self.coalescer.drain(self.subscriptions.match)
+        if not changes:
+            return
+        frames: Dict[WebSocket, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        for topic, payload, clients in changes:
+            # Дельта сериализуется один раз, в кадры клиентов вклеивается готовой строкой
+            encoded = dumps(payload).decode()
+            for websocket in clients:
+                frames[websocket][topic].append(encoded)
+
+        for websocket, parts in frames.items():
+            client = self.active_connections.get(websocket)
+            if client is None:
+                continue
+            body = ",".join(f'"{topic}":[{",".join(items)}]' for topic, items in parts.items())
+            self._offer(websocket, client, f'{{"type":"delta",{body}}}')
+            self.delta_frames += 1
+
+    def stats(self) -> dict:
+        clients = list(self.active_connections.values())
+        return {
+            "clients": len(clients),
+            "queued": sum(client.queue.qsize() for client in clients),
+            "dropped": sum(client.dropped for client in clients),
+            "disconnected_slow": self.disconnected_slow,
+            "subscribed": len(self.subscriptions),
+            "delta_frames": self.delta_frames,
+        }
 
 # Глобальный экземпляр менеджера
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
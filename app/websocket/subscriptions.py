@@ -0,0 +1,217 @@
+"""
+Подписки WebSocket-клиентов на события и инциденты с фильтрами.
+
+Клиент отправляет:
+    {"action": "subscribe", "topics": ["events", "incidents"],
+     "filters": {"service": "voice", "location": "DC1", "host": "10.0.0.1", "status": true}}
+    {"action": "unsubscribe"}
+Значение фильтра может быть списком; отсутствующий фильтр - любое значение.
+Фильтры service и status к инцидентам не применяются.
+
+Обновления сопоставляются с подписками через индекс (поле -> значение -> клиенты),
+а не проверкой каждого клиента. Частые обновления одного объекта за тик
+склеиваются в одну дельту (только изменившиеся поля). Объект, который перестал
+подходить под фильтр клиента (например, решенное событие при status: true),
+приходит клиенту последний раз с "removed": true.
+"""
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Set, Tuple
+
+TOPIC_EVENTS = "events"
+TOPIC_INCIDENTS = "incidents"
+TOPICS = (TOPIC_EVENTS, TOPIC_INCIDENTS)
+
+FILTER_FIELDS = ("service", "location", "host", "status")
+# У инцидентов нет сервисов и статуса: эти фильтры к ним не применяются
+TOPIC_FIELDS = {
+    TOPIC_EVENTS: FILTER_FIELDS,
+    TOPIC_INCIDENTS: ("location", "host"),
+}
+
+# Поля, которые входят в каждую дельту: по ним клиент находит объект у себя
+KEY_FIELDS = {
+    TOPIC_EVENTS: ("id", "ip", "name"),
+    TOPIC_INCIDENTS: ("id", "host", "message"),
+}
+
+
+def _normalize(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def item_values(item: Dict[str, Any]) -> Dict[str, Set[Any]]:
+    """Значения полей фильтра у события или инцидента."""
+    hosts = {item.get("ip"), item.get("host"), item.get("hostname")}
+    values = {
+        "service": set(item.get("services") or []),
+        "location": {item.get("location")},
+        "host": hosts,
+        "status": {item.get("status")} if "status" in item else set(),
+    }
+    return {
+        field: {_normalize(value) for value in field_values if value is not None}
+        for field, field_values in values.items()
+    }
+
+
+def parse_filters(filters: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Фильтры из сообщения клиента. Бросает ValueError для неизвестных полей."""
+    parsed = {}
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter: {field}")
+        if value is None:
+            continue
+        values = value if isinstance(value, list) else [value]
+        parsed[field] = [_normalize(v) for v in values]
+    return parsed
+
+
+class SubscriptionIndex:
+    def __init__(self):
+        self._subscriptions: Dict[Hashable, Tuple[Tuple[str, ...], Dict[str, List[Any]]]] = {}
+        # тема -> поле -> значение -> клиенты
+        self._by_value = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+        # тема -> поле -> клиенты без фильтра по полю
+        self._any = defaultdict(lambda: defaultdict(set))
+
+    def __contains__(self, client: Hashable) -> bool:
+        return client in self._subscriptions
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, client: Hashable, topics: Iterable[str], filters: Dict[str, List[Any]]):
+        """Заменяет подписку клиента."""
+        topics = tuple(topic for topic in TOPICS if topic in set(topics))
+        self.unsubscribe(client)
+        self._subscriptions[client] = (topics, filters)
+        for topic in topics:
+            for field in TOPIC_FIELDS[topic]:
+                if field in filters:
+                    for value in filters[field]:
+                        self._by_value[topic][field][value].add(client)
+                else:
+                    self._any[topic][field].add(client)
+
+    def unsubscribe(self, client: Hashable):
+        subscription = self._subscriptions.pop(client, None)
+        if subscription is None:
+            return
+        topics, filters = subscription
+        for topic in topics:
+            for field in TOPIC_FIELDS[topic]:
+                if field in filters:
+                    for value in filters[field]:
+                        clients = self._by_value[topic][field][value]
+                        clients.discard(client)
+                        if not clients:
+                            del self._by_value[topic][field][value]
+                else:
+                    self._any[topic][field].discard(client)
+
+    def match(self, topic: str, item: Dict[str, Any]) -> Set[Hashable]:
+        """Клиенты, чьи фильтры подходят под объект: пересечение по всем полям фильтра."""
+        values = item_values(item)
+        result = None
+        for field in TOPIC_FIELDS[topic]:
+            by_value = self._by_value[topic][field]
+            matched = set(self._any[topic][field])
+            for value in values[field]:
+                matched |= by_value.get(value, set())
+            result = matched if result is None else result & matched
+            if not result:
+                return set()
+        return result
+
+
+class SentItem:
+    __slots__ = ("version", "item", "holders")
+
+    def __init__(self):
+        self.version = 0
+        # Последнее состояние объекта; None - еще не отправлялся
+        self.item = None
+        # Клиенты, которым объект отправлен, -> отправленная версия
+        self.holders: Dict[Hashable, int] = {}
+
+
+class DeltaCoalescer:
+    """
+    Копит обновления за тик (последнее состояние каждого объекта) и готовит
+    их рассылку. Для объекта помнит последнее состояние и какую версию
+    получил каждый клиент: клиент с предыдущей версией получает только
+    изменившиеся поля, остальные (новые подписчики, пропустившие обновления) -
+    объект целиком. Клиент, которому объект отправлялся, но чей фильтр
+    перестал подходить, получает последнее состояние с отметкой removed.
+    Помнится не больше snapshot_size объектов: про вытесненный объект
+    клиент получит его целиком, но без отметки removed.
+    """
+
+    def __init__(self, snapshot_size: int):
+        self.snapshot_size = snapshot_size
+        self._pending: Dict[str, Dict[Any, Dict[str, Any]]] = {topic: {} for topic in TOPICS}
+        self._sent: "OrderedDict[Tuple[str, Any], SentItem]" = OrderedDict()
+
+    def add(self, topic: str, item: Dict[str, Any]):
+        self._pending[topic][item.get("id")] = item
+
+    def forget(self, client: Hashable):
+        """Клиент отписался или отключился."""
+        for sent in self._sent.values():
+            sent.holders.pop(client, None)
+
+    def drain(
+        self,
+        match: Callable[[str, Dict[str, Any]], Set[Hashable]]
+    ) -> List[Tuple[str, Dict[str, Any], List[Hashable]]]:
+        """
+        Список (тема, содержимое, клиенты): одно содержимое для всех клиентов
+        группы. match - клиенты, чьи фильтры подходят под объект.
+        """
+        result = []
+        for topic, items in self._pending.items():
+            for item_id, item in items.items():
+                key = (topic, item_id)
+                sent = self._sent.get(key)
+                if sent is None:
+                    sent = self._sent[key] = SentItem()
+                self._sent.move_to_end(key)
+
+                previous = sent.item
+                delta = {
+                    field: value for field, value in item.items()
+                    if previous is None or previous.get(field) != value
+                }
+                if delta:
+                    for field in KEY_FIELDS[topic]:
+                        if field in item:
+                            delta[field] = item[field]
+
+                # (фильтр перестал подходить, у клиента предыдущая версия) -> клиенты
+                groups: Dict[Tuple[bool, bool], List[Hashable]] = defaultdict(list)
+                clients = match(topic, item)
+                for client in clients:
+                    groups[(False, sent.holders.get(client) == sent.version)].append(client)
+                for client, version in sent.holders.items():
+                    if client not in clients:
+                        groups[(True, version == sent.version)].append(client)
+
+                sent.version += 1
+                sent.item = item
+                sent.holders = {client: sent.version for client in clients}
+
+                for (removed, up_to_date), group in groups.items():
+                    payload = delta if up_to_date and previous is not None else item
+                    if removed:
+                        keys = {field: item[field] for field in KEY_FIELDS[topic] if field in item}
+                        payload = {**keys, **payload, "removed": True}
+                    elif not payload:
+                        # Клиент уже видел это состояние
+                        continue
+                    result.append((topic, payload, group))
+            items.clear()
+
+        while len(self._sent) > self.snapshot_size:
+            self._sent.popitem(last=False)
+        return result
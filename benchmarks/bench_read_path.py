@@ -0,0 +1,98 @@
+"""
+Сравнение обработки страницы списка: pydantic-модели + jsonable_encoder
+(прежний путь) и документы MongoDB + FastJSONResponse (быстрый путь).
+
+Запрос к базе не входит в замер - сравнивается только то, что делает
+приложение с уже прочитанными документами.
+    python -m benchmarks.bench_read_path --per-page 100 --rounds 2000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.models.events import Event
+from app.models.messages import Message
+from app.services import serialization
+from app.services.serialization import FastJSONResponse
+
+
+def make_events(count: int) -> list:
+    now = datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "ip": f"10.0.{i // 256}.{i % 256}",
+            "hostname": f"sw-{i}.example.net",
+            "role": "access",
+            "model": "C9300-48P",
+            "location": "DC1",
+            "services": ["core", "voice"],
+            "name": f"%LINK-3-UPDOWN: Interface Gi1/0/{i % 48} changed state to down",
+            "created_at": now - timedelta(days=1),
+            "updated_at": now - timedelta(seconds=i),
+            "status": True,
+            "count_message": i,
+        }
+        for i in range(count)
+    ]
+
+
+def make_messages(count: int) -> list:
+    now = datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "created_at": now - timedelta(seconds=i),
+            "updated_at": now - timedelta(seconds=i),
+            "text": f"%LINK-3-UPDOWN: Interface Gi1/0/{i % 48} changed state to down",
+            "event_id": ObjectId(),
+            "ip": f"10.0.{i // 256}.{i % 256}",
+            "services": ["core"],
+            "event_status": True,
+        }
+        for i in range(count)
+    ]
+
+
+def model_path(documents: list, model) -> bytes:
+    items = [model(**document) for document in documents]
+    # То же, что делает FastAPI для response_model=dict и JSONResponse
+    content = jsonable_encoder({"items": items, "total": len(items)})
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(documents: list, model) -> bytes:
+    # Документы копируются, как если бы их вернул курсор
+    items = [dict(document) for document in documents]
+    return FastJSONResponse({"items": items, "total": len(items)}).body
+
+
+def measure(func, documents: list, model, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(documents, model)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(per_page: int, rounds: int):
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"per_page={per_page} rounds={rounds} encoder={encoder}")
+    for name, documents, model in (
+        ("events", make_events(per_page), Event),
+        ("messages", make_messages(per_page), Message),
+    ):
+        slow = measure(model_path, documents, model, rounds)
+        fast = measure(fast_path, documents, model, rounds)
+        print(f"{name:<9} models: {slow:.3f} ms/page  fast: {fast:.3f} ms/page  x{slow / fast:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк быстрого пути чтения")
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.per_page, args.rounds)
@@ -0,0 +1,68 @@
+"""
+Правила разбора сообщений: один проход автомата Ахо-Корасик (выражения
+проверяются только при найденном якоре) против проверки каждого правила по очереди.
+
+Набор правил - message_rules.yaml плюс синтетические правила до --rules.
+    python -m benchmarks.bench_rule_engine --rules 500 --messages 20000
+"""
+import argparse
+import random
+import re
+import time
+
+import yaml
+
+from app.services.rule_engine import MessageRule, RuleSet, DEFAULT_SEVERITIES
+from benchmarks.bench_template_miner import make_stream
+
+
+def make_rules(count: int, path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        rules = [MessageRule(**rule) for rule in yaml.safe_load(f)["rules"]]
+    r = random.Random(1)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ_"
+    while len(rules) < count:
+        word = "".join(r.choice(letters) for _ in range(r.randint(6, 14)))
+        if len(rules) % 4:
+            rules.append(MessageRule(name=f"literal-{len(rules)}", literal=f"%{word}", tags=["synthetic"]))
+        else:
+            rules.append(MessageRule(name=f"regex-{len(rules)}", regex=rf"{word}-\d+: \S+ down", severity="minor"))
+    return rules
+
+
+def naive(rules: list, texts: list) -> float:
+    """Каждое правило - отдельное регулярное выражение, проверяются по очереди."""
+    patterns = [
+        re.compile(re.escape(rule.literal) if rule.literal else rule.regex, re.IGNORECASE if rule.ignore_case else 0)
+        for rule in rules
+    ]
+    started = time.perf_counter()
+    for text in texts:
+        [rule for rule, pattern in zip(rules, patterns) if pattern.search(text)]
+    return time.perf_counter() - started
+
+
+def one_pass(rules: list, texts: list) -> float:
+    rule_set = RuleSet(rules, DEFAULT_SEVERITIES)
+    started = time.perf_counter()
+    for text in texts:
+        rule_set.classify(text)
+    return time.perf_counter() - started
+
+
+def main(rule_count: int, messages: int, path: str):
+    rules = make_rules(rule_count, path)
+    texts = [text for _, text in make_stream(messages)]
+    print(f"правил: {len(rules)}, сообщений: {len(texts)}")
+    for name, run in (("по очереди", naive), ("один проход", one_pass)):
+        elapsed = run(rules, texts)
+        print(f"{name}: {len(texts) / elapsed:,.0f} сообщений/с, {elapsed / len(texts) * 1e6:.1f} мкс/сообщение")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк правил разбора сообщений")
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--file", default="message_rules.yaml")
+    args = parser.parse_args()
+    main(args.rules, args.messages, args.file)
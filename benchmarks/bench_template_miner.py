@@ -0,0 +1,58 @@
+"""
+Скорость определения шаблона события на синтетическом потоке syslog.
+
+Сравниваются холодный проход (все тексты разные, дерево строится) и
+повторные тексты (срабатывает кэш). Печатает число шаблонов: у потока
+из нескольких видов сообщений с разными счетчиками, адресами и
+интерфейсами оно должно оставаться маленьким.
+    python -m benchmarks.bench_template_miner --messages 200000
+"""
+import argparse
+import random
+import time
+
+from app.services.template_miner import TemplateMiner
+
+MODELS = ["C9300-48P", "MX204", "DCS-7050SX3"]
+
+SAMPLES = [
+    lambda r: f"%LINK-3-UPDOWN: Interface Gi1/0/{r.randint(1, 48)} changed state to {r.choice(['up', 'down'])}",
+    lambda r: f"%SW_MATM-4-MACFLAP_NOTIF: Host {r.randrange(16 ** 4):04x}.{r.randrange(16 ** 4):04x}.{r.randrange(16 ** 4):04x} "
+              f"in vlan {r.randint(1, 4094)} is flapping between port Te1/1/{r.randint(1, 4)} and port Te1/1/{r.randint(1, 4)}",
+    lambda r: f"%BGP-5-ADJCHANGE: neighbor 10.{r.randint(0, 255)}.{r.randint(0, 255)}.{r.randint(1, 254)} Down BGP Notification sent",
+    lambda r: f"SNMP_TRAP_LINK_DOWN: ifIndex {r.randint(500, 600)}, ifAdminStatus up(1), ifOperStatus down(2), ifName ge-0/0/{r.randint(0, 47)}",
+    lambda r: f"%SYS-5-CONFIG_I: Configured from console by admin{r.randint(1, 9)} on vty{r.randint(0, 4)} (10.0.0.{r.randint(1, 254)})",
+    lambda r: f"Temperature sensor {r.randint(1, 8)} reading {r.uniform(30, 90):.1f}C exceeds threshold at 2024-01-{r.randint(10, 28)} 12:{r.randint(10, 59)}:00",
+]
+
+
+def make_stream(count: int, seed: int = 1) -> list:
+    r = random.Random(seed)
+    return [(r.choice(MODELS), r.choice(SAMPLES)(r)) for _ in range(count)]
+
+
+def run(miner: TemplateMiner, stream: list) -> float:
+    started = time.perf_counter()
+    for model, text in stream:
+        miner.identify(model, text)
+    return time.perf_counter() - started
+
+
+def main(messages: int):
+    stream = make_stream(messages)
+    miner = TemplateMiner(lambda: None, depth=4, similarity=0.5, max_children=100, cache_size=50000)
+
+    cold = run(miner, stream)
+    print(f"холодный проход: {messages / cold:,.0f} сообщений/с, шаблонов: {len(miner)}")
+
+    # Повторяющиеся тексты (типичный шторм одинаковых сообщений) берутся из кэша
+    repeated = stream[:1000] * (messages // 1000)
+    warm = run(miner, repeated)
+    print(f"повторные тексты: {len(repeated) / warm:,.0f} сообщений/с, шаблонов: {len(miner)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк шаблонов событий")
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.messages)
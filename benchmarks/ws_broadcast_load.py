@@ -0,0 +1,85 @@
+"""
+Нагрузочный тест рассылки WebSocket на сотнях имитированных клиентов.
+
+Клиенты - заглушки с задержкой отправки; часть из них медленные.
+Измеряется время вызова broadcast и задержка доставки быстрым клиентам,
+а также сколько сообщений вытеснено у медленных.
+    python -m benchmarks.ws_broadcast_load --clients 500 --slow 25 --messages 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.config import settings
+from app.websocket.manager import ConnectionManager
+
+
+class SimulatedClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.latencies = []
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        sent_at = float(message[message.index('"sent_at":') + 10:message.index("}")])
+        self.latencies.append(time.perf_counter() - sent_at)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(clients: int, slow: int, messages: int, interval: float, slow_delay: float, policy: str):
+    settings.WS_SLOW_CLIENT_POLICY = policy
+    manager = ConnectionManager()
+    fast_clients = [SimulatedClient(0) for _ in range(clients - slow)]
+    slow_clients = [SimulatedClient(slow_delay) for _ in range(slow)]
+    for client in fast_clients + slow_clients:
+        await manager.connect(client)
+
+    broadcast_times = []
+    for i in range(messages):
+        start = time.perf_counter()
+        await manager.broadcast({"type": "incident_update", "seq": i, "sent_at": time.perf_counter()})
+        broadcast_times.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    # Даем быстрым клиентам дочитать очередь
+    await asyncio.sleep(0.5)
+
+    fast_latencies = [latency for client in fast_clients for latency in client.latencies]
+    stats = manager.stats()
+    print(f"clients={clients} slow={slow} messages={messages} policy={policy}")
+    print(f"broadcast call: p50={percentile(broadcast_times, 0.5) * 1000:.2f} ms  "
+          f"p99={percentile(broadcast_times, 0.99) * 1000:.2f} ms")
+    print(f"fast clients delivery: p50={percentile(fast_latencies, 0.5) * 1000:.2f} ms  "
+          f"p99={percentile(fast_latencies, 0.99) * 1000:.2f} ms  "
+          f"delivered={sum(c.received for c in fast_clients)}/{len(fast_clients) * messages}")
+    print(f"slow clients received (mean): {statistics.mean([c.received for c in slow_clients]) if slow_clients else 0:.1f}")
+    print(f"manager: {stats}")
+
+    for client in list(manager.active_connections):
+        manager.disconnect(client)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест рассылки WebSocket")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=25, help="сколько клиентов медленные")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005, help="пауза между рассылками, секунды")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="время отправки медленному клиенту, секунды")
+    parser.add_argument("--policy", default=settings.WS_SLOW_CLIENT_POLICY, choices=["drop_oldest", "disconnect"])
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.slow, args.messages, args.interval, args.slow_delay, args.policy))
@@ -0,0 +1,75 @@
+import re
+from typing import List, Tuple
+
+import pytest
+
+from app.services.rule_engine import DEFAULT_SEVERITIES, MessageRule, RuleSet, regex_anchor
+
+
+class NaiveRuleSet(RuleSet):
+    """Каждое правило проверяется отдельно по всему тексту."""
+
+    def _matches(self, text: str) -> List[Tuple[int, int, int]]:
+        matches = []
+        for index, rule in enumerate(self.rules):
+            if rule.literal is not None:
+                pattern = re.compile(f"(?=({re.escape(rule.literal)}))", re.IGNORECASE if rule.ignore_case else 0)
+                spans = [(match.start(1), match.end(1)) for match in pattern.finditer(text)]
+                spans = [span for span in spans if not self._word_rejected(rule, text, *span)]
+            else:
+                pattern = re.compile(rule.regex, re.IGNORECASE if rule.ignore_case else 0)
+                spans = [match.span() for match in pattern.finditer(text)]
+            matches.extend((index, start, end) for start, end in spans)
+        return matches
+
+
+OVERLAPPING_RULES = [
+    MessageRule(name="a", regex=r"\d+ ?x", tags=["x"]),
+    MessageRule(name="b", regex=r"\d+", status="closed"),
+    MessageRule(name="c", regex=r"[0-9]y", severity="major", tags=["y"]),
+    MessageRule(name="d", regex=r"(?i)link\s+down", severity="minor", tags=["link"]),
+    MessageRule(name="e", regex=r"(?x) fan \s fail", tags=["fan"]),
+    MessageRule(name="f", regex=r"link down on (\S+)", tags=["interface"]),
+    MessageRule(name="solved", literal="SOLVED", status="closed", strip=True),
+    MessageRule(name="down", literal="down", word=True, tags=["down"]),
+    MessageRule(name="own", literal="own", ignore_case=True, tags=["own"]),
+]
+
+TEXTS = [
+    "12 x",
+    "9y",
+    "LINK  down on Gi1/0/1 SOLVED",
+    "fan fail 3x 4y",
+    "İ SOLVED link down on Gi1/0/1",
+    "lowdown OWN",
+    "nothing here",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_matches_naive_matcher(text):
+    rules = RuleSet(OVERLAPPING_RULES, DEFAULT_SEVERITIES)
+    naive = NaiveRuleSet(OVERLAPPING_RULES, DEFAULT_SEVERITIES)
+    assert rules.classify(text) == naive.classify(text)
+
+
+def test_overlapping_rules_all_fire():
+    rules = RuleSet(OVERLAPPING_RULES, DEFAULT_SEVERITIES)
+    result = rules.classify("12 x")
+    assert result.status is False
+    assert result.tags == ["x"]
+    assert rules.classify("9y").severity == "major"
+
+
+def test_strip_after_length_changing_lowercase():
+    rules = RuleSet(OVERLAPPING_RULES, DEFAULT_SEVERITIES)
+    assert rules.classify("İ SOLVED link down on Gi1/0/1").text == "İ link down on Gi1/0/1"
+
+
+@pytest.mark.parametrize("pattern", [r"\x41BCDEF", r"\101BCDEF", r"\N{DIGIT ONE}BCDEF", r"(?x) link \s down", r"(?i)link down"])
+def test_code_escapes_and_inline_flags_are_unanchored(pattern):
+    assert regex_anchor(pattern) is None
+
+
+def test_anchor_of_plain_pattern():
+    assert regex_anchor(r"%LINK-\d-UPDOWN") == "-UPDOWN"
@@ -0,0 +1,38 @@
+import pytest
+
+from app.services.template_miner import TemplateMiner, mask
+
+
+@pytest.fixture
+def miner():
+    # Дерево работает в памяти: коллекция нужна только для load/flush
+    return TemplateMiner(lambda: None, depth=4, similarity=0.7, max_children=100, cache_size=1000)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("BGP neighbor 10.0.0.1 Down", "BGP neighbor 10.0.0.1 Up"),
+    ("Power supply 2 failed", "Power supply 2 restored"),
+    ("Fan tray removed", "Fan tray inserted"),
+    ("Interface Gi1/0/1 changed state to down", "Interface Gi1/0/1 changed state to up"),
+])
+def test_opposite_states_get_separate_templates(miner, first, second):
+    assert miner.identify("C9300", first).id != miner.identify("C9300", second).id
+
+
+def test_variable_parts_share_template(miner):
+    first = miner.identify("C9300", "BGP neighbor 10.0.0.1 Down")
+    second = miner.identify("C9300", "BGP neighbor 10.0.0.2 Down")
+    assert first is second
+    assert first.name == "BGP neighbor <*> Down"
+
+
+def test_long_messages_generalize_words(miner):
+    first = miner.identify("C9300", "Login failed for user alice from console line 0 via ssh")
+    second = miner.identify("C9300", "Login failed for user bob from console line 0 via ssh")
+    assert first is second
+    assert first.template == "Login failed for user <*> from console line <*> via ssh"
+
+
+@pytest.mark.parametrize("token", ["aa:bb:cc:dd:ee:ff", "de-ad-be-ef-ca-fe", "dead.beef.cafe", "0xdeadbeef"])
+def test_mask_letter_only_addresses(token):
+    assert mask(f"host {token} moved") == ["host", "<*>", "moved"]